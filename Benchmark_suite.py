@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark harness for the EnergyHubRetrofit model
+
+Every case of a grid of instance sizes is generated with Instance_generator and
+run in its own process. The harness measures
+    * build_time: create_model wall time
+    * lp_write_time: time to write the model as an LP file
+    * solve_time: solver wall time (only if a solver is given)
+    * extract_time: Output_functions.get_all_vars wall time
+    * peak_rss_mb: peak resident memory of the case process
+The results are stored as JSON and compared against a baseline JSON file,
+flagging every metric that regressed by more than the given threshold.
+
+Command line example:
+    python Benchmark_suite.py --locations 2 4 --days 2 7 --out bench.json --baseline bench_old.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+
+METRICS = ["build_time", "lp_write_time", "solve_time", "extract_time", "peak_rss_mb"]
+CASE_KEYS = ["n_locations", "n_days", "n_hours", "n_years", "n_stages",
+             "n_dispatchable", "n_solar", "n_storage", "seed", "topology", "n_neighbours", "location_demand"]
+# generate_instance defaults of case keys that older result files do not record
+CASE_DEFAULTS = {"location_demand": False}
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB (None if it cannot be determined)"""
+
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kB on Linux, bytes on macOS
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset / 1024 ** 2
+
+
+def run_case(case, solver=None, model_options=None):
+    """
+    Generate, build, write, (solve) and extract a single instance and return its timings
+
+    Inputs to the function:
+    -----------------------
+        * case: dictionary of Instance_generator.generate_instance arguments
+        * solver (optional): name of the pyomo solver used to solve the cost minimization problem
+        * model_options (optional): dictionary of extra EnergyHubRetrofit arguments
+    """
+
+    import pyomo.environ as pe
+    import EnergyHubRetrofit_Paper as ehr
+    import Instance_generator as ig
+    import Output_functions as of
+
+    res = dict(case)
+    inp = ig.generate_instance(**case)
+
+    start = time.perf_counter()
+    mod = ehr.EnergyHubRetrofit(inp, invStage=0, optim_mode=1, **(model_options or {}))
+    mod.create_model()
+    mod.m.Carbon_obj.deactivate()
+    res["build_time"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        mod.m.write(os.path.join(folder, "model.lp"), io_options={"symbolic_solver_labels": False})
+        res["lp_write_time"] = time.perf_counter() - start
+
+    res["solve_time"] = None
+    res["termination_condition"] = None
+    if solver is not None:
+        optimizer = pe.SolverFactory(solver)
+        start = time.perf_counter()
+        results = optimizer.solve(mod.m, load_solutions=False)
+        res["solve_time"] = time.perf_counter() - start
+        condition = results.solver.termination_condition
+        res["termination_condition"] = str(condition)
+        if condition not in (pe.TerminationCondition.optimal, pe.TerminationCondition.maxTimeLimit):
+            # The timings of an unsolved instance are not comparable
+            res["error"] = "termination condition " + str(condition)
+            return res
+        if len(results.solution) > 0:
+            mod.m.solutions.load_from(results)
+
+    start = time.perf_counter()
+    of.get_all_vars(mod.m)
+    res["extract_time"] = time.perf_counter() - start
+
+    res["num_variables"] = sum(len(v) for v in mod.m.component_objects(pe.Var, active=True))
+    res["num_constraints"] = sum(len(c) for c in mod.m.component_objects(pe.Constraint, active=True))
+    res["peak_rss_mb"] = peak_rss_mb()
+    return res
+
+
+def _run_case_queue(queue, case, solver, model_options):
+    try:
+        queue.put(run_case(case, solver, model_options))
+    except Exception as err:
+        queue.put(dict(case, error=repr(err)))
+
+
+def _wait_result(queue, proc, case, poll=1.0):
+    # Result of a case process; an error entry if the process dies without posting one (OOM kill, solver crash)
+    import queue as queue_module
+
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except queue_module.Empty:
+            if not proc.is_alive():
+                # The result may have been posted just before the process exited
+                try:
+                    return queue.get(timeout=poll)
+                except queue_module.Empty:
+                    return dict(case, error="exit code " + str(proc.exitcode))
+
+
+def run_grid(grid, solver=None, model_options=None, isolate=True):
+    """
+    Run all cases of a grid of instance sizes
+
+    Inputs to the function:
+    -----------------------
+        * grid: dictionary of generate_instance argument -> list of values, e.g. {"n_locations": [2, 4], "n_days": [2, 7]}
+        * solver, model_options: see run_case
+        * isolate (default = True): run every case in a fresh process so that peak memory is measured per case
+    """
+
+    keys = list(grid)
+    cases = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    results = []
+    for case in cases:
+        print("Benchmark case", case)
+        if isolate:
+            ctx = multiprocessing.get_context("spawn")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_case_queue, args=(queue, case, solver, model_options))
+            proc.start()
+            res = _wait_result(queue, proc, case)
+            proc.join()
+        else:
+            res = run_case(case, solver, model_options)
+        print("   ", {k: res.get(k) for k in METRICS + ["error"] if k in res})
+        results.append(res)
+    return results
+
+
+def _case_key(res):
+    return tuple((k, res.get(k, CASE_DEFAULTS.get(k))) for k in CASE_KEYS if k in res or k in CASE_DEFAULTS)
+
+
+def compare(results, baseline, threshold=0.2, min_seconds=0.5):
+    """
+    Flag regressions against a baseline
+
+    A metric regresses if it exceeds the baseline value of the same case by more than threshold
+    (relative). Timings below min_seconds in both runs are ignored as noise, and so are the cases
+    that failed or were not solved (error entry) in either run.
+    Returns a list of dictionaries (case, metric, baseline, value, ratio).
+    """
+
+    base = {_case_key(r): r for r in baseline}
+    flags = []
+    for res in results:
+        ref = base.get(_case_key(res))
+        if ref is None or "error" in res or "error" in ref:
+            continue
+        for metric in METRICS:
+            new, old = res.get(metric), ref.get(metric)
+            if new is None or old is None or old <= 0:
+                continue
+            if metric.endswith("_time") and max(new, old) < min_seconds:
+                continue
+            ratio = new / old
+            if ratio > 1 + threshold:
+                flags.append({"case": dict(_case_key(res)), "metric": metric,
+                              "baseline": old, "value": new, "ratio": ratio})
+    return flags
+
+
+def save_results(results, filename):
+    with open(filename, "w") as file:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, file, indent=4)
+
+
+def load_results(filename):
+    with open(filename) as file:
+        return json.load(file)["results"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EnergyHubRetrofit model on synthetic instances")
+    parser.add_argument("--locations", type=int, nargs="+", default=[2])
+    parser.add_argument("--days", type=int, nargs="+", default=[2])
+    parser.add_argument("--hours", type=int, nargs="+", default=[24])
+    parser.add_argument("--years", type=int, nargs="+", default=[4])
+    parser.add_argument("--stages", type=int, nargs="+", default=[2])
+    parser.add_argument("--dispatchable", type=int, nargs="+", default=[6])
+    parser.add_argument("--solar", type=int, nargs="+", default=[2])
+    parser.add_argument("--storage", type=int, nargs="+", default=[2])
+    parser.add_argument("--seed", type=int, nargs="+", default=[0])
+    parser.add_argument("--topology", nargs="+", default=[None],
+                        help="candidate network graph: complete, knn or delaunay (all Loc_xy pairs if omitted)")
+    parser.add_argument("--neighbours", type=int, nargs="+", default=[3], help="neighbours of the knn topology")
+    parser.add_argument("--location-demand", action="store_true", help="location-resolved demand profiles")
+    parser.add_argument("--solver", default=None, help="pyomo solver name (no solve if omitted)")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative regression threshold")
+    args = parser.parse_args(argv)
+
+    grid = {
+        "n_locations": args.locations, "n_days": args.days, "n_hours": args.hours,
+        "n_years": args.years, "n_stages": args.stages, "n_dispatchable": args.dispatchable,
+        "n_solar": args.solar, "n_storage": args.storage, "seed": args.seed,
+        "topology": args.topology, "n_neighbours": args.neighbours, "location_demand": [args.location_demand],
+    }
+    results = run_grid(grid, solver=args.solver)
+    save_results(results, args.out)
+    print("Benchmark results saved to", args.out)
+    failed = [res for res in results if "error" in res]
+    for res in failed:
+        print("FAILED {}: {}".format(dict(_case_key(res)), res["error"]))
+
+    if args.baseline is not None:
+        flags = compare(results, load_results(args.baseline), args.threshold)
+        for flag in flags:
+            print("REGRESSION {metric}: {value:.3f} vs {baseline:.3f} (x{ratio:.2f}) for {case}".format(**flag))
+        if flags:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Lagrangian/ADMM decomposition of the energy hub model across locations
+
+With a candidate network graph (Network_arcs input, see Network_topology), the
+locations of EnergyHubRetrofit only interact through the exchange flows
+P_exchange of their incident arcs: all cost and carbon terms are sums over
+Energy_system_location. solve_decomposed splits the model into one subproblem
+per location. The subproblem of location l keeps its own copy of the flows and
+network variables of its incident arcs, and the coupling "flow sent on an arc ==
+flow received on the arc" is relaxed with multipliers (exchange prices):
+
+    * the sender of an arc pays price * P_exchange, the receiver earns it (weighted like the import costs,
+      by the number of days and the operating discount factor, so that prices compare to Import_prices)
+    * rho = 0: subgradient updates of the prices, the sum of the subproblem objectives is a lower bound (Lagrangian dual)
+    * rho > 0: ADMM, the subproblems also get the penalty rho / 2 * (P_exchange - consensus flow) ** 2 (needs an MIQP solver)
+
+The subproblems are built once in persistent worker processes (one group of
+locations per worker); only the mutable price/consensus parameters change
+between iterations. After the last iteration, the primal recovery step
+(recover_primal) fixes the binary design decisions of the subproblems in the
+full model and solves it, which returns a feasible design of the full model:
+
+    mod.create_model()
+    res = mod.solve_decomposed(solver="gurobi", max_iter=30)
+"""
+
+import os
+import time
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+
+DESIGN_VARIABLES = ("y_conv", "y_stor", "y_net")
+
+
+def split_inputs(inp):
+    """Input dictionary of every location subproblem: dictionary location -> input dictionary"""
+
+    import Input_functions as inf
+
+    if "Network_arcs" not in inp:
+        raise ValueError(
+            "The decomposition needs a candidate network graph (Network_arcs input, see Network_topology.network_inputs)"
+        )
+    demand = inf.demand_array(inp)
+    axis = demand.axis("l")
+    carriers = demand.labels[demand.axis("ecd")]
+    res = dict()
+    for k, l in enumerate(inp["Energy_system_location"]):
+        sub = dict(inp)
+        sub["Energy_system_location"] = [l]
+        arcs = [a for a, nodes in inp["Network_arcs"].items() if l in nodes]
+        sub["combineLocations"] = arcs
+        sub["Network_arcs"] = {a: inp["Network_arcs"][a] for a in arcs}
+        sub["Distance_area"] = {a: inp["Distance_area"][a] for a in arcs}
+        labels = list(demand.labels)
+        labels[axis] = [l]
+        sub["Energy_demand"] = inf.LabeledArray(
+            np.take(demand.values, [k], axis=axis), labels, demand.axes
+        )
+        sub["P_solar"] = {key: v for key, v in inp["P_solar"].items() if key[0] == l}
+        sub["Floor_area"] = {l: inp["Floor_area"][l]}
+        if isinstance(inp["Roof_area"], dict):
+            sub["Roof_area"] = {l: inp["Roof_area"][l]}
+        if "Location_coordinates" in inp:
+            sub["Location_coordinates"] = {l: inp["Location_coordinates"][l]}
+        # The flow of an arc never needs to exceed the demand of its end location: without this bound, the copy
+        # of the flows in a subproblem receives energy for free (up to BigM) at every nonnegative price
+        sub["Exchange_flow_bounds"] = {
+            k: float(demand[k[0], inp["Network_arcs"][k[1]][1], k[2], k[3], k[4]])
+            for k in exchange_keys(sub) if k[0] in carriers
+        }
+        res[l] = sub
+    return res
+
+
+def exchange_keys(inp, arcs=None):
+    """Index (ecx, arc, y, d, t) of the coupling exchange flows, in a fixed order"""
+
+    arcs = inp["combineLocations"] if arcs is None else arcs
+    return [
+        (ecx, a, y, d, t)
+        for ecx in inp["Energy_carriers_exc"]
+        for a in arcs
+        for y in inp["Calendar_years"]
+        for d in inp["Days"]
+        for t in inp["Time_steps"]
+    ]
+
+
+def exchange_weights(inp, keys):
+    """
+    Weight of every coupling key (ecx, arc, y, d, t): number of days of d times the operating discount factor of y,
+    so that the exchange prices are per unit of energy, like Import_prices
+    """
+
+    import Model_coefficients as mc
+
+    discount = mc.as_dicts(mc.model_coefficients(inp))["Operating_discount"]
+    return np.array([inp["Number_of_days"][k[3]] * discount[k[2]] for k in keys], dtype=float)
+
+
+def build_subproblem(sub_inp, location, rho=0.0):
+    """
+    Build the model of one location with the exchange prices/consensus flows as mutable parameters
+    (the flows of its arcs are bounded by the Exchange_flow_bounds of split_inputs)
+
+    Returns the EnergyHubRetrofit instance, the coupling keys and the sign of every key (+1: sender, -1: receiver).
+    """
+
+    import EnergyHubRetrofit_Paper as ehr
+
+    mod = ehr.EnergyHubRetrofit(sub_inp, invStage=0, optim_mode=1)
+    mod.create_model()
+    m = mod.m
+    keys = exchange_keys(sub_inp)
+    signs = np.array([1.0 if sub_inp["Network_arcs"][k[1]][0] == location else -1.0 for k in keys])
+    sign = dict(zip(keys, (signs * exchange_weights(sub_inp, keys)).tolist()))
+
+    m.Exchange_keys = pe.Set(initialize=keys, dimen=5, doc="Coupling exchange flows of the location")
+    m.Exchange_price = pe.Param(m.Exchange_keys, initialize=0.0, mutable=True,
+                                doc="Multiplier (price) of the exchange flow coupling")
+    m.Exchange_target = pe.Param(m.Exchange_keys, initialize=0.0, mutable=True,
+                                 doc="Consensus exchange flow (ADMM)")
+    m.Exchange_rho = pe.Param(initialize=rho, mutable=True, doc="ADMM penalty parameter")
+    for k, bound in sub_inp.get("Exchange_flow_bounds", {}).items():
+        ub = m.P_exchange[k].ub
+        m.P_exchange[k].setub(bound if ub is None else min(ub, bound))
+
+    def Decomposition_obj_rule(m):
+        expr = m.Total_cost + sum(sign[k] * m.Exchange_price[k] * m.P_exchange[k] for k in m.Exchange_keys)
+        if rho > 0:
+            expr += m.Exchange_rho / 2 * sum(
+                (m.P_exchange[k] - m.Exchange_target[k]) ** 2 for k in m.Exchange_keys
+            )
+        return expr
+
+    m.Cost_obj.deactivate()
+    m.Carbon_obj.deactivate()
+    m.Decomposition_obj = pe.Objective(rule=Decomposition_obj_rule, sense=pe.minimize)
+    return mod, keys, signs
+
+
+def _values(var):
+    return {k: (v.value if v.value is not None else 0.0) for k, v in var.items()}
+
+
+def _solve_subproblem(sub, optimizer, prices, targets):
+    mod, keys, _ = sub
+    m = mod.m
+    for k, price, target in zip(keys, prices.tolist(), targets.tolist()):
+        m.Exchange_price[k] = price
+        m.Exchange_target[k] = target
+    start = time.perf_counter()
+    results = optimizer.solve(m)
+    condition = results.solver.termination_condition
+    if condition not in (pe.TerminationCondition.optimal, pe.TerminationCondition.maxTimeLimit):
+        raise RuntimeError("Subproblem of location " + str(m.Energy_system_location.at(1))
+                           + " not solved: " + str(condition))
+    return {
+        "objective": pe.value(m.Decomposition_obj),
+        "cost": pe.value(m.Total_cost),
+        "carbon": pe.value(m.Total_carbon),
+        "flows": np.array([m.P_exchange[k].value or 0.0 for k in keys]),
+        "design": {name: _values(getattr(m, name)) for name in DESIGN_VARIABLES},
+        "time": time.perf_counter() - start,
+    }
+
+
+def _make_optimizer(solver, solver_options):
+    optimizer = pe.SolverFactory(solver)
+    for key, value in (solver_options or {}).items():
+        optimizer.options[key] = value
+    return optimizer
+
+
+def _worker(conn, sub_inputs, rho, solver, solver_options):
+    # Persistent worker: builds its subproblems once and solves them for every set of prices it receives
+    try:
+        subs = {l: build_subproblem(sub_inp, l, rho) for l, sub_inp in sub_inputs.items()}
+        optimizer = _make_optimizer(solver, solver_options)
+        conn.send(("ready", {l: sub[1] for l, sub in subs.items()}))
+        while True:
+            message, data = conn.recv()
+            if message == "stop":
+                break
+            conn.send(("result", {
+                l: _solve_subproblem(subs[l], optimizer, prices, targets) for l, (prices, targets) in data.items()
+            }))
+    except Exception as err:
+        conn.send(("error", repr(err)))
+    finally:
+        conn.close()
+
+
+class _InProcess:
+    """Serial stand-in for the worker processes (n_workers = 0)"""
+
+    def __init__(self, sub_inputs, rho, solver, solver_options):
+        self.subs = {l: build_subproblem(sub_inp, l, rho) for l, sub_inp in sub_inputs.items()}
+        self.optimizer = _make_optimizer(solver, solver_options)
+
+    def keys(self):
+        return {l: sub[1] for l, sub in self.subs.items()}
+
+    def solve(self, data):
+        return {l: _solve_subproblem(self.subs[l], self.optimizer, *data[l]) for l in data}
+
+    def stop(self):
+        pass
+
+
+class _Workers:
+    """Worker processes (spawned, so that no solver state is inherited), each holding the subproblems of a group of locations"""
+
+    def __init__(self, sub_inputs, rho, solver, solver_options, n_workers):
+        ctx = multiprocessing.get_context("spawn")
+        locations = list(sub_inputs)
+        groups = [locations[k::n_workers] for k in range(n_workers)]
+        self.groups, self.conns, self.procs = [], [], []
+        for group in groups:
+            if not group:
+                continue
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, args=(child, {l: sub_inputs[l] for l in group},
+                                                     rho, solver, solver_options), daemon=True)
+            proc.start()
+            child.close()
+            self.groups.append(group)
+            self.conns.append(parent)
+            self.procs.append(proc)
+        self._keys = dict()
+        for conn in self.conns:
+            self._keys.update(self._receive(conn))
+
+    @staticmethod
+    def _receive(conn):
+        message, data = conn.recv()
+        if message == "error":
+            raise RuntimeError("Decomposition worker failed: " + data)
+        return data
+
+    def keys(self):
+        return self._keys
+
+    def solve(self, data):
+        for group, conn in zip(self.groups, self.conns):
+            conn.send(("solve", {l: data[l] for l in group}))
+        res = dict()
+        for conn in self.conns:
+            res.update(self._receive(conn))
+        return res
+
+    def stop(self):
+        for conn, proc in zip(self.conns, self.procs):
+            try:
+                conn.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+
+
+def _merge_design(results):
+    # Binary design of all subproblems; network binaries exist in both end locations, an arc is built if either builds it
+    design = {name: dict() for name in DESIGN_VARIABLES}
+    for res in results.values():
+        for name, values in res["design"].items():
+            for k, v in values.items():
+                design[name][k] = max(design[name].get(k, 0.0), v)
+    return design
+
+
+def solve_decomposed(inp, solver="gurobi", solver_options=None, rho=0.0, step=1.0, max_iter=50, tol=1e-3,
+                     n_workers=None, verbose=True, upper_bound=None, model=None, patience=3):
+    """
+    Solve the cost minimisation problem by decomposition across locations
+
+    Inputs to the function:
+    -----------------------
+        * inp: input dictionary with a Network_arcs graph (see Network_topology)
+        * solver (default = "gurobi"): pyomo solver used for the subproblems
+        * solver_options (optional): dictionary of solver options, e.g. {"MIPGap": 0.001, "Threads": 1}
+        * rho (default = 0.0): ADMM penalty parameter, 0 for subgradient updates of the prices
+        * step (default = 1.0): factor of the subgradient step, only used if rho is 0. With an upper bound, Polyak step
+          step * (upper_bound - lower bound) / |residual| ** 2 along the residual; without, the largest price change
+          is step * price scale / sqrt(iteration). Price changes never exceed the price scale (largest import price)
+        * max_iter (default = 50): maximum number of price updates
+        * tol (default = 1e-3): consensus tolerance on the largest flow mismatch, relative to the largest flow (at least 1)
+        * n_workers (optional): number of worker processes (default: one per location up to the number of cores), 0 to solve in this process
+        * upper_bound (optional): cost of a feasible solution, the target of the Polyak step. If None (and rho is 0),
+          the cost of the primal recovery of the first iteration's design is used
+        * model (optional): full pyomo model for that primal recovery (EnergyHubRetrofit.m), built from inp if None
+        * patience (default = 3): stop when the largest residual has grown above its best value for that many
+          consecutive iterations (diverging prices)
+
+    Returns a dictionary with
+        * history: data frame with the objective, lower bound (subgradient only), residual and time of every iteration
+        * prices: exchange prices indexed by (ecx, arc, y, d, t)
+        * flows: sent and received flows of the last iteration
+        * design: binary design decisions of the iteration with the smallest residual (for recover_primal)
+        * best_iteration: iteration of that design
+        * lower_bound: best lower bound of all iterations (subgradient only)
+        * upper_bound: target of the Polyak step (subgradient only, None if the primal recovery failed)
+        * converged: whether the consensus tolerance was reached
+        * status: "converged", "diverged" (residual growing, see patience) or "max_iter"
+    """
+
+    sub_inputs = split_inputs(inp)
+    locations = list(sub_inputs)
+    keys = exchange_keys(inp)
+    position = {k: n for n, k in enumerate(keys)}
+    sender = np.array([locations.index(inp["Network_arcs"][k[1]][0]) for k in keys], dtype=int)
+    weights = exchange_weights(inp, keys)
+
+    if n_workers is None:
+        n_workers = min(len(locations), os.cpu_count() or 1)
+    if n_workers == 0:
+        workers = _InProcess(sub_inputs, rho, solver, solver_options)
+    else:
+        workers = _Workers(sub_inputs, rho, solver, solver_options, min(n_workers, len(locations)))
+
+    try:
+        sub_keys = workers.keys()
+        index = {l: np.array([position[k] for k in sub_keys[l]], dtype=int) for l in locations}
+        prices = np.zeros(len(keys))
+        targets = np.zeros(len(keys))
+        price_scale = max([abs(float(v)) for v in inp["Import_prices"].values()] or [1.0])
+        history = []
+        status = "max_iter"
+        best_residual, best_iteration, design, growing = np.inf, None, None, 0
+        for it in range(1, max_iter + 1):
+            start = time.perf_counter()
+            results = workers.solve({l: (prices[index[l]], targets[index[l]]) for l in locations})
+
+            sent, received = np.zeros(len(keys)), np.zeros(len(keys))
+            for n, l in enumerate(locations):
+                flows = results[l]["flows"]
+                is_sender = sender[index[l]] == n
+                sent[index[l][is_sender]] = flows[is_sender]
+                received[index[l][~is_sender]] = flows[~is_sender]
+            residual = sent - received
+            scale = max(1.0, float(np.max(np.abs(sent), initial=0.0)), float(np.max(np.abs(received), initial=0.0)))
+            max_residual = float(np.max(np.abs(residual), initial=0.0))
+            history.append({
+                "iteration": it,
+                "cost": sum(r["cost"] for r in results.values()),
+                "lower_bound": sum(r["objective"] for r in results.values()) if rho == 0 else np.nan,
+                "max_residual": max_residual,
+                "time": time.perf_counter() - start,
+                "subproblem_time": max(r["time"] for r in results.values()),
+            })
+            if verbose:
+                print("Decomposition iteration {iteration}: cost {cost:.2f}, max residual {max_residual:.4g}".format(
+                    **history[-1]))
+            # Design of the most consistent iteration (smallest residual, the latest of equal ones)
+            growing = growing + 1 if max_residual > best_residual else 0
+            if max_residual <= best_residual:
+                best_residual, best_iteration, design = max_residual, it, _merge_design(results)
+            if max_residual <= tol * scale:
+                status = "converged"
+                break
+            if growing >= patience:
+                status = "diverged"
+                break
+            if rho > 0:
+                targets = (sent + received) / 2
+                prices = prices + rho * (sent - targets)
+                continue
+            if it == 1 and upper_bound is None:
+                upper_bound = _recovered_cost(inp, model, _merge_design(results), solver, solver_options)
+            lower_bound = history[-1]["lower_bound"]
+            if upper_bound is not None and upper_bound > lower_bound:
+                # Polyak step towards the upper bound
+                gradient = weights * residual
+                change = step * (upper_bound - lower_bound) / float(gradient @ gradient) * gradient
+            else:
+                # Normalised subgradient step: the largest price change is step * price scale / sqrt(iteration)
+                change = step * price_scale / np.sqrt(it) * residual / max_residual
+            largest = float(np.max(np.abs(change)))
+            prices = prices + (change * price_scale / largest if largest > price_scale else change)
+    finally:
+        workers.stop()
+
+    if verbose and status != "converged":
+        print("Warning: the decomposition did not converge ({}), largest residual {:.4g}".format(
+            status, history[-1]["max_residual"]))
+
+    history = pd.DataFrame(history)
+    index = pd.MultiIndex.from_tuples(keys, names=["ecx", "arc", "y", "d", "t"])
+    return {
+        "history": history,
+        "prices": pd.Series(prices, index=index, name="price"),
+        "flows": pd.DataFrame({"sent": sent, "received": received}, index=index),
+        "design": design,
+        "best_iteration": best_iteration,
+        "lower_bound": float(history["lower_bound"].max()),
+        "upper_bound": upper_bound,
+        "converged": status == "converged",
+        "status": status,
+    }
+
+
+def _recovered_cost(inp, m, design, solver, solver_options):
+    # Cost of the primal recovery of a design (None if it is not solved to optimality)
+    if m is None:
+        import EnergyHubRetrofit_Paper as ehr
+
+        mod = ehr.EnergyHubRetrofit(inp, invStage=0, optim_mode=1)
+        mod.create_model()
+        m = mod.m
+    results = recover_primal(m, design, solver, solver_options)
+    if results.solver.termination_condition != pe.TerminationCondition.optimal:
+        return None
+    return pe.value(m.Total_cost)
+
+
+def recover_primal(m, design, solver="gurobi", solver_options=None, tee=False):
+    """
+    Primal recovery: fix the binary design decisions in the full model and solve it
+
+    With all binaries fixed, the network investment term y_net * LC is linear.
+    The binaries are unfixed again after the solve. The solution is only loaded into the model if the
+    recovery is solved (optimal or time limit with a solution); otherwise the SolverResults report the
+    termination condition (e.g. infeasible design) and the model values are left unchanged.
+
+    Inputs to the function:
+    -----------------------
+        * m: the full pyomo model (EnergyHubRetrofit.m)
+        * design: design dictionary returned by solve_decomposed
+        * solver, solver_options: see solve_decomposed
+    """
+
+    fixed = []
+    for name, values in design.items():
+        var = getattr(m, name)
+        for k, v in values.items():
+            var[k].fix(round(v))
+            fixed.append(var[k])
+    m.Carbon_obj.deactivate()
+    m.Cost_obj.activate()
+    try:
+        results = _make_optimizer(solver, solver_options).solve(m, tee=tee, load_solutions=False)
+    finally:
+        for v in fixed:
+            v.unfix()
+    condition = results.solver.termination_condition
+    if condition in (pe.TerminationCondition.optimal, pe.TerminationCondition.maxTimeLimit) and len(results.solution) > 0:
+        m.solutions.load_from(results)
+    return results
@@ -18,6 +18,8 @@ Single energy hub - single stage model for the optimal design of a multi-energy
 Author: Georgios Mavromatidis (ETH Zurich, gmavroma@ethz.ch)
 """
 
+import os
+
 import pyomo
 import pyomo.opt
 import pyomo.environ as pe
@@ -26,10 +28,38 @@ import pyomo.environ as pe
 import numpy as np
 
 
+# Solver option names of the MIP gap and the time limit
+SOLVER_OPTION_NAMES = {
+    "gurobi": ("MIPGap", "TimeLimit"),
+    "cplex": ("mipgap", "timelimit"),
+    "cbc": ("ratioGap", "seconds"),
+    "highs": ("mip_rel_gap", "time_limit"),
+    "appsi_highs": ("mip_rel_gap", "time_limit"),
+}
+# Solver interfaces that write a log file in a format of Solver_log_parser (parsed into a convergence timeline):
+# the shell interfaces through keepfiles/logfile, the HiGHS interfaces through their log_file option
+LOG_FILE_SOLVERS = ("gurobi", "cbc")
+LOG_OPTION_SOLVERS = {"highs": "log_file", "appsi_highs": "log_file"}
+
+# Price and cost parameters that only appear as linear coefficients (see mutable_params)
+MUTABLE_PARAMS = (
+    "Import_prices",
+    "Export_prices",
+    "Fixed_conv_costs",
+    "Linear_conv_costs",
+    "Fixed_stor_costs",
+    "Linear_stor_costs",
+    "Carbon_factors_import",
+)
+
+
 class EnergyHubRetrofit:
     """This class implements a standard energy hub model for the optimal design and operation of distributed multi-energy systems"""
 
-    def __init__(self, eh_input_dict, invStage : int, temp_res=1, optim_mode=3, num_of_pareto_points=5):
+    def __init__(self, eh_input_dict, invStage : int, temp_res=1, optim_mode=3, num_of_pareto_points=5,
+                 instrument=False, trace_memory=False, mutable_params=(), linear_network=True, arc_capacity=False,
+                 lazy_rows=False, lazy_peaks=2, vintage_aggregation=False, presolve=False,
+                 cost_expressions=False):
         """
         __init__ function to read in the input data and begin the model creation process
 
@@ -39,8 +69,30 @@ class EnergyHubRetrofit:
             * temp_res (default = 1): 1: typical days optimization, 2: full horizon optimization (8760 hours), 3: typical days with continuous storage state-of-charge
             * optim_mode (default = 3): 1: for cost minimization, 2: for carbon minimization, 3: for multi-objective optimization
             * num_of_pareto_points (default = 5): In case optim_mode is set to 3, then this specifies the number of Pareto points
+            * instrument (default = False): record the construction time of every model component and the writer, solver and extraction times of solve (see profile_report)
+            * trace_memory (default = False): with instrument, also record tracemalloc allocation deltas (slows down the model construction)
+            * mutable_params (default = ()): names of MUTABLE_PARAMS built as mutable parameters, so that their values can be changed with update_params without rebuilding the model
+            * linear_network (default = True): replace the bilinear network investment term y_net * LC by an exactly linearised product variable (pure MILP), False keeps the bilinear term
+            * arc_capacity (default = False): bound the exchange flows of every time step by one capacity variable per arc, written once per arc in the Big-M connection and pipe diameter constraints
+            * lazy_rows (default = False): only build the rows of Capacity_constraint, Pipe_diameter and Arc_capacity for a seed set of peak hours, the violated rows are added by solve_lazy (see Row_generation)
+            * lazy_peaks (default = 2): with lazy_rows, number of peak hours per demand carrier, location and year (and per location and year of the solar radiation) in the seed set
+            * vintage_aggregation (default = False): operate the investment stages of a technology with equal conversion factors and degradation as one vintage group (P_conv, Qin, Qout and SoC only exist for the first stage of every group, bounded by the capacity of the whole group. Stages are only merged if their degradation coefficients coincide in every year, i.e. for technologies without yearly degradation (conversion) or without discharge rate (storage, which degrades with it); with degrading technologies, such as those of the paper inputs, nothing is merged and a warning is printed)
+            * cost_expressions (default = False): build the cost accounting terms (invTech, invNet, Investment_cost, Import_cost, Maintenance_cost, Export_profit, Operating_cost, Individual_salvage_value, Salvage_value, Total_cost) as expressions instead of variables with equality rows. Their nonnegativity is then not imposed; the values are still reported with the variables after the solve
+            * presolve (default = False): at the end of create_model, remove the unused variables and parameters and deactivate the rows implied by the variable bounds (see Model_presolve, the pruned components are in presolve_report)
         """
 
+        unknown = set(mutable_params) - set(MUTABLE_PARAMS)
+        if unknown:
+            raise ValueError("Parameters " + str(sorted(unknown)) + " cannot be mutable, choose from " + str(MUTABLE_PARAMS))
+        self.mutable_params = set(mutable_params)
+        self.linear_network = linear_network
+        self.arc_capacity = arc_capacity
+        self.lazy_rows = lazy_rows
+        self.lazy_peaks = lazy_peaks
+        self.vintage_aggregation = vintage_aggregation
+        self.presolve = presolve
+        self.cost_expressions = cost_expressions
+        self.presolve_report = None
         self.inp = eh_input_dict
         self.invStage = invStage
         self.temp_res = temp_res
@@ -53,10 +105,50 @@ class EnergyHubRetrofit:
         else:
             self.num_of_pfp = num_of_pareto_points
 
+        self.profiler = None
+        if instrument:
+            import Instrumentation as ins
+
+            self.profiler = ins.Profiler(trace_memory=trace_memory)
+            self.create_model = self.profiler.wrap(self.create_model, "create_model", "model")
+            self.solve = self.profiler.wrap(self.solve, "solve_all", "model")
+            self.save_point = self.profiler.wrap(self.save_point, "save_point", "output")
+
+    def _lazy_rule(self, name, rule):
+        # Peak-driven constraint families: with lazy_rows only the rows of the seed hours (last three indices y, d, t) are built
+        if not self.lazy_rows:
+            return rule
+        self.lazy_rules[name] = rule
+
+        def seed_rule(m, *index):
+            if index[-3:] not in self.lazy_hours:
+                return pe.Constraint.Skip
+            return rule(m, *index)
+
+        return seed_rule
+
     def create_model(self):
         """Create the Pyomo energy hub model given the input data specified in the self.InputFile"""
 
-        self.m = pe.ConcreteModel()
+        if self.profiler is None:
+            self.m = pe.ConcreteModel()
+        else:
+            import Instrumentation as ins
+
+            self.m = ins.InstrumentedModel(self.profiler)
+
+        self.lazy_rules = dict()
+        self.lazy_hours = None
+        self.reported_expressions = []
+        import Model_coefficients as mc
+
+        # Degradation, salvage, CRF and discount coefficients evaluated once over (tech, stage, year)
+        self.coefficients = mc.model_coefficients(self.inp)
+        coefficients = mc.as_dicts(self.coefficients)
+        if self.lazy_rows:
+            import Row_generation as rg
+
+            self.lazy_hours = rg.seed_hours(self.inp, self.lazy_peaks)
 
         # ============================================
         # Temporal dimensions and model sets (TABLE 1)
@@ -213,20 +305,13 @@ class EnergyHubRetrofit:
             doc="Yearly degradation coefficient for the conversion factor technology c and energy carrier ec",
         )
 
-        def Total_degradation_coefficient_rule(m, conv_tech, w, y): #A1
-            if (y >= w) and (y <= w + m.Lifetime_tech[conv_tech] - 1):
-                return (1 - m.Yearly_degradation_coefficient[conv_tech]
-                            ) ** (y - w)
-            else:
-                return 1
-
-        self.m.Total_degradation_coefficient = pe.Param(
+        self.m.Total_degradation_coefficient = pe.Param( #A1
             self.m.Conversion_tech,
             # self.m.Energy_carriers,
             self.m.Investment_stages,
             self.m.Calendar_years,
             # default=1,
-            initialize=Total_degradation_coefficient_rule,
+            initialize=coefficients["Total_degradation_coefficient"],
             doc="Total deg coeff for the conv factor technology c and energy carrier ec depending on w and the y",
         )
 
@@ -276,25 +361,13 @@ class EnergyHubRetrofit:
             doc="Yearly deg coeff for the charging and discharging efficiencies of storage technology s",
         )
 
-        def Total_degradation_coefficient_chdc_rule(m, stor_tech, w, y): #A2
-            if (y >= w) and (y <= w + m.Lifetime_stor[stor_tech] - 1):
-                return (1 - m.Yearly_degradation_coefficient_chdc[stor_tech]
-                        ) ** (y - w)
-            else:
-                return 1
-
-        self.m.Total_degradation_coefficient_chdc = pe.Param(
+        self.m.Total_degradation_coefficient_chdc = pe.Param( #A2
             self.m.Storage_tech,
             self.m.Investment_stages,
             self.m.Calendar_years,
-            initialize=Total_degradation_coefficient_chdc_rule,
+            initialize=coefficients["Total_degradation_coefficient_chdc"],
             doc="Total deg coeff for the charging and discharging efficiencies of s depending on the w and the y",
         )
-        self.m.Lifetime_stor = pe.Param(
-            self.m.Storage_tech,
-            initialize=self.inp["Lifetime_stor"],
-            doc="Lifetime of energy storage technologies",
-        )
         self.m.Storage_max_cap = pe.Param(
             self.m.Storage_tech,
             initialize=self.inp["Storage_max_cap"],
@@ -346,15 +419,17 @@ class EnergyHubRetrofit:
         )
 
         # Miscellaneous technical parameters
+        import Input_functions as inf
+
         self.m.enDem = pe.Param(
             self.m.Energy_carriers_dem,
-            # self.m.Energy_system_location,
-            # self.m.Calendar_years,
+            self.m.Energy_system_location,
+            self.m.Calendar_years,
             self.m.Days,
             self.m.Time_steps,
             default=0,
-            initialize=self.inp["Energy_demand"],
-            doc="Time-varying energy demand patterns for the energy hub",
+            initialize=inf.demand_array(self.inp),
+            doc="Time-varying energy demand patterns at location l in year y (see Input_functions.demand_array)",
         )
         self.m.Biomass = pe.Param(
             self.m.Calendar_years,
@@ -376,10 +451,10 @@ class EnergyHubRetrofit:
             doc="Total building floor area across all energy system location in year y",
         )
         self.m.Roof_area = pe.Param(
-            # self.m.Energy_system_location,
+            self.m.Energy_system_location,
             # self.m.Calendar_years,
             initialize=self.inp["Roof_area"],
-            doc="Total building roof area across at location l in year y for the installation of solar technologies",
+            doc="Total building roof area at location l for the installation of solar technologies (one value or one per location)",
         )
         self.m.Distance_area = pe.Param(
             # self.m.Energy_system_location,
@@ -401,6 +476,7 @@ class EnergyHubRetrofit:
             self.m.Energy_carriers_imp,
             self.m.Calendar_years,
             initialize=self.inp["Import_prices"],
+            mutable="Import_prices" in self.mutable_params,
             default=0,
             doc="Prices for importing energy carriers eci in year y from the grid",
         )
@@ -408,6 +484,7 @@ class EnergyHubRetrofit:
             self.m.Energy_carriers_exp,
             self.m.Calendar_years,
             initialize=self.inp["Export_prices"],
+            mutable="Export_prices" in self.mutable_params,
             default=0,
             doc="Feed-in tariffs for exporting energy carriers ece in year y back to the grid",
         )
@@ -416,6 +493,7 @@ class EnergyHubRetrofit:
             self.m.Calendar_years,
             # self.m.Investment_stages,
             initialize=self.inp["Fixed_conv_costs"],
+            mutable="Fixed_conv_costs" in self.mutable_params,
             doc="Fixed cost for installation of conv technology c in investment stage w",
         )
         self.m.Linear_conv_costs = pe.Param(
@@ -423,12 +501,14 @@ class EnergyHubRetrofit:
             self.m.Calendar_years,
             # self.m.Investment_stages,
             initialize=self.inp["Linear_conv_costs"],
+            mutable="Linear_conv_costs" in self.mutable_params,
             doc="Linear capacity dependent cost for the installation of conv tech c in investment stage w",
         )
         self.m.Fixed_stor_costs = pe.Param(
             self.m.Storage_tech,
             self.m.Investment_stages,
             initialize=self.inp["Fixed_stor_costs"],
+            mutable="Fixed_stor_costs" in self.mutable_params,
             doc="Fixed cost for the installation of storage technology s in investment stag w",
         )
         self.m.Linear_stor_costs = pe.Param(
@@ -436,6 +516,7 @@ class EnergyHubRetrofit:
             self.m.Calendar_years,
             # self.m.Investment_stages,
             initialize=self.inp["Linear_stor_costs"],
+            mutable="Linear_stor_costs" in self.mutable_params,
             doc="Linear capacity dependent cost for the installation of storage technology s in investment stage w",
         )
         self.m.Omc_cost = pe.Param(
@@ -453,32 +534,17 @@ class EnergyHubRetrofit:
             doc="The interest rate used for the CRF calculation",
         )
 
-        def Salvage_conversion_rule(m, conv_tech, w): #A3
-            maxCal = max(k for k in m.Calendar_years)
-            # if w >= maxCal + 1 - m.Lifetime_tech[conv_tech]:
-            return (1 - (1 + m.Discount_rate) ** \
-                    (maxCal + 1 - w - m.Lifetime_tech[conv_tech]
-                    ) / (1 - (1 + m.Discount_rate) ** \
-                          - m.Lifetime_tech[conv_tech]
-                        )
-                    )
-        self.m.Salvage_conversion = pe.Param(
+        self.m.Salvage_conversion = pe.Param( #A3
             self.m.Conversion_tech,
             self.m.Investment_stages,
-            initialize=Salvage_conversion_rule,
+            initialize=coefficients["Salvage_conversion"],
             doc="Salvage % of initial inv cost for conv tech c that was installed in stage w and hasn't reached the end of its lifetime",
         )
 
-        def Salvage_storage_rule(m, stor_tech, w): #A4
-            maxCal = max(k for k in m.Calendar_years)
-            # if w >= maxCal + 1 - m.Lifetime_stor[stor_tech]:
-            return (1 - (1 + m.Discount_rate) ** (maxCal + 1 - w - m.Lifetime_stor[stor_tech]
-                                                    ) / 1 - (1 + m.Discount_rate) ** - m.Lifetime_stor[stor_tech]
-                    )
-        self.m.Salvage_storage = pe.Param(
+        self.m.Salvage_storage = pe.Param( #A4
             self.m.Storage_tech,
             self.m.Investment_stages,
-            initialize=Salvage_storage_rule,
+            initialize=coefficients["Salvage_storage"],
             doc="Salvage % of initial inv cost for stor tech s that was installed in stage w and hasn't reached the end of its lifetime",
         )
 
@@ -486,50 +552,26 @@ class EnergyHubRetrofit:
 
         # CRF RULE
         #-------------------------------
-        def CRF_tech_rule(m, conv_tech):
-            return (
-                m.Discount_rate
-                * (1 + m.Discount_rate) ** m.Lifetime_tech[conv_tech]
-            ) / ((1 + m.Discount_rate) ** m.Lifetime_tech[conv_tech] - 1)
-
         self.m.CRF_tech = pe.Param(
             self.m.Conversion_tech,
-            initialize=CRF_tech_rule,
+            initialize=coefficients["CRF_tech"],
             doc="Capital Recovery Factor (CRF) used to annualise the investment cost of generation technologies",
         )
 
-        def CRF_stor_rule(m, stor_tech):
-            return (
-                m.Discount_rate
-                * (1 + m.Discount_rate) ** m.Lifetime_stor[stor_tech]
-            ) / ((1 + m.Discount_rate) ** m.Lifetime_stor[stor_tech] - 1)
-
         self.m.CRF_stor = pe.Param(
             self.m.Storage_tech,
-            initialize=CRF_stor_rule,
+            initialize=coefficients["CRF_stor"],
             doc="Capital Recovery Factor (CRF) used to annualise the investment cost of storage technologies",
         )
 
-        def CRF_network_rule(m):
-            return (
-                m.Discount_rate
-                * (1 + m.Discount_rate) ** m.Network_lifetime
-            ) / ((1 + m.Discount_rate) ** m.Network_lifetime - 1)
-
         self.m.CRF_network = pe.Param(
-            initialize=CRF_network_rule,
+            initialize=coefficients["CRF_network"],
             doc="Capital Recovery Factor (CRF) used to annualise the investment cost of the networks used by the energy hub",
         )
 
-        def CRF_retrofit_rule(m):
-            return (
-                m.Discount_rate
-                * (1 + m.Discount_rate) ** m.Lifetime_retrofit
-            ) / ((1 + m.Discount_rate) ** m.Lifetime_retrofit - 1)
-
         self.m.CRF_retrofit = pe.Param(
             self.m.Retrofit_scenarios,
-            initialize=CRF_retrofit_rule,
+            initialize=coefficients["CRF_retrofit"],
             doc="Capital Recovery Factor (CRF) used to annualise the investment cost of the considered retrofit scenarios",
         )
 
@@ -539,6 +581,7 @@ class EnergyHubRetrofit:
             self.m.Energy_carriers_imp,
             self.m.Calendar_years,
             initialize=self.inp["Carbon_factors_import"],
+            mutable="Carbon_factors_import" in self.mutable_params,
             doc="Carbon emission factor for imported energy carrier eci in year y",
         )
         self.m.epsilon = pe.Param(
@@ -562,6 +605,7 @@ class EnergyHubRetrofit:
             self.m.Days,
             self.m.Time_steps,
             within=pe.NonNegativeReals,
+            dense=not self.vintage_aggregation,
             doc="Input energy to conv tech c at energy loc l, in inv stage w operating in year y, day d and time step t",
         )
         self.m.P_import = pe.Var(
@@ -589,6 +633,7 @@ class EnergyHubRetrofit:
             self.m.Days,
             self.m.Time_steps,
             within=pe.NonNegativeReals,
+            bounds=(0, self.inp.get("Network_max_flow")),
             doc="Exchanged of energy carrier exc from location l to loc l', in year y, day d, and time step t",
         )
         self.m.Qin = pe.Var(
@@ -599,6 +644,7 @@ class EnergyHubRetrofit:
             self.m.Days,
             self.m.Time_steps,
             within=pe.NonNegativeReals,
+            dense=not self.vintage_aggregation,
             doc="Charging energy for storage tech s at en loc l, in inv stage w, operating year y, day d & time steps t",
         )
         self.m.Qout = pe.Var(
@@ -609,6 +655,7 @@ class EnergyHubRetrofit:
             self.m.Days,
             self.m.Time_steps,
             within=pe.NonNegativeReals,
+            dense=not self.vintage_aggregation,
             doc="Discharging energy for stor tech s at en loc l, in inv stage w, operating year y, day d & time steps t",
         )
         if self.temp_res != 3:
@@ -620,6 +667,7 @@ class EnergyHubRetrofit:
                 self.m.Days,
                 self.m.Time_steps,
                 within=pe.NonNegativeReals,
+                dense=not self.vintage_aggregation,
                 doc="Storage state of charge",
             )
         else:
@@ -631,6 +679,7 @@ class EnergyHubRetrofit:
                 self.m.Days,
                 self.m.Time_steps,
                 within=pe.NonNegativeReals,
+                dense=not self.vintage_aggregation,
                 doc="Storage state of charge",
             )
 
@@ -681,48 +730,12 @@ class EnergyHubRetrofit:
             doc="Binary var denoting the initial connection to exchange energy carrier ecx between loc in inv stg w",
         )
 
-        # Energy system cost and emission performance
-        self.m.Total_cost = pe.Var(
-            within=pe.NonNegativeReals,
-            doc="Total cost for the investment and the operation of the energy hub",
-        )
+        # Energy system cost and emission performance (the cost accounting terms are declared with their
+        # definitions, see cost_term)
         self.m.Total_carbon = pe.Var(
             within=pe.NonNegativeReals,
             doc="Total carbon emissions due to the operation of the energy hub",
         )
-        self.m.Import_cost = pe.Var(
-            self.m.Energy_system_location,
-            self.m.Calendar_years,
-            within=pe.NonNegativeReals,
-            doc="Total cost due to energy carrier imports at loc l, in year y"
-        )
-        self.m.Maintenance_cost = pe.Var(
-            self.m.Energy_system_location,
-            self.m.Calendar_years,
-            within=pe.NonNegativeReals,
-            doc="Total maint cost for all conv and stor tech installed at loc l in year y",
-        )
-        self.m.Export_profit = pe.Var(
-            self.m.Energy_system_location,
-            self.m.Calendar_years,
-            within=pe.NonNegativeReals,
-            doc="Total income due to exported electricity at loc l in year y",
-        )
-        self.m.Salvage_value = pe.Var(
-            within=pe.NonNegativeReals,
-            doc="Salvage value of all conv and storage tech at location l not reaching the end of their lifetime",
-        )
-
-        self.m.Investment_cost = pe.Var(
-            within=pe.NonNegativeReals,
-            doc="Investment cost of all energy technologies in the energy hub",
-        )
-        self.m.Operating_cost = pe.Var(
-            # self.m.Energy_system_location,
-            # self.m.Calendar_years,
-            within=pe.NonNegativeReals,
-            doc="Total cost due to energy carrier imports at loc l in year y",
-        )
         self.m.y_retrofit = pe.Var(
             self.m.Retrofit_scenarios,
             within=pe.Binary,
@@ -780,28 +793,121 @@ class EnergyHubRetrofit:
             keep_ + split_[1] + split_[0]
             return key1, key2
 
-        ## CHECKED
-        # Energy demand balances
-        def Load_balance_rule(m, ec, ecx, ecExp, ecDem, ecImp, l, y, d, t): #A13
-            return m.P_import[ecImp, l, y, d, t] \
-                + sum(
+        # Vintage groups: first investment stage of every group -> stages of the group. With vintage_aggregation the
+        # stages of a technology with equal conversion factors and degradation in every year are operated together
+        def vintage_groups(techs, signature):
+            groups = dict()
+            for tech in techs:
+                first = dict()
+                groups[tech] = dict()
+                for w in self.m.Investment_stages:
+                    key = signature(tech, w) if self.vintage_aggregation else w
+                    groups[tech].setdefault(first.setdefault(key, w), []).append(w)
+            return groups
+
+        self.conv_vintages = vintage_groups(
+            self.m.Conversion_tech,
+            lambda c, w: (tuple(pe.value(self.m.Conv_factor[c, ec, w]) for ec in self.m.Energy_carriers),
+                          tuple(pe.value(self.m.Total_degradation_coefficient[c, w, y]) for y in self.m.Calendar_years)),
+        )
+        self.stor_vintages = vintage_groups(
+            self.m.Storage_tech,
+            lambda s, w: tuple(pe.value(self.m.Total_degradation_coefficient_chdc[s, w, y]) for y in self.m.Calendar_years),
+        )
+        if self.vintage_aggregation:
+            merged = [tech for vintages in (self.conv_vintages, self.stor_vintages) for tech, groups in vintages.items()
+                      if len(groups) < len(self.m.Investment_stages)]
+            if merged:
+                print("Vintage aggregation: stages merged for " + ", ".join(merged))
+            else:
+                print("Warning: vintage aggregation merges no investment stages (the degradation coefficients of "
+                      "every technology differ between stages), the model keeps one vintage per stage.")
+
+        def group_cap(cap, tech, l, w, groups):
+            # Capacity of the vintage group of stage w (the stage capacity itself without aggregation)
+            if len(groups[tech][w]) == 1:
+                return cap[tech, l, w]
+            return sum(cap[tech, l, v] for v in groups[tech][w])
+
+        # Opposite arc of every connection and incoming/outgoing arcs of every location
+        if "Network_arcs" in self.inp:
+            # Candidate graph (see Network_topology): balances only contain the incident arcs
+            import Network_topology as nt
+
+            reverse_arc = nt.reverse_arcs(self.inp["Network_arcs"])
+            in_arcs, out_arcs = nt.incident_arcs(self.inp["Network_arcs"], self.inp["Energy_system_location"])
+        else:
+            # Loc_xy connection names: every balance contains the exchange over all connections
+            reverse_arc = {combs: splitCombs(combs)[1] for combs in self.inp["combineLocations"]}
+            in_arcs = out_arcs = {l: list(self.inp["combineLocations"]) for l in self.inp["Energy_system_location"]}
+
+        # Precomputed coefficients of the innermost build loops (see Model_coefficients)
+        conversion_output = coefficients["Conversion_output"]
+        charging, discharging = coefficients["Charging_coefficient"], coefficients["Discharging_coefficient"]
+
+        # Net production terms of the energy balances, built once per carrier, location and time step and
+        # shared by every Load_balance row that uses them
+        def Net_generation_rule(m, ec, l, y, d, t):
+            return sum(
                 m.P_conv[conv_tech, l, w, y, d, t] * \
-                    m.Conv_factor[conv_tech, ec, w] * \
-                        m.Total_degradation_coefficient[conv_tech, w, y]
+                    conversion_output[conv_tech, ec, w, y]
                 for conv_tech in m.Conversion_tech
-                for w in m.Investment_stages
-            ) + sum(
+                for w in self.conv_vintages[conv_tech]
+            )
+        self.m.Net_generation = pe.Expression(
+            self.m.Energy_carriers,
+            self.m.Energy_system_location,
+            self.m.Calendar_years,
+            self.m.Days,
+            self.m.Time_steps,
+            rule=Net_generation_rule,
+            doc="Output of energy carrier ec of all conv techs and vintages at loc l, in year y, day d and time step t",
+        )
+
+        def Net_storage_rule(m, ec, l, y, d, t):
+            return sum(
                 m.Storage_tech_coupling[stor_tech, ec]
                 * (m.Qout[stor_tech, l, w, y, d, t] - m.Qin[stor_tech, l, w, y, d, t])
                 for stor_tech in m.Storage_tech
-                for w in m.Investment_stages
-            ) + sum(
-                m.P_exchange[ecx, splitCombs(combs)[1], y, d, t]\
-                    * (1 - (m.Network_loses_per_m[ecx] * m.Distance_area[splitCombs(combs)[1]])
-                       ) - m.P_exchange[ecx, splitCombs(combs)[0], y, d, t]
-                    for combs in m.CombLocations
-            ) - m.P_export[ecExp, l, y, d, t]  \
-                == m.enDem[ecDem, d, t]
+                for w in self.stor_vintages[stor_tech]
+            )
+        self.m.Net_storage = pe.Expression(
+            self.m.Energy_carriers,
+            self.m.Energy_system_location,
+            self.m.Calendar_years,
+            self.m.Days,
+            self.m.Time_steps,
+            rule=Net_storage_rule,
+            doc="Net discharge of energy carrier ec from all storage techs at loc l, in year y, day d and time step t",
+        )
+
+        def Net_exchange_rule(m, ecx, l, y, d, t):
+            return sum(
+                m.P_exchange[ecx, combs, y, d, t]\
+                    * (1 - (m.Network_loses_per_m[ecx] * m.Distance_area[combs]))
+                    for combs in in_arcs[l]
+            ) - sum(
+                m.P_exchange[ecx, combs, y, d, t] for combs in out_arcs[l]
+            )
+        self.m.Net_exchange = pe.Expression(
+            self.m.Energy_carriers_exc,
+            self.m.Energy_system_location,
+            self.m.Calendar_years,
+            self.m.Days,
+            self.m.Time_steps,
+            rule=Net_exchange_rule,
+            doc="Received (after network losses) minus sent energy carrier ecx at loc l, in year y, day d and time step t",
+        )
+
+        ## CHECKED
+        # Energy demand balances
+        def Load_balance_rule(m, ec, ecx, ecExp, ecDem, ecImp, l, y, d, t): #A13
+            return m.P_import[ecImp, l, y, d, t] \
+                + m.Net_generation[ec, l, y, d, t] \
+                + m.Net_storage[ec, l, y, d, t] \
+                + m.Net_exchange[ecx, l, y, d, t] \
+                - m.P_export[ecExp, l, y, d, t]  \
+                == m.enDem[ecDem, l, y, d, t]
 
         self.m.Load_balance = pe.Constraint(
             self.m.Energy_carriers,
@@ -821,12 +927,13 @@ class EnergyHubRetrofit:
 
         ## CHECKED
         def Capacity_constraint_rule(m, disp, ec, l, w, y, d, t): #A14
+            if w not in self.conv_vintages[disp]:
+                return pe.Constraint.Skip
             if m.Conv_factor[disp, ec, w] > 0:
                 return (
                     m.P_conv[disp, l, w, y, d, t] * \
-                        m.Conv_factor[disp, ec, w] * \
-                            m.Total_degradation_coefficient[disp, w, y] <= \
-                            m.Conv_cap[disp, l, w]
+                        conversion_output[disp, ec, w, y] <= \
+                            group_cap(m.Conv_cap, disp, l, w, self.conv_vintages)
                 )
             else:
                 return pe.Constraint.Skip
@@ -838,14 +945,16 @@ class EnergyHubRetrofit:
             self.m.Calendar_years,
             self.m.Days,
             self.m.Time_steps,
-            rule=Capacity_constraint_rule,
+            rule=self._lazy_rule("Capacity_constraint", Capacity_constraint_rule),
             doc="Constraint preventing capacity violation for the generation technologies of the energy hub",
         )
 
         ## CHECKED
         def Solar_input_rule(m, sol, l, w, y, d, t): #A15
+            if w not in self.conv_vintages[sol]:
+                return pe.Constraint.Skip
             return m.P_conv[sol, l, w, y, d, t] == m.P_solar[l, y, d, t] \
-                * m.Conv_cap[sol, l, w]
+                * group_cap(m.Conv_cap, sol, l, w, self.conv_vintages)
             # return m.P_conv[sol, l, w, y, d, t] == sum(
             #     m.P_solar[d, t] * m.z3[sol, ret] for ret in m.Retrofit_scenarios
             # )
@@ -866,7 +975,7 @@ class EnergyHubRetrofit:
             return sum(m.Conv_cap[sol, l, w] for sol in m.Solar_tech
                                              for w in m.Investment_stages
                        ) \
-                <= m.Roof_area
+                <= m.Roof_area[l]
         self.m.Roof_area_non_violation = pe.Constraint(
             self.m.Energy_system_location,
             # self.m.Investment_stages,
@@ -906,31 +1015,23 @@ class EnergyHubRetrofit:
 
         ## CHECKED (only for temp_res == 1)
         def Storage_balance_rule(m, stor_tech, l, w, y, d, t): #A19&A20
+            if w not in self.stor_vintages[stor_tech]:
+                return pe.Constraint.Skip
             if self.temp_res == 1:
                 if t != 1:
                     return m.SoC[stor_tech, l, w, y, d, t] \
                         == (1 - m.Storage_standing_losses[stor_tech]) \
                         * m.SoC[stor_tech, l, w, y, d, t - 1] \
-                        + m.Storage_charging_eff[stor_tech] * \
-                            m.Total_degradation_coefficient_chdc[stor_tech, w, y] * \
-                                m.Qin[stor_tech, l, w, y, d, t] \
-                        - (1 / (m.Storage_discharging_eff[stor_tech] * \
-                           m.Total_degradation_coefficient_chdc[stor_tech, w, y]
-                                )
-                          ) \
-                        * m.Qout[stor_tech, l, w, y, d, t]
+                        + charging[stor_tech, w, y] * m.Qin[stor_tech, l, w, y, d, t] \
+                        - discharging[stor_tech, w, y] * m.Qout[stor_tech, l, w, y, d, t]
                     
                 else:
                     return (
                         m.SoC[stor_tech, l, w, y, d, t]
                         == (1 - m.Storage_standing_losses[stor_tech])
                         * m.SoC[stor_tech, l, w, y, d, t + max(m.Time_steps) - 1]
-                        + m.Storage_charging_eff[stor_tech] * \
-                            m.Total_degradation_coefficient_chdc[stor_tech, w, y] * \
-                                m.Qin[stor_tech, l, w, y, d, t]
-                        - (1 / (m.Storage_discharging_eff[stor_tech] * \
-                           m.Total_degradation_coefficient_chdc[stor_tech, w, y]))
-                        * m.Qout[stor_tech, l, w, y, d, t]
+                        + charging[stor_tech, w, y] * m.Qin[stor_tech, l, w, y, d, t]
+                        - discharging[stor_tech, w, y] * m.Qout[stor_tech, l, w, y, d, t]
                     )
             elif self.temp_res == 2:
                 if t != 1:
@@ -1027,10 +1128,12 @@ class EnergyHubRetrofit:
 
         ## CHECKED
         def Storage_charg_rate_constr_rule(m, stor_tech, l, w, y, d, t): #A21
+            if w not in self.stor_vintages[stor_tech]:
+                return pe.Constraint.Skip
             return (
                 m.Qin[stor_tech, l, w, y, d, t]
                 <= m.Storage_max_charge[stor_tech] * \
-                    m.Storage_cap[stor_tech, l, w]
+                    group_cap(m.Storage_cap, stor_tech, l, w, self.stor_vintages)
             )
         self.m.Storage_charg_rate_constr = pe.Constraint(
             self.m.Storage_tech,
@@ -1045,10 +1148,12 @@ class EnergyHubRetrofit:
 
         ## CHECKED
         def Storage_discharg_rate_constr_rule(m, stor_tech, l, w, y, d, t): #A22
+            if w not in self.stor_vintages[stor_tech]:
+                return pe.Constraint.Skip
             return (
                 m.Qout[stor_tech, l, w, y, d, t]
                 <= m.Storage_max_discharge[stor_tech] * \
-                    m.Storage_cap[stor_tech, l, w]
+                    group_cap(m.Storage_cap, stor_tech, l, w, self.stor_vintages)
             )
         self.m.Storage_discharg_rate_constr = pe.Constraint(
             self.m.Storage_tech,
@@ -1063,8 +1168,10 @@ class EnergyHubRetrofit:
 
         ## CHECKED
         def Storage_cap_constr_rule(m, stor_tech, l, w, y, d, t): #A23
+            if w not in self.stor_vintages[stor_tech]:
+                return pe.Constraint.Skip
             return m.SoC[stor_tech, l, w, y, d, t] \
-                <= m.Storage_cap[stor_tech, l, w]
+                <= group_cap(m.Storage_cap, stor_tech, l, w, self.stor_vintages)
 
         if self.temp_res == 1 or self.temp_res == 2 :
             self.m.Storage_cap_constr = pe.Constraint(
@@ -1103,7 +1210,7 @@ class EnergyHubRetrofit:
 
         ## CHECKED
         def Network_connection_rule(m, ecx, combs): #A25
-             return sum(m.y_net[ecx, splitCombs(combs)[0], w]
+             return sum(m.y_net[ecx, combs, w]
                         for w in m.Investment_stages
                         ) <= 1
         self.m.Network_connection = pe.Constraint(
@@ -1113,17 +1220,9 @@ class EnergyHubRetrofit:
              doc="Constraint for the initial connection (occur once during the project horizon)",
         )
 
-        def splitCombs(combinations):
-            split_ = combinations.split("_")
-            keep_ = split_[0] + "_"
-            split_ = split_[1]
-            key1, key2 = keep_ + split_[0] + split_[1], \
-            keep_ + split_[1] + split_[0]
-            return key1, key2
-
         def bidirectionalRule(m, ecx, combs, w):
-            return m.y_net[ecx, splitCombs(combs)[0], w] \
-                == m.y_net[ecx, splitCombs(combs)[1], w]
+            return m.y_net[ecx, combs, w] \
+                == m.y_net[ecx, reverse_arc[combs], w]
 
         self.m.bidirectionalC = pe.Constraint(
              self.m.Energy_carriers_exc,
@@ -1142,43 +1241,93 @@ class EnergyHubRetrofit:
         #     doc="Constraint for the initial connection (occur once during the project horizon)",
         # )
 
-        ## CHECKED
-        def Big_M_constraint_network(m, ecx, combs, y, d, t): #A27
-            return m.P_exchange[ecx, splitCombs(combs)[0], y, d, t] <= \
-                m.BigM * sum(
-                            m.y_net[ecx, splitCombs(combs)[0], w] 
-                            for w in m.Investment_stages
-                            )
-        self.m.Big_M_constraint_network_def = pe.Constraint(
-            self.m.Energy_carriers_exc,
-            self.m.CombLocations,
-            self.m.Calendar_years,
-            self.m.Days,
-            self.m.Time_steps,
-            rule=Big_M_constraint_network,
-            doc="Const that allows energy to be exch between 2 loc only if a connection between them already exists",
-        )
+        if self.arc_capacity:
+            # The pipe diameter and the connection only depend on the peak flow of every arc: one capacity
+            # variable per arc bounds the flows of all time steps, the Big-M link to y_net (A27) and the
+            # pipe diameter (A28) are written once per arc
+            self.m.Arc_cap = pe.Var(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                within=pe.NonNegativeReals,
+                bounds=(0, self.inp.get("Network_max_flow", pe.value(self.m.BigM))),
+                doc="Capacity (peak exchange flow) of energy carrier ecx on the connection between loc l and l'",
+            )
 
-        ## CHECKED
-        def Pipe_diameter(m, ecx, combs, y, d, t): #A28
-            return m.dm[splitCombs(combs)[0]] >= m.Alpha * \
-                m.P_exchange[ecx, splitCombs(combs)[0], y, d, t] \
-                    + m.Beta * sum(m.y_net[ecx, splitCombs(combs)[0], w] 
+            def Arc_capacity_rule(m, ecx, combs, y, d, t):
+                return m.P_exchange[ecx, combs, y, d, t] <= m.Arc_cap[ecx, combs]
+
+            self.m.Arc_capacity = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Calendar_years,
+                self.m.Days,
+                self.m.Time_steps,
+                rule=self._lazy_rule("Arc_capacity", Arc_capacity_rule),
+                doc="Exchange flows are bounded by the capacity of the connection",
+            )
+
+            def Big_M_constraint_arc(m, ecx, combs): #A27
+                return m.Arc_cap[ecx, combs] <= \
+                    self.inp.get("Network_max_flow", m.BigM) * sum(
+                        m.y_net[ecx, combs, w]
+                        for w in m.Investment_stages
+                    )
+            self.m.Big_M_constraint_arc = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                rule=Big_M_constraint_arc,
+                doc="Const that allows a connection capacity between 2 loc only if a connection between them exists",
+            )
+
+            def Pipe_diameter_arc(m, ecx, combs): #A28
+                return m.dm[combs] >= m.Alpha * m.Arc_cap[ecx, combs] \
+                    + m.Beta * sum(m.y_net[ecx, combs, w]
                                    for w in m.Investment_stages
                                    )
-        self.m.Pipe_diameter = pe.Constraint(
-            self.m.Energy_carriers_exc,
-            self.m.CombLocations,
-            self.m.Calendar_years,
-            self.m.Days,
-            self.m.Time_steps,
-            rule=Pipe_diameter,
-            doc="Const that is used to calculate pipe diameter for the thermal interconnection between two locs",
-        )
+            self.m.Pipe_diameter_arc = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                rule=Pipe_diameter_arc,
+                doc="Const that is used to calculate pipe diameter from the capacity of the connection",
+            )
+        else:
+            ## CHECKED
+            def Big_M_constraint_network(m, ecx, combs, y, d, t): #A27
+                return m.P_exchange[ecx, combs, y, d, t] <= \
+                    m.BigM * sum(
+                                m.y_net[ecx, combs, w] 
+                                for w in m.Investment_stages
+                                )
+            self.m.Big_M_constraint_network_def = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Calendar_years,
+                self.m.Days,
+                self.m.Time_steps,
+                rule=Big_M_constraint_network,
+                doc="Const that allows energy to be exch between 2 loc only if a connection between them already exists",
+            )
+
+            ## CHECKED
+            def Pipe_diameter(m, ecx, combs, y, d, t): #A28
+                return m.dm[combs] >= m.Alpha * \
+                    m.P_exchange[ecx, combs, y, d, t] \
+                        + m.Beta * sum(m.y_net[ecx, combs, w] 
+                                       for w in m.Investment_stages
+                                       )
+            self.m.Pipe_diameter = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Calendar_years,
+                self.m.Days,
+                self.m.Time_steps,
+                rule=self._lazy_rule("Pipe_diameter", Pipe_diameter),
+                doc="Const that is used to calculate pipe diameter for the thermal interconnection between two locs",
+            )
 
         def bidirectionalPipeRule(m, combs):
-            return m.dm[splitCombs(combs)[0]] \
-                == m.dm[splitCombs(combs)[1]]
+            return m.dm[combs] \
+                == m.dm[reverse_arc[combs]]
 
         self.m.bidirectionalPipeC = pe.Constraint(
              self.m.CombLocations,
@@ -1188,9 +1337,9 @@ class EnergyHubRetrofit:
 
         ## CHECKED
         def Piping_cost_per_m(m, ecx, combs): #A30
-            return m.LC[splitCombs(combs)[0]] == \
-                m.Gamma * m.dm[splitCombs(combs)[0]] + \
-                    m.Delta * sum(m.y_net[ecx, splitCombs(combs)[0], w] 
+            return m.LC[combs] == \
+                m.Gamma * m.dm[combs] + \
+                    m.Delta * sum(m.y_net[ecx, combs, w] 
                                   for w in m.Investment_stages
                               )
         self.m.Piping_cost_per_m = pe.Constraint(
@@ -1204,22 +1353,26 @@ class EnergyHubRetrofit:
         # OBJECTIVE DEFINITIONS
         # ---------------------
 
+        def cost_term(name, sets, rule, doc, def_name, def_doc):
+            # Cost accounting term name = rule(m, *index): a nonnegative variable defined by the equality
+            # constraint def_name, or with cost_expressions an expression substituted into the rows using it
+            if self.cost_expressions:
+                self.m.add_component(name, pe.Expression(*sets, rule=rule, doc=doc))
+                self.reported_expressions.append(name)
+                return
+
+            if sets:
+                def definition_rule(m, *index):
+                    return getattr(m, name)[index] == rule(m, *index)
+            else:
+                def definition_rule(m):
+                    return getattr(m, name) == rule(m)
 
-        self.m.invTech = pe.Var(
-            self.m.Energy_system_location,
-            self.m.Investment_stages,
-            within=pe.NonNegativeReals,
-            doc="Installed new capacity of storage tech s at loc l in investment stage w",
-        )
-        self.m.invNet = pe.Var(
-            self.m.Energy_system_location,
-            self.m.Investment_stages,
-            within=pe.NonNegativeReals,
-            doc="Installed new capacity of storage tech s at loc l in investment stage w",
-        )
+            self.m.add_component(name, pe.Var(*sets, within=pe.NonNegativeReals, doc=doc))
+            self.m.add_component(def_name, pe.Constraint(*sets, rule=definition_rule, doc=def_doc))
 
         def invTechRule(m, l, w):
-            return m.invTech[l,w] == sum(
+            return sum(
                 (
                     m.Fixed_conv_costs[conv_tech, w] * m.y_conv[conv_tech, l, w]
                     + m.Linear_conv_costs[conv_tech, w] * m.Conv_cap[conv_tech, l, w]
@@ -1233,34 +1386,96 @@ class EnergyHubRetrofit:
                     for stor_tech in m.Storage_tech
                     )
 
+        if self.linear_network:
+            # Exact linearisation of y_net * LC (y_net binary, 0 <= LC <= LC_max):
+            # the exchange flow is at most BigM (Big_M_constraint_network) or Network_max_flow, so a pipe
+            # diameter above Alpha * max flow + Beta is never needed and LC_max = Gamma * dm_max + Delta
+            max_flow = self.inp.get("Network_max_flow", pe.value(self.m.BigM))
+            dm_max = pe.value(self.m.Alpha) * max_flow + pe.value(self.m.Beta)
+            for combs in self.m.CombLocations:
+                self.m.dm[combs].setub(dm_max)
+            self.m.LC_max = pe.Param(
+                initialize=pe.value(self.m.Gamma) * dm_max + pe.value(self.m.Delta),
+                doc="Upper bound of the piping cost per m LC, from the largest pipe diameter",
+            )
+            self.m.y_LC = pe.Var(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Investment_stages,
+                within=pe.NonNegativeReals,
+                bounds=(0, pe.value(self.m.LC_max)),
+                doc="Linearised product y_net * LC: piping cost per m of a connection built in inv stage w",
+            )
+
+            def y_LC_binary_rule(m, ecx, combs, w):
+                return m.y_LC[ecx, combs, w] <= m.LC_max * m.y_net[ecx, combs, w]
+
+            self.m.y_LC_binary = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Investment_stages,
+                rule=y_LC_binary_rule,
+                doc="McCormick envelope of y_LC = y_net * LC: zero if the connection is not built in stage w",
+            )
+
+            def y_LC_upper_rule(m, ecx, combs, w):
+                return m.y_LC[ecx, combs, w] <= m.LC[combs]
+
+            self.m.y_LC_upper = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Investment_stages,
+                rule=y_LC_upper_rule,
+                doc="McCormick envelope of y_LC = y_net * LC: at most the piping cost per m",
+            )
+
+            def y_LC_lower_rule(m, ecx, combs, w):
+                return m.y_LC[ecx, combs, w] >= m.LC[combs] - m.LC_max * (1 - m.y_net[ecx, combs, w])
+
+            self.m.y_LC_lower = pe.Constraint(
+                self.m.Energy_carriers_exc,
+                self.m.CombLocations,
+                self.m.Investment_stages,
+                rule=y_LC_lower_rule,
+                doc="McCormick envelope of y_LC = y_net * LC: equal to the piping cost per m if built in stage w",
+            )
+
         def invNetRule(m, l, w):
-            return m.invNet[l,w] == \
-                sum(m.y_net[ecx, splitCombs(combs)[0], w] 
-                    * m.LC[splitCombs(combs)[0]] 
+            if self.linear_network:
+                return sum(
+                    m.y_LC[ecx, combs, w] * .5 * m.Distance_area[combs]
+                    for ecx in m.Energy_carriers_exc
+                    for combs in out_arcs[l]
+                )
+            return sum(m.y_net[ecx, combs, w] 
+                    * m.LC[combs] 
                     * .5 
-                    * m.Distance_area[splitCombs(combs)[0]]
+                    * m.Distance_area[combs]
                     for ecx in m.Energy_carriers_exc
-                    for combs in m.CombLocations
+                    for combs in out_arcs[l]
                     )
 
-        self.m.invNetC = pe.Constraint(
-            self.m.Energy_system_location,
-            self.m.Investment_stages,
-            rule=invNetRule,
-            doc="Input energy to conv tech c at energy loc l, in inv stage w operating in year y, day d and time step t",
+        cost_term(
+            "invTech",
+            (self.m.Energy_system_location, self.m.Investment_stages),
+            invTechRule,
+            "Installed new capacity of storage tech s at loc l in investment stage w",
+            "invTechC",
+            "Input energy to conv tech c at energy loc l, in inv stage w operating in year y, day d and time step t",
         )
-        self.m.invTechC = pe.Constraint(
-            self.m.Energy_system_location,
-            self.m.Investment_stages,
-            rule=invTechRule,
-            doc="Input energy to conv tech c at energy loc l, in inv stage w operating in year y, day d and time step t",
+        cost_term(
+            "invNet",
+            (self.m.Energy_system_location, self.m.Investment_stages),
+            invNetRule,
+            "Installed new capacity of storage tech s at loc l in investment stage w",
+            "invNetC",
+            "Input energy to conv tech c at energy loc l, in inv stage w operating in year y, day d and time step t",
         )
 
         def Investment_cost_rule(m): #A7+A8
-            return m.Investment_cost == \
-                sum(
+            return sum(
                     (m.invTech[l,w] ) * \
-                    (1 / (1 + m.Discount_rate) ** (w - 1))
+                    coefficients["Investment_discount"][w]
                     for l in m.Energy_system_location
                     for w in m.Investment_stages
                     )
@@ -1290,17 +1505,17 @@ class EnergyHubRetrofit:
 
 
 
-        self.m.Investment_cost_def = pe.Constraint(
-            # self.m.Energy_carriers_exc,
-            # self.m.CombLocations,
-            # self.m.Energy_system_location,
-            # self.m.Investment_stages,
-            rule=Investment_cost_rule,
-            doc="Definition of the investment cost component of the total energy system cost",
+        cost_term(
+            "Investment_cost",
+            (),
+            Investment_cost_rule,
+            "Investment cost of all energy technologies in the energy hub",
+            "Investment_cost_def",
+            "Definition of the investment cost component of the total energy system cost",
         )
 
         def Import_cost_rule(m, l, y):  #A9
-            return m.Import_cost[l, y] == sum(
+            return sum(
                 (m.Import_prices[ec_imp, y] * \
                  m.Number_of_days[d] * \
                  m.P_import[ec_imp, l, y, d, t])
@@ -1311,15 +1526,17 @@ class EnergyHubRetrofit:
                 for t in m.Time_steps
             )
 
-        self.m.Import_cost_def = pe.Constraint(
-            self.m.Energy_system_location,
-            self.m.Calendar_years,
-            rule=Import_cost_rule,
-            doc="import cost Rule Def",
+        cost_term(
+            "Import_cost",
+            (self.m.Energy_system_location, self.m.Calendar_years),
+            Import_cost_rule,
+            "Total cost due to energy carrier imports at loc l, in year y",
+            "Import_cost_def",
+            "import cost Rule Def",
         )
 
         def Maintenance_cost_rule(m, l, y): #A10
-            return m.Maintenance_cost[l, y] == sum((
+            return sum((
                 (
                     m.Linear_conv_costs[conv_tech, w] * m.Conv_cap[conv_tech, l, w]\
                         + m.Fixed_conv_costs[conv_tech, w] * m.y_conv[conv_tech, l, w]
@@ -1336,11 +1553,13 @@ class EnergyHubRetrofit:
                 for w in m.Investment_stages
                 # for y in m.Calendar_years
             )
-        self.m.Maintenance_cost_def = pe.Constraint(
-            self.m.Energy_system_location,
-            self.m.Calendar_years,
-            rule=Maintenance_cost_rule,
-            doc="Maintenance cost",
+        cost_term(
+            "Maintenance_cost",
+            (self.m.Energy_system_location, self.m.Calendar_years),
+            Maintenance_cost_rule,
+            "Total maint cost for all conv and stor tech installed at loc l in year y",
+            "Maintenance_cost_def",
+            "Maintenance cost",
         )
 
         def exportRule(m, ec_exp, l, y, d, t):
@@ -1356,7 +1575,7 @@ class EnergyHubRetrofit:
         )
 
         def Export_profit_rule(m, l, y): #A11
-            return m.Export_profit[l, y] == sum(
+            return sum(
                 m.Export_prices[ec_exp, y] * \
                     m.Number_of_days[d] * \
                         m.P_export[ec_exp, l, y, d, t] # m.z2[ec_exp, ret, d, t]
@@ -1367,41 +1586,37 @@ class EnergyHubRetrofit:
                 for d in m.Days
                 for t in m.Time_steps
             )
-        self.m.Export_profit_def = pe.Constraint(
-            self.m.Energy_system_location,
-            self.m.Calendar_years,
-            rule=Export_profit_rule,
-            doc="Definition of the income due to electricity exports component of the total energy system cost",
+        cost_term(
+            "Export_profit",
+            (self.m.Energy_system_location, self.m.Calendar_years),
+            Export_profit_rule,
+            "Total income due to exported electricity at loc l in year y",
+            "Export_profit_def",
+            "Definition of the income due to electricity exports component of the total energy system cost",
         )
 
         def Operating_cost_rule(m): #A9+A10-A11
             # return m.Operating_cost[l, y] == m.Import_cost[l,y] + \
             #     m.Maintenance_cost[l,y] - \
             #         m.Export_profit[l,y]
-            return m.Operating_cost == \
-                sum(
+            return sum(
                     (m.Import_cost[l,y] + m.Maintenance_cost[l,y] \
                         - m.Export_profit[l,y]) * \
-                    (1 / (1 + m.Discount_rate) ** (y))
+                    coefficients["Operating_discount"][y]
                     for l in m.Energy_system_location
                     for y in m.Calendar_years
                     )
-        self.m.Operating_cost_def = pe.Constraint(
-            # self.m.Energy_system_location,
-            # self.m.Calendar_years,
-            rule=Operating_cost_rule,
-            doc="Definition of the operating cost component of the total energy system cost",
-        )
- 
-
-        self.m.Individual_salvage_value = pe.Var(
-            self.m.Energy_system_location,
-            within=pe.NonNegativeReals,
-            doc="Total income due to exported electricity at loc l in year y",
+        cost_term(
+            "Operating_cost",
+            (),
+            Operating_cost_rule,
+            "Total cost due to energy carrier imports at loc l in year y",
+            "Operating_cost_def",
+            "Definition of the operating cost component of the total energy system cost",
         )
 
         def Individual_salvage_value_rule(m, l): #A12
-            return m.Individual_salvage_value[l] == sum((
+            return sum((
                 (
                     m.Linear_conv_costs[conv_tech, w] * m.Conv_cap[conv_tech, l, w]\
                         + m.Fixed_conv_costs[conv_tech, w] * m.y_conv[conv_tech, l, w]
@@ -1418,25 +1633,29 @@ class EnergyHubRetrofit:
                 for w in m.Investment_stages
                 # for y in m.Calendar_years
             )
-        self.m.Individual_salvage_value_def = pe.Constraint(
-            self.m.Energy_system_location,
-            # self.m.Investment_stages,
-            rule=Individual_salvage_value_rule,
-            doc="Individual salvage value terms",
+        cost_term(
+            "Individual_salvage_value",
+            (self.m.Energy_system_location,),
+            Individual_salvage_value_rule,
+            "Total income due to exported electricity at loc l in year y",
+            "Individual_salvage_value_def",
+            "Individual salvage value terms",
         )
 
         def Salvage_value_rule(m):
-            return m.Salvage_value == sum(
+            return sum(
                 (m.Individual_salvage_value[l] * \
-                 (1/(1 + m.Discount_rate) ** max(m.Calendar_years)+1))
+                 coefficients["Salvage_discount"])
                 for l in m.Energy_system_location
                 )
 
-        self.m.Salvage_value_def = pe.Constraint(
-            # self.m.Energy_system_location,
-            # self.m.Investment_stages,
-            rule=Salvage_value_rule,
-            doc="Salvage value terms",
+        cost_term(
+            "Salvage_value",
+            (),
+            Salvage_value_rule,
+            "Salvage value of all conv and storage tech at location l not reaching the end of their lifetime",
+            "Salvage_value_def",
+            "Salvage value terms",
         )
 
         # Additional constraints
@@ -1482,12 +1701,15 @@ class EnergyHubRetrofit:
         # ---------------
 
         def Total_cost_rule(m): #A5
-            return m.Total_cost == \
-                m.Investment_cost + m.Operating_cost - m.Salvage_value
+            return m.Investment_cost + m.Operating_cost - m.Salvage_value
 
-        self.m.Total_cost_def = pe.Constraint(
-            rule=Total_cost_rule,
-            doc="Definition of the total cost model objective function",
+        cost_term(
+            "Total_cost",
+            (),
+            Total_cost_rule,
+            "Total cost for the investment and the operation of the energy hub",
+            "Total_cost_def",
+            "Definition of the total cost model objective function",
         )
 
         def Total_carbon_rule(m): #A6
@@ -1756,7 +1978,13 @@ class EnergyHubRetrofit:
         def carbon_obj_rule(m):return m.Total_carbon
         self.m.Carbon_obj = pe.Objective(rule=carbon_obj_rule, sense=pe.minimize)
 
-    def solve(self, mip_gap=0.001, time_limit=10 ** 8, results_folder=".\\"):
+        if self.presolve:
+            import Model_presolve as mp
+
+            self.presolve_report = mp.presolve(self)
+
+    def solve(self, mip_gap=0.001, time_limit=10 ** 8, results_folder=".\\", output_format="excel",
+              sparse_tol=None, resume=False, solver="gurobi", solver_options=None, log_file="gur.log"):
         """
         Solves the model and outputs model results
 
@@ -1767,14 +1995,81 @@ class EnergyHubRetrofit:
                 * obj: Contains the total cost, cost breakdown, and total carbon results. It is a data frame for all optim_mode settings.
                 * dsgn: Contains the generation and storage capacities of all candidate technologies. It is a data frame for all optim_mode settings.
                 * oper: Contains the generation, export and storage energy flows for all time steps considered. It is a single dataframe when optim_mode is 1 or 2 (single-objective) and a list of dataframes for each Pareto point when optim_mode is set to 3 (multi-objective).
+
+        The variable values of every objective point are saved according to output_format:
+            * "excel" (default): one Excel workbook per objective point
+            * "parquet": partitioned Parquet results store in results_folder/results_store (see Results_store)
+            * "pickle": a single pickle file with the variable values of all objective points
+
+        If sparse_tol is given, variable entries with an absolute value below or equal to sparse_tol are
+        skipped by the extractors and writers (sparse output), including the solver results JSON files.
+
+        With optim_mode 3 and output_format "parquet", every Pareto point is written to the results store
+        as soon as it finishes, together with a run manifest. If resume is True, the points already in the
+        store are skipped and the next point is warm-started from the last finished solution; a ValueError is
+        raised if the store was written with other run settings (optim_mode, num_of_pareto_points, solver, mip_gap).
+
+        With output_format "parquet", the solver log (log_file, gur.log by default) of every stored point is
+        parsed into a convergence timeline (incumbent, bound, gap, nodes) and attached to the results store
+        (see Solver_log_parser and Results_store.read_convergence).
+
+        The model is solved with Gurobi unless another pyomo solver name is given. mip_gap and time_limit are
+        passed under the option names of SOLVER_OPTION_NAMES; solver_options (e.g. {"Threads": 2}) are passed
+        to the solver as they are and take precedence. The solver log is only written (and parsed) for the
+        solvers of LOG_FILE_SOLVERS and LOG_OPTION_SOLVERS; with log_file=None, no solver log is written.
         """
 
         import Output_functions as of
+        import Results_store as rs
         import pickle as pkl
 
-        optimizer = pyomo.opt.SolverFactory("gurobi")
-        optimizer.options["MIPGap"] = mip_gap
-        optimizer.options["TimeLimit"] = time_limit
+        optimizer = pyomo.opt.SolverFactory(solver)
+        if solver in SOLVER_OPTION_NAMES:
+            gap_option, time_option = SOLVER_OPTION_NAMES[solver]
+            optimizer.options[gap_option] = mip_gap
+            optimizer.options[time_option] = time_limit
+        for key, value in (solver_options or {}).items():
+            optimizer.options[key] = value
+
+        get_all_vars = of.get_all_vars
+        if self.profiler is not None:
+            import Instrumentation as ins
+
+            ins.instrument_solver(optimizer, self.profiler)
+            get_all_vars = self.profiler.wrap(of.get_all_vars, "get_all_vars", "extraction")
+            if not hasattr(self.m.solutions.store_to, "__wrapped__"):
+                self.m.solutions.store_to = self.profiler.wrap(
+                    self.m.solutions.store_to, "store_to", "extraction"
+                )
+
+        # The HiGHS interfaces reject keepfiles and logfile and write their log through a solver option; the logs
+        # of the other solvers (e.g. CPLEX, GLPK) are not in a format of Solver_log_parser
+        log_kwargs = dict(tee=True)
+        if log_file is not None and solver in LOG_OPTION_SOLVERS:
+            # HiGHS appends to its log file, a stale log would be parsed as the first point's
+            if os.path.exists(log_file):
+                os.remove(log_file)
+            optimizer.options[LOG_OPTION_SOLVERS[solver]] = log_file
+        elif log_file is not None and solver in LOG_FILE_SOLVERS:
+            log_kwargs = dict(tee=True, keepfiles=True, logfile=log_file)
+        else:
+            log_file = None
+        store_folder = os.path.join(results_folder, "results_store")
+        completed = set()
+        if resume:
+            if output_format != "parquet":
+                raise ValueError("resume=True requires output_format='parquet'")
+            completed = set(rs.completed_points(store_folder))
+            # The stored points must come from a run with the same settings
+            run = rs.read_manifest(store_folder).get("run", {})
+            settings = {"optim_mode": self.optim_mode, "num_of_pareto_points": self.num_of_pfp,
+                        "solver": solver, "mip_gap": mip_gap}
+            mismatch = {k: (run[k], v) for k, v in settings.items() if k in run and run[k] != v}
+            if mismatch:
+                raise ValueError(
+                    "Cannot resume the results store " + store_folder + " with different run settings: "
+                    + ", ".join("{} stored {!r}, requested {!r}".format(k, *values) for k, values in mismatch.items())
+                )
         targetObjective = "Single Objective (Cost minimization)" \
             if self.optim_mode == 1 else "Single Objective (Carbon minimization)" \
                 if self.optim_mode == 2 else \
@@ -1788,13 +2083,15 @@ class EnergyHubRetrofit:
 
             self.m.Carbon_obj.deactivate()
             results = optimizer.solve(
-                self.m, tee=True, keepfiles=True, logfile="gur.log"
+                self.m, **log_kwargs
             )
             # if self.invStage == 0:
             print("SAVING RESULTS...")
             # Save results
             self.m.solutions.store_to(results)
-            all_vars[0] = of.get_all_vars(self.m)
+            if sparse_tol is not None:
+                of.sparsify_results(results, sparse_tol)
+            all_vars[0] = get_all_vars(self.m, tol=sparse_tol, expressions=self.reported_expressions)
 
             # JSON file with results
             results.write(
@@ -1810,6 +2107,8 @@ class EnergyHubRetrofit:
             # of.write_all_vars_to_excel(all_vars[0],
             #                            results_folder + "\cost_min_" \
             #                             + str(self.invStage))
+            self.save_point(all_vars[0], 0, results, results_folder,
+                            output_format, "\cost_min_" + str(self.invStage), log_file)
             print("SAVING OPERATION EXECUTED!")
             # else:pass
 
@@ -1821,20 +2120,20 @@ class EnergyHubRetrofit:
 
             self.m.Carbon_obj.activate()
             self.m.Cost_obj.deactivate()
-            optimizer.solve(self.m, tee=True, keepfiles=True, logfile="gur.log")
+            optimizer.solve(self.m, **log_kwargs)
             carb_min = pe.value(self.m.Total_system_carbon) * 1.01
 
             self.m.epsilon = carb_min
             self.m.Carbon_obj.deactivate()
             self.m.Cost_obj.activate()
             results = optimizer.solve(
-                self.m, tee=True, keepfiles=True, logfile="gur.log"
+                self.m, **log_kwargs
             )
 
             # Save results
             # ------------
             # self.m.solutions.store_to(results)
-            all_vars[0] = of.get_all_vars(self.m)
+            all_vars[0] = get_all_vars(self.m, tol=sparse_tol, expressions=self.reported_expressions)
 
             # # JSON file with results
             # results.write(
@@ -1846,49 +2145,78 @@ class EnergyHubRetrofit:
             # pkl.dump(all_vars, file)
             # file.close()
 
-            # Excel file with all variable values
-            of.write_all_vars_to_excel(all_vars[0], results_folder + "\carb_min")
+            # Variable values (Parquet results store or Excel file)
+            self.save_point(all_vars[0], 0, results, results_folder,
+                            output_format, "\carb_min", log_file)
 
         elif self.optim_mode == 3:
 
             # Multi-objective optimization
             # ============================
             all_vars = [None] * (self.num_of_pfp + 2)
+            warmstart = False
+
+            if output_format == "parquet":
+                rs.write_run_info(
+                    store_folder,
+                    {
+                        "optim_mode": self.optim_mode,
+                        "num_of_pareto_points": self.num_of_pfp,
+                        "points": list(range(self.num_of_pfp + 2)),
+                        "solver": solver,
+                        "mip_gap": mip_gap,
+                        "time_limit": time_limit,
+                    },
+                )
 
             # Cost minimization
             # -----------------
             self.m.Carbon_obj.deactivate()
-            print("----------\nCOST MINIMIZATION OBJECTIVE BEING EXECUTED!!\n(CARBON OBJECTIVE IS DEACTIVATED)")
-
-            results = optimizer.solve(
-                self.m, tee=True, keepfiles=True, logfile="gur.log"
-            )
-            # carb_max = pe.value(self.m.Total_system_carbon)
+            if 0 in completed:
+                print("----------\nCOST MINIMIZATION ALREADY COMPLETED, LOADING IT FROM THE RESULTS STORE")
+                all_vars[0] = rs.read_point(store_folder, 0)
+                warmstart = True
+            else:
+                print("----------\nCOST MINIMIZATION OBJECTIVE BEING EXECUTED!!\n(CARBON OBJECTIVE IS DEACTIVATED)")
 
-            # Save results
-            self.m.solutions.store_to(results)
-            all_vars[0] = of.get_all_vars(self.m)
+                results = optimizer.solve(
+                    self.m, **log_kwargs
+                )
+                # carb_max = pe.value(self.m.Total_system_carbon)
 
-            # JSON file with results
-            results.write(
-                filename=results_folder + "\MO_solver_results_1.json", format="json"
-            )
+                # Save results
+                self.m.solutions.store_to(results)
+                if sparse_tol is not None:
+                    of.sparsify_results(results, sparse_tol)
+                all_vars[0] = get_all_vars(self.m, tol=sparse_tol, expressions=self.reported_expressions)
+
+                # JSON file with results
+                results.write(
+                    filename=results_folder + "\MO_solver_results_1.json", format="json"
+                )
 
-            # # Pickle file with all variable values
-            # file = open(results_folder + "\multi_obj_1.p", "wb")
-            # pkl.dump([all_vars[0]], file)
-            # file.close()
+                # # Pickle file with all variable values
+                # file = open(results_folder + "\multi_obj_1.p", "wb")
+                # pkl.dump([all_vars[0]], file)
+                # file.close()
 
-            # Excel file with all variable values
-            # of.write_all_vars_to_excel(all_vars[0], results_folder + "\multi_obj_1")
+                # Variable values (Parquet results store or Excel file)
+                self.save_point(all_vars[0], 0, results, results_folder,
+                                output_format, "\multi_obj_1", log_file)
 
             # Carbon minimization
             # -------------------
-            self.m.Carbon_obj.activate()
-            self.m.Cost_obj.deactivate()
-            print("----------\nCARBON MINIMIZATION OBJECTIVE BEING EXECUTED!!\n(COST OBJECTIVE IS DEACTIVATED)")
-            optimizer.solve(self.m, tee=True, keepfiles=True, logfile="gur.log")
-            # carb_min = pe.value(self.m.Total_system_carbon) * 1.01
+            if resume and "carbon_min" in rs.read_manifest(store_folder).get("run", {}).get("phases", []):
+                print("----------\nCARBON MINIMIZATION ALREADY COMPLETED")
+            else:
+                self.m.Carbon_obj.activate()
+                self.m.Cost_obj.deactivate()
+                print("----------\nCARBON MINIMIZATION OBJECTIVE BEING EXECUTED!!\n(COST OBJECTIVE IS DEACTIVATED)")
+                optimizer.solve(self.m, **log_kwargs)
+                # carb_min = pe.value(self.m.Total_system_carbon) * 1.01
+                if output_format == "parquet":
+                    rs.write_run_info(store_folder, {"phases": ["carbon_min"]})
+                warmstart = False
 
             # Pareto points
             # -------------
@@ -1896,28 +2224,7 @@ class EnergyHubRetrofit:
                 # self.m.epsilon = carb_min
                 self.m.Carbon_obj.deactivate()
                 self.m.Cost_obj.activate()
-                results = optimizer.solve(
-                    self.m, tee=True, keepfiles=True, logfile="gur.log"
-                )
-
-                # Save results
-                # ------------
-                # self.m.solutions.store_to(results)
-                all_vars[1] = of.get_all_vars(self.m)
-
-                # # JSON file with results
-                # results.write(
-                #     filename=results_folder + "\MO_solver_results_2.json", format="json"
-                # )
-
-                # # Pickle file with all variable values
-                # file = open(results_folder + "\multi_obj_2.p", "wb")
-                # pkl.dump([all_vars[1]], file)
-                # file.close()
-
-                # Excel file with all variable values
-                of.write_all_vars_to_excel(all_vars[1], results_folder + "\multi_obj_2")
-
+                points = [1]
             else:
                 self.m.Carbon_obj.deactivate()
                 self.m.Cost_obj.activate()
@@ -1926,20 +2233,32 @@ class EnergyHubRetrofit:
                 # steps = list(np.arange(carb_min, carb_max, interval))
                 # steps.reverse()
                 # print(steps)
+                points = range(1, self.num_of_pfp + 1 + 1)
+
+            for i in points:
+                if i in completed:
+                    print("----------\nPARETO POINT {} ALREADY COMPLETED, LOADING IT FROM THE RESULTS STORE".format(i))
+                    all_vars[i] = rs.read_point(store_folder, i)
+                    warmstart = True
+                    continue
+
+                # self.m.epsilon = steps[i - 1]
+                # print(self.m.epsilon.extract_values())
+                solve_kwargs = dict(log_kwargs)
+                if warmstart and optimizer.warm_start_capable():
+                    # Warm start from the last finished point loaded from the results store
+                    self.load_point_values(all_vars[max(k for k in range(i) if all_vars[k] is not None)])
+                    solve_kwargs["warmstart"] = True
+                warmstart = False
+                results = optimizer.solve(self.m, **solve_kwargs)
 
-                for i in range(1, self.num_of_pfp + 1 + 1):
-                    # self.m.epsilon = steps[i - 1]
-                    # print(self.m.epsilon.extract_values())
-                    results = optimizer.solve(
-                        self.m, tee=True, keepfiles=True, logfile="gur.log"
-                    )
-
-                    # Save results
-                    # ------------
-                    # self.m.solutions.store_to(results)
-                    all_vars[i] = of.get_all_vars(self.m)
+                # Save results
+                # ------------
+                # self.m.solutions.store_to(results)
+                all_vars[i] = get_all_vars(self.m, tol=sparse_tol, expressions=self.reported_expressions)
 
-                    # JSON file with results
+                # JSON file with results
+                if self.num_of_pfp != 0:
                     results.write(
                         filename=results_folder
                                  + "\MO_solver_results_"
@@ -1948,22 +2267,203 @@ class EnergyHubRetrofit:
                         format="json",
                     )
 
-                    # Pickle file with all variable values
-                    # file = open(
-                    #     results_folder + "\multi_obj_" + str(i + 1) + ".p", "wb"
-                    # )
-                    # pkl.dump([all_vars[i]], file)
-                    # file.close()
+                # Pickle file with all variable values
+                # file = open(
+                #     results_folder + "\multi_obj_" + str(i + 1) + ".p", "wb"
+                # )
+                # pkl.dump([all_vars[i]], file)
+                # file.close()
 
-                    # # Excel file with all variable values
-                    # of.write_all_vars_to_excel(
-                    #     all_vars[i], results_folder + "\multi_obj_" + str(i + 1)
-                    # )
+                # Variable values (Parquet results store or Excel file)
+                self.save_point(all_vars[i], i, results, results_folder,
+                                output_format, "\multi_obj_" + str(i + 1), log_file)
 
             # Pickle file with all variable values for all multi-objective runs
-            file = open(results_folder + "\multi_obj_all_points.p", "wb")
-            pkl.dump(all_vars, file)
-            file.close()
+            if output_format == "pickle":
+                file = open(results_folder + "\multi_obj_all_points.p", "wb")
+                pkl.dump(all_vars, file)
+                file.close()
+
+    def load_point_values(self, all_vars):
+        """
+        Sets the variable values of the model to a stored solution (e.g. as a warm start)
+
+        Inputs to the function:
+        -----------------------
+            * all_vars: dictionary of variable data frames, as returned by Output_functions.get_all_vars or Results_store.read_point. Entries missing from a (sparse) data frame are set to 0.
+        """
+
+        for name, df in all_vars.items():
+            v = getattr(self.m, name, None)
+            if v is None or v.ctype is not pe.Var:
+                continue
+            if not v.is_indexed():
+                v.set_value(float(df["Value"].iloc[0]) if len(df) else 0.0, skip_validation=True)
+                continue
+            values = df["Value"].to_dict()
+            for index in v:
+                v[index].set_value(values.get(index, 0.0), skip_validation=True)
+
+    def update_params(self, updates):
+        """
+        Changes the values of mutable parameters in the built model (see mutable_params)
+
+        Inputs to the function:
+        -----------------------
+            * updates: dictionary parameter name -> dictionary index -> new value, e.g. {"Import_prices": {("NatGas", 1): 0.07}}
+
+        The input dictionary of the model (self.inp) is updated as well.
+        """
+
+        for name in updates:
+            if name not in self.mutable_params:
+                raise ValueError("Parameter " + name + " is not mutable, create the model with mutable_params=[\"" + name + "\"]")
+        self.inp = dict(self.inp)
+        for name, values in updates.items():
+            param = getattr(self.m, name)
+            for index, value in values.items():
+                param[index] = value
+            self.inp[name] = {**self.inp[name], **values}
+
+    def profile_report(self, filename=None, spans_file=None, print_summary=True):
+        """
+        Returns the instrumentation report (requires instrument=True)
+
+        Inputs to the function:
+        -----------------------
+            * filename (optional): JSON file the report is written to
+            * spans_file (optional): file the OpenTelemetry-style spans are written to (one JSON object per line)
+            * print_summary (default = True): print a summary table of the slowest phases/components
+        """
+
+        if self.profiler is None:
+            raise RuntimeError("Instrumentation is disabled, create the model with instrument=True")
+
+        import Instrumentation as ins
+
+        if filename is not None:
+            self.profiler.write_json(filename)
+        if spans_file is not None:
+            self.profiler.write_spans(spans_file)
+        if print_summary:
+            ins.print_summary(self.profiler)
+        return self.profiler.report()
+
+    def solve_decomposed(self, solver="gurobi", solver_options=None, rho=0.0, step=1.0, max_iter=50, tol=1e-3,
+                         n_workers=None, recover=True, upper_bound=None, patience=3):
+        """
+        Solves the cost minimization problem by Lagrangian/ADMM decomposition across locations (see Decomposition)
+
+        Inputs to the function:
+        -----------------------
+            * solver, solver_options, rho, step, max_iter, tol, n_workers, upper_bound, patience: see Decomposition.solve_decomposed (the primal recoveries use this model)
+            * recover (default = True): fix the binary design of the subproblems in this model and solve it (primal recovery)
+
+        Requires a Network_arcs graph in the input. Returns the dictionary of Decomposition.solve_decomposed,
+        with the SolverResults of the primal recovery of the best design under "recovery" and its termination
+        condition under "recovery_status" (the solution is only loaded if the recovery is solved).
+        """
+
+        import Decomposition as dc
+
+        res = dc.solve_decomposed(self.inp, solver, solver_options, rho, step, max_iter, tol, n_workers,
+                                  upper_bound=upper_bound, model=self.m, patience=patience)
+        if recover:
+            res["recovery"] = dc.recover_primal(self.m, res["design"], solver, solver_options)
+            res["recovery_status"] = str(res["recovery"].solver.termination_condition)
+        return res
+
+    def solve_lazy(self, solver="gurobi", solver_options=None, max_rounds=50, tol=1e-6):
+        """
+        Solves the cost minimization problem with lazy row generation (requires lazy_rows=True, see Row_generation)
+
+        Inputs to the function:
+        -----------------------
+            * solver, solver_options, max_rounds, tol: see Row_generation.solve_lazy
+
+        Returns the data frame of the rounds (objective, lazy rows, added rows, times, converged).
+        """
+
+        import Row_generation as rg
+
+        self.m.Carbon_obj.deactivate()
+        self.m.Cost_obj.activate()
+        return rg.solve_lazy(self, solver, solver_options, max_rounds, tol)
+
+    def solve_mps(self, solver="highs", filename="model.mps", n_workers=None, chunk_rows=20000, mip_gap=0.001,
+                  time_limit=10 ** 8, solver_options=None):
+        """
+        Solves the cost minimization problem through an MPS file written by worker processes (see Mps_writer)
+
+        Inputs to the function:
+        -----------------------
+            * solver, filename, n_workers, chunk_rows, mip_gap, time_limit, solver_options: see Mps_writer.solve_mps
+
+        Returns the dictionary of Mps_writer.solve_mps; the solution is loaded into the model.
+        """
+
+        import Mps_writer as mw
+
+        return mw.solve_mps(self, solver, filename, n_workers, chunk_rows, mip_gap, time_limit, solver_options)
+
+    def model_statistics(self, filename=None):
+        """
+        Returns rows, columns, nonzeros and coefficient ranges per constraint and variable component
+
+        Inputs to the function:
+        -----------------------
+            * filename (optional): JSON file the statistics are written to (see Model_statistics.compare_statistics)
+        """
+
+        import Model_statistics as ms
+
+        stats = ms.model_statistics(self.m)
+        if filename is not None:
+            ms.write_statistics(stats, filename)
+        return stats
+
+    def save_point(self, all_vars, point, results, results_folder, output_format, filename, log_file=None):
+        """
+        Saves the variable values of a single objective point
+
+        Inputs to the function:
+        -----------------------
+            * all_vars: dictionary of variable data frames, as returned by Output_functions.get_all_vars
+            * point: objective/Pareto point number
+            * results: pyomo SolverResults object of the point
+            * results_folder: folder where the results are saved
+            * output_format: "parquet", "excel" or "pickle" (pickle files are written once for all points at the end of solve)
+            * filename: Excel file name used when output_format is "excel"
+            * log_file (optional): solver log of the point, parsed into a convergence timeline stored with the point (parquet only)
+        """
+
+        import Output_functions as of
+
+        if output_format == "parquet":
+            import Results_store as rs
+
+            rs.write_point(
+                all_vars,
+                os.path.join(results_folder, "results_store"),
+                point,
+                objectives={
+                    "Total_cost": pe.value(self.m.Total_cost),
+                    "Total_carbon": pe.value(self.m.Total_carbon),
+                },
+                stats=rs.solver_stats(results),
+            )
+            if log_file is not None and os.path.exists(log_file):
+                import Solver_log_parser as slp
+
+                try:
+                    timeline = slp.parse_log(log_file)
+                except ValueError:
+                    print("Solver log format of " + log_file + " not recognised, no convergence timeline stored")
+                else:
+                    rs.write_convergence(os.path.join(results_folder, "results_store"), point,
+                                         timeline, slp.summarise(timeline))
+        elif output_format == "excel":
+            of.write_all_vars_to_excel(all_vars, results_folder + filename)
 
 if __name__ == "__main__":
     pass
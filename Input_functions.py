@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed model inputs
+
+Large time series inputs (e.g. the demand of dozens of buildings) are held as
+a LabeledArray: a NumPy array with one label list per axis. A LabeledArray is a
+read-only mapping from label tuples to values, so it can be given directly as
+the initialize argument of a pe.Param without building a dictionary of tuple
+keys. Only its non-zero entries are iterated, the zero entries are left to the
+default of the Param.
+
+The Energy_demand input of EnergyHubRetrofit can be given as
+    * a dictionary (ecd, d, t) -> demand: the same demand at every location and in every year
+    * a dictionary (ecd, l, d, t) or (ecd, l, y, d, t) -> demand
+    * a LabeledArray with the axes ("ecd", "d", "t"), ("ecd", "l", "d", "t") or ("ecd", "l", "y", "d", "t")
+and is turned into a LabeledArray over (ecd, l, y, d, t) by demand_array.
+
+    demand = load_demand("demand.parquet")   # long table with the columns ecd, l, (y), d, t, value
+    ehr_inp["Energy_demand"] = demand
+"""
+
+import itertools
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+DEMAND_AXES = ("ecd", "l", "y", "d", "t")
+
+
+class LabeledArray(Mapping):
+    """NumPy array with labelled axes, usable as a mapping (label tuple -> value)"""
+
+    def __init__(self, values, labels, axes=None):
+        """
+        Inputs to the function:
+        -----------------------
+            * values: array with one dimension per axis
+            * labels: list of label lists, one per axis (in the order of the array dimensions)
+            * axes (optional): names of the axes, e.g. ("ecd", "l", "d", "t")
+        """
+
+        self.values = np.asarray(values, dtype=float)
+        self.labels = [list(lab) for lab in labels]
+        self.axes = tuple(axes) if axes is not None else tuple("i" + str(k) for k in range(len(self.labels)))
+        if self.values.shape != tuple(len(lab) for lab in self.labels):
+            raise ValueError("The shape of the values {} does not match the labels {}".format(
+                self.values.shape, tuple(len(lab) for lab in self.labels)))
+        if len(self.axes) != self.values.ndim:
+            raise ValueError("One axis name is needed per array dimension")
+        self._positions = [{lab: k for k, lab in enumerate(labels)} for labels in self.labels]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        try:
+            return float(self.values[tuple(pos[k] for pos, k in zip(self._positions, key))])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        # Non-zero entries only (zero is the default of the parameters built from it)
+        for position in zip(*np.nonzero(self.values)):
+            yield tuple(labels[p] for labels, p in zip(self.labels, position))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.values))
+
+    def __repr__(self):
+        return "LabeledArray(axes={}, shape={})".format(self.axes, self.values.shape)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def axis(self, name):
+        return self.axes.index(name)
+
+    def to_dict(self):
+        """Dictionary of all (including zero) entries"""
+
+        keys = itertools.product(*self.labels)
+        return dict(zip(keys, self.values.ravel().tolist()))
+
+    def to_series(self):
+        index = pd.MultiIndex.from_product(self.labels, names=self.axes)
+        return pd.Series(self.values.ravel(), index=index, name="value")
+
+    def broadcast(self, axes, labels):
+        """
+        Expand the array to the given axes (missing axes are repeated without copying the data)
+
+        Inputs to the function:
+        -----------------------
+            * axes: names of all axes of the result, a superset of self.axes in the same relative order
+            * labels: dictionary axis name -> labels for the axes missing in self.axes
+        """
+
+        if [a for a in axes if a in self.axes] != list(self.axes):
+            raise ValueError("Cannot broadcast the axes {} to {}".format(self.axes, tuple(axes)))
+        shape, new_labels = [], []
+        for a in axes:
+            if a in self.axes:
+                shape.append(self.values.shape[self.axis(a)])
+                new_labels.append(self.labels[self.axis(a)])
+            else:
+                shape.append(1)
+                new_labels.append(list(labels[a]))
+        values = self.values.reshape(shape)
+        values = np.broadcast_to(values, tuple(len(lab) for lab in new_labels))
+        return LabeledArray(values, new_labels, axes)
+
+    @classmethod
+    def from_series(cls, series, axes=None, labels=None):
+        """
+        Array from a series with a MultiIndex (long format); missing entries are 0
+
+        Inputs to the function:
+        -----------------------
+            * series: values indexed by one index level per axis
+            * axes (optional): names of the axes, defaults to the index level names
+            * labels (optional): dictionary axis name -> labels, defaults to the sorted labels found in the index
+        """
+
+        index = series.index
+        axes = tuple(axes) if axes is not None else tuple(index.names)
+        codes, all_labels = [], []
+        for k, a in enumerate(axes):
+            level = index.get_level_values(k) if index.nlevels > 1 else index
+            if labels is not None and a in labels:
+                uniques = pd.Index(list(labels[a]))
+                level_codes = uniques.get_indexer(level)
+                if (level_codes < 0).any():
+                    raise ValueError("Labels of axis {} missing in the given labels".format(a))
+            else:
+                level_codes, uniques = pd.factorize(level, sort=True)
+            codes.append(level_codes)
+            all_labels.append(list(uniques))
+        values = np.zeros(tuple(len(lab) for lab in all_labels))
+        values[tuple(codes)] = series.to_numpy(dtype=float)
+        return cls(values, all_labels, axes)
+
+    @classmethod
+    def from_dict(cls, data, axes, labels=None):
+        """Array from a dictionary label tuple -> value"""
+
+        keys = list(data)
+        index = pd.MultiIndex.from_tuples(keys) if keys and isinstance(keys[0], tuple) else pd.Index(keys)
+        series = pd.Series(np.fromiter(data.values(), dtype=float, count=len(keys)), index=index)
+        return cls.from_series(series, axes, labels)
+
+    def save(self, filename):
+        """Save to a NumPy .npz file"""
+
+        np.savez_compressed(
+            filename, values=np.ascontiguousarray(self.values), axes=np.array(self.axes),
+            **{"labels_" + str(k): np.array(lab, dtype=object) for k, lab in enumerate(self.labels)}
+        )
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=True) as data:
+            axes = [str(a) for a in data["axes"]]
+            labels = [data["labels_" + str(k)].tolist() for k in range(len(axes))]
+            return cls(data["values"], labels, axes)
+
+
+def load_demand(filename, value_column="value", sheet_name=0):
+    """
+    Load a demand table in long format as a LabeledArray
+
+    The table (.csv, .parquet, .xlsx or a .npz file written by LabeledArray.save) has the columns
+    ecd, d, t and value, and optionally l and y for location and year resolved demands.
+    """
+
+    if str(filename).endswith(".npz"):
+        return LabeledArray.load(filename)
+    if str(filename).endswith(".parquet"):
+        table = pd.read_parquet(filename)
+    elif str(filename).endswith((".xlsx", ".xls")):
+        table = pd.read_excel(filename, sheet_name=sheet_name)
+    else:
+        table = pd.read_csv(filename)
+    axes = [a for a in DEMAND_AXES if a in table.columns]
+    return LabeledArray.from_series(table.set_index(axes)[value_column], axes)
+
+
+def _flat(years):
+    # Calendar years may be given grouped per investment stage
+    return sum(years, []) if years and isinstance(years[0], list) else list(years)
+
+
+def demand_array(inp):
+    """Energy_demand of an input dictionary as a LabeledArray over (ecd, l, y, d, t)"""
+
+    labels = {
+        "ecd": list(inp["Energy_carriers_dem"]),
+        "l": list(inp["Energy_system_location"]),
+        "y": _flat(list(inp["Calendar_years"])),
+        "d": list(inp["Days"]),
+        "t": list(inp["Time_steps"]),
+    }
+    demand = inp["Energy_demand"]
+    if not isinstance(demand, LabeledArray):
+        key_length = len(next(iter(demand))) if len(demand) else 3
+        axes = {3: ("ecd", "d", "t"), 4: ("ecd", "l", "d", "t"), 5: DEMAND_AXES}.get(key_length)
+        if axes is None:
+            raise ValueError("Energy_demand keys must be (ecd, d, t), (ecd, l, d, t) or (ecd, l, y, d, t)")
+        demand = LabeledArray.from_dict(demand, axes, labels)
+    elif any(demand.labels[demand.axis(a)] != labels[a] for a in demand.axes):
+        # Align the labels (order and missing entries) with the model sets
+        demand = LabeledArray.from_series(demand.to_series(), demand.axes, labels)
+    return demand.broadcast(DEMAND_AXES, labels)
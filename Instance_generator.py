@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic, scalable input dictionaries (ehr_inp) for the EnergyHubRetrofit model
+
+The generated instances follow the structure of EHret_example_Paper.py
+(same energy carriers, cost/efficiency ranges and naming scheme) and are
+reproducible for a given seed:
+
+    import Instance_generator as ig
+    ehr_inp = ig.generate_instance(n_locations=4, n_days=7, n_years=4, n_stages=2, seed=1)
+    mod = ehr.EnergyHubRetrofit(ehr_inp, invStage=0, optim_mode=1)
+"""
+
+import string
+from itertools import permutations as pm
+
+import numpy as np
+
+# Location codes used in the location ("LocA") and connection ("Loc_ab") names
+LOCATION_CODES = string.ascii_lowercase + string.digits
+
+# Candidate technologies: conversion factor (carrier: factor), linear cost, fixed cost, lifetime, yearly degradation, O&M
+DISPATCHABLE_CATALOGUE = [
+    ("ASHP", {"Heat": 3.0}, 1530, 6830, 20, 0.01, 0.02),
+    ("GSHP", {"Heat": 4.0}, 2170, 9070, 20, 0.01, 0.02),
+    ("Gas_Boiler", {"Heat": 0.9}, 640, 11920, 20, 0.02, 0.015),
+    ("Oil_Boiler", {"Heat": 0.9}, 540, 15890, 20, 0.005, 0.015),
+    ("Bio_Boiler", {"Heat": 0.9}, 1150, 24940, 20, 0.005, 0.015),
+    ("CHP", {"Heat": 0.6}, 3100, 43450, 20, 0.005, 0.015),
+]
+SOLAR_CATALOGUE = [
+    ("PV", {"Elec": 0.15}, 300, 5750, 20, 0.02, 0.015),
+    ("ST", {"Heat": 0.35}, 1590, 7630, 20, 0.02, 0.015),
+]
+# Linear cost, fixed cost, max charge, max discharge, standing losses, charging eff, discharging eff, max cap, lifetime, O&M
+STORAGE_CATALOGUE = [
+    ("Thermal_storage_tank", "Heat", 12.5, 1685, 0.25, 0.25, 0.01, 0.90, 0.90, 10 ** 8, 20, 0.02),
+    ("Battery", "Elec", 2000, 0, 0.25, 0.25, 0.001, 0.90, 0.90, 10 ** 8, 20, 0.02),
+]
+
+ENERGY_CARRIERS = ["Heat", "Elec", "NatGas", "Oil", "Biomass"]
+IMPORT_PRICES = {"Elec": 0.159, "NatGas": 0.073, "Oil": 0.159, "Biomass": 0.072}
+CARBON_FACTORS = {"Elec": 0.0095, "NatGas": 0.198, "Oil": 0.265, "Biomass": 0.0}
+
+
+def _catalogue(catalogue, n):
+    # First n entries of a catalogue, repeated with a numbered suffix if n exceeds its size
+    entries = []
+    for k in range(n):
+        entry = catalogue[k % len(catalogue)]
+        suffix = "" if k < len(catalogue) else "_" + str(k // len(catalogue) + 1)
+        entries.append((entry[0] + suffix,) + tuple(entry[1:]))
+    return entries
+
+
+def location_names(n_locations):
+    """Location names LocA, LocB, ... and their single character codes"""
+
+    if n_locations > len(LOCATION_CODES):
+        raise ValueError(
+            "At most {} locations can be generated with the Loc_xy connection naming".format(len(LOCATION_CODES))
+        )
+    codes = LOCATION_CODES[:n_locations]
+    return ["Loc" + c.upper() for c in codes], codes
+
+
+def generate_instance(n_locations=2, n_days=14, n_hours=24, n_years=4, n_stages=2,
+                      n_dispatchable=6, n_solar=2, n_storage=2, seed=0, topology=None, n_neighbours=3,
+                      location_demand=False):
+    """
+    Generate a valid ehr_inp dictionary (all demand carriers get the same demand, see Load_balance)
+
+    Inputs to the function:
+    -----------------------
+        * n_locations (default = 2): number of energy system locations (at most 36)
+        * n_days (default = 14): number of typical days
+        * n_hours (default = 24): number of time steps per typical day
+        * n_years (default = 4): number of calendar years
+        * n_stages (default = 2): number of investment stages (at most n_years)
+        * n_dispatchable, n_solar, n_storage: number of dispatchable, solar and storage technologies
+        * seed (default = 0): seed of the random number generator
+        * topology (optional): "complete", "knn" or "delaunay" candidate network graph (see Network_topology); all ordered pairs with Loc_xy names if omitted
+        * n_neighbours (default = 3): number of neighbours of the "knn" topology
+        * location_demand (default = False): a different demand at every location (Input_functions.LabeledArray over ecd, l, d, t) instead of the same demand everywhere
+    """
+
+    if n_stages > n_years:
+        raise ValueError("The number of investment stages cannot exceed the number of calendar years")
+
+    rng = np.random.default_rng(seed)
+    inp = dict()
+
+    # Sets
+    # ----
+    locations, codes = location_names(n_locations)
+    years = list(range(1, n_years + 1))
+    stages = list(range(1, n_stages + 1))
+    days = list(range(1, n_days + 1))
+    hours = list(range(1, n_hours + 1))
+    dispatchable = _catalogue(DISPATCHABLE_CATALOGUE, n_dispatchable)
+    solar = _catalogue(SOLAR_CATALOGUE, n_solar)
+    storage = _catalogue(STORAGE_CATALOGUE, n_storage)
+    conversion = dispatchable + solar
+
+    inp["Calendar_years"] = years
+    inp["Days"] = days
+    inp["Time_steps"] = hours
+    inp["Investment_stages"] = stages
+    inp["Energy_system_location"] = locations
+    inp["Energy_carriers"] = list(ENERGY_CARRIERS)
+    inp["Energy_carriers_imp"] = ["Elec", "NatGas", "Oil", "Biomass"]
+    inp["Energy_carriers_exp"] = ["Elec"]
+    inp["Energy_carriers_exc"] = ["Heat"]
+    inp["Energy_carriers_dem"] = ["Heat", "Elec"]
+    inp["Dispatchable_tech"] = [t[0] for t in dispatchable]
+    inp["Solar_tech"] = [t[0] for t in solar]
+    inp["Conversion_tech"] = inp["Dispatchable_tech"] + inp["Solar_tech"]
+    inp["Storage_tech"] = [t[0] for t in storage]
+    inp["Retrofit_scenarios"] = ["Noretrofit"]
+
+    # Network connections between all ordered pairs of locations
+    # -----------------------------------------------------------
+    coordinates = rng.uniform(0, 300, size=(n_locations, 2))
+    inp["combineLocations"] = []
+    inp["Distance_area"] = dict()
+    for (i, a), (j, b) in pm(enumerate(codes), 2):
+        arc = "Loc_" + a + b
+        inp["combineLocations"].append(arc)
+        inp["Distance_area"][arc] = float(np.round(np.hypot(*(coordinates[i] - coordinates[j])), 1)) + 10
+    inp["Location_coordinates"] = {l: tuple(coordinates[k]) for k, l in enumerate(locations)}
+    if topology is not None:
+        import Network_topology as nt
+
+        inp = nt.apply_topology(inp, topology, k=n_neighbours)
+
+    # Time series
+    # -----------
+    weights = np.full(n_days, 365 // n_days)
+    weights[: 365 % n_days] += 1
+    inp["Number_of_days"] = {d: int(weights[k]) for k, d in enumerate(days)}
+    inp["Amount_of_calendar_days"] = n_days
+    inp["C_to_T"] = {c: int(rng.integers(1, n_days + 1)) for c in range(1, 366)}
+
+    season = np.cos(2 * np.pi * (np.arange(n_days) + 0.5) / n_days)  # 1 in winter, -1 in summer
+    hour = (np.arange(n_hours) + 0.5) * 24 / n_hours
+    heat_shape = 1 + 0.3 * np.cos(2 * np.pi * (hour - 7) / 24)
+    elec_shape = 0.6 + 0.4 * np.exp(-((hour - 19) / 3) ** 2) + 0.2 * np.exp(-((hour - 8) / 2) ** 2)
+    heat = (90 + 60 * season)[:, None] * heat_shape[None, :] * rng.uniform(0.9, 1.1, (n_days, n_hours))
+    elec = 20 * elec_shape[None, :] * rng.uniform(0.85, 1.15, (n_days, n_hours))
+    # Load_balance holds for every combination of energy carrier and demand carrier, so the model is only
+    # feasible if all demand carriers have the same demand: every carrier gets the combined profile
+    heat = elec = heat + elec
+    if location_demand:
+        import Input_functions as inf
+
+        # Building size relative to the example building and a random load profile noise per location
+        scale = rng.uniform(0.3, 2.0, n_locations)
+        noise = rng.uniform(0.9, 1.1, (1, n_locations, n_days, n_hours))
+        values = np.stack([heat, elec])[:, None, :, :] * scale[None, :, None, None] * noise
+        inp["Energy_demand"] = inf.LabeledArray(
+            values, [["Heat", "Elec"], locations, days, hours], ("ecd", "l", "d", "t")
+        )
+    else:
+        inp["Energy_demand"] = dict()
+        for k, d in enumerate(days):
+            for h, t in enumerate(hours):
+                inp["Energy_demand"][("Heat", d, t)] = float(heat[k, h])
+                inp["Energy_demand"][("Elec", d, t)] = float(elec[k, h])
+
+    daylight = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, None)
+    inp["P_solar"] = dict()
+    for l in locations:
+        clouds = rng.uniform(0.5, 1.0, (n_years, n_days, 1))
+        radiation = 0.8 * daylight[None, None, :] * (0.7 - 0.3 * season)[None, :, None] * clouds
+        for i, y in enumerate(years):
+            for k, d in enumerate(days):
+                for h, t in enumerate(hours):
+                    inp["P_solar"][(l, y, d, t)] = float(radiation[i, k, h])
+
+    # Technologies
+    # ------------
+    inp["Conv_factor"] = {
+        (t[0], ec, w): factor for t in conversion for ec, factor in t[1].items() for w in stages
+    }
+    inp["Lifetime_tech"] = {t[0]: t[4] for t in conversion}
+    inp["Yearly_degradation_coefficient"] = {t[0]: t[5] for t in conversion}
+    inp["Omc_cost"] = {t[0]: t[6] for t in conversion}
+    inp["Minimum_part_load"] = {t[0]: 0.0 for t in dispatchable}
+
+    decline = (1 - 0.03) ** np.arange(n_years)
+    inp["Linear_conv_costs"] = {
+        (t[0], y): float(t[2] * decline[i] * rng.uniform(0.95, 1.05)) for t in conversion for i, y in enumerate(years)
+    }
+    inp["Fixed_conv_costs"] = {
+        (t[0], y): float(t[3] * decline[i]) for t in conversion for i, y in enumerate(years)
+    }
+
+    inp["Linear_stor_costs"] = {(s[0], y): float(s[2] * decline[i]) for s in storage for i, y in enumerate(years)}
+    inp["Fixed_stor_costs"] = {(s[0], w): float(s[3]) for s in storage for w in stages}
+    inp["Storage_max_charge"] = {s[0]: s[4] for s in storage}
+    inp["Storage_max_discharge"] = {s[0]: s[5] for s in storage}
+    inp["Storage_standing_losses"] = {s[0]: s[6] for s in storage}
+    inp["Storage_charging_eff"] = {s[0]: s[7] for s in storage}
+    inp["Storage_discharging_eff"] = {s[0]: s[8] for s in storage}
+    inp["Storage_max_cap"] = {s[0]: s[9] for s in storage}
+    inp["Lifetime_stor"] = {s[0]: s[10] for s in storage}
+    inp["Oms_cost"] = {s[0]: s[11] for s in storage}
+    inp["Yearly_degradation_coefficient_chdc"] = {s[0]: 0.0 for s in storage}
+    inp["Storage_tech_coupling"] = {(s[0], s[1]): 1.0 for s in storage}
+
+    # Network, buildings and economics
+    # --------------------------------
+    inp["Network_loses_per_m"] = {"Heat": 0.001}
+    inp["Alpha"], inp["Beta"], inp["Gamma"], inp["Delta"] = 0.073, 32.2, 6.49, 168.4
+    inp["Network_lifetime"] = 40
+    inp["Network_efficiency"] = {"Heat": 0.90, "Elec": 1.00}
+    inp["Network_length"] = 200
+    inp["Network_inv_cost_per_m"] = 800
+
+    inp["Floor_area"] = {l: float(rng.uniform(5000, 40000)) for l in locations}
+    inp["Roof_area"] = 1260
+    inp["Biomass"] = {y: 201.157 for y in years}
+
+    inp["Retrofit_inv_costs"] = 1
+    inp["Lifetime_retrofit"] = 40
+    inp["Discount_rate"] = 0.05
+
+    growth = (1 + 0.02) ** np.arange(n_years)
+    inp["Import_prices"] = {
+        (ec, y): float(price * growth[i] * rng.uniform(0.97, 1.03))
+        for ec, price in IMPORT_PRICES.items() for i, y in enumerate(years)
+    }
+    inp["Export_prices"] = {("Elec", y): float(0.106 * growth[i]) for i, y in enumerate(years)}
+    inp["Carbon_factors_import"] = {
+        (ec, y): float(factor) for ec, factor in CARBON_FACTORS.items() for y in years
+    }
+
+    return inp
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Phase-level timing and memory instrumentation for EnergyHubRetrofit
+
+A Profiler records nested spans (name, category, wall time, RSS delta and,
+optionally, tracemalloc allocation deltas). EnergyHubRetrofit(..., instrument=True)
+uses it to time
+    * the construction of every model component (each pe.Set/Param/Var/Constraint/...)
+    * the LP writer, the solver run and the solution loading of every solve call
+    * store_to, get_all_vars and the result writers
+
+The spans are reported as a JSON document plus a summary table, and can be
+written as OpenTelemetry-style spans (one JSON object per line) to a local file.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import functools
+import contextlib
+
+import pyomo.environ as pe
+
+
+def current_rss_mb():
+    """Current resident set size of the process in MB (None if it cannot be determined)"""
+
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+class Profiler:
+    """Collects nested timing/memory spans"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+        self._stack = []
+        self._peaks = []
+        if trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextlib.contextmanager
+    def span(self, name, category="phase", **attributes):
+        """Context manager timing the enclosed block as a span"""
+
+        record = {
+            "name": name,
+            "category": category,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": self._stack[-1]["span_id"] if self._stack else None,
+            "attributes": attributes,
+        }
+        self._stack.append(record)
+        rss_start = current_rss_mb()
+        if self.trace_memory:
+            import tracemalloc
+            mem_start, peak = tracemalloc.get_traced_memory()
+            # Running peak of every open span: the peak so far is folded into the parent before the reset
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(mem_start)
+        record["start_time_unix_nano"] = time.time_ns()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration_s"] = time.perf_counter() - start
+            record["end_time_unix_nano"] = record["start_time_unix_nano"] + int(record["duration_s"] * 1e9)
+            rss_end = current_rss_mb()
+            record["rss_mb"] = rss_end
+            record["rss_delta_mb"] = None if rss_start is None or rss_end is None else rss_end - rss_start
+            if self.trace_memory:
+                import tracemalloc
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(self._peaks.pop(), peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                tracemalloc.reset_peak()
+                record["alloc_delta_mb"] = (current - mem_start) / 1024 ** 2
+                record["alloc_peak_mb"] = (peak - mem_start) / 1024 ** 2
+            self._stack.pop()
+            self.spans.append(record)
+
+    def wrap(self, func, name, category="phase"):
+        """Wrap func so that every call is recorded as a span"""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span(name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def report(self):
+        """Structured report: all spans plus totals per category and per span name"""
+
+        totals = dict()
+        for s in self.spans:
+            key = (s["category"], s["name"])
+            entry = totals.setdefault(key, {"category": s["category"], "name": s["name"], "calls": 0,
+                                            "duration_s": 0.0, "rss_delta_mb": 0.0})
+            entry["calls"] += 1
+            entry["duration_s"] += s["duration_s"]
+            entry["rss_delta_mb"] += s["rss_delta_mb"] or 0.0
+            if "alloc_delta_mb" in s:
+                entry["alloc_delta_mb"] = entry.get("alloc_delta_mb", 0.0) + s["alloc_delta_mb"]
+        by_category = dict()
+        for entry in totals.values():
+            by_category[entry["category"]] = by_category.get(entry["category"], 0.0) + entry["duration_s"]
+        return {
+            "trace_id": self.trace_id,
+            "totals": sorted(totals.values(), key=lambda e: -e["duration_s"]),
+            "by_category": by_category,
+            "spans": self.spans,
+        }
+
+    def summary_table(self, top=None):
+        """Summary table (pandas DataFrame) of the total time and memory per span name"""
+
+        import pandas as pd
+
+        table = pd.DataFrame(self.report()["totals"])
+        return table.head(top) if top is not None else table
+
+    def write_json(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.report(), file, indent=4, default=str)
+
+    def write_spans(self, filename):
+        """Write the spans as OpenTelemetry-style JSON lines (one span per line)"""
+
+        with open(filename, "w") as file:
+            for s in self.spans:
+                attributes = {"category": s["category"], "rss_delta_mb": s["rss_delta_mb"]}
+                attributes.update({k: s[k] for k in ("alloc_delta_mb", "alloc_peak_mb") if k in s})
+                attributes.update(s["attributes"])
+                file.write(json.dumps({
+                    "trace_id": self.trace_id,
+                    "span_id": s["span_id"],
+                    "parent_span_id": s["parent_id"],
+                    "name": s["name"],
+                    "start_time_unix_nano": s["start_time_unix_nano"],
+                    "end_time_unix_nano": s["end_time_unix_nano"],
+                    "attributes": attributes,
+                }, default=str) + "\n")
+
+
+class InstrumentedModel(pe.ConcreteModel):
+    """ConcreteModel that records the construction of every added component as a span"""
+
+    def __init__(self, profiler, *args, **kwargs):
+        self._profiler = profiler
+        super().__init__(*args, **kwargs)
+
+    def add_component(self, name, val):
+        ctype = getattr(val, "ctype", None)
+        with self._profiler.span(name, category=getattr(ctype, "__name__", type(val).__name__),
+                                 indexed=val.is_indexed() if hasattr(val, "is_indexed") else None):
+            super().add_component(name, val)
+
+
+def instrument_solver(optimizer, profiler):
+    """
+    Record the writer (_presolve), solver (_apply_solver) and reader (_postsolve) phases of a
+    pyomo solver plugin as spans. Solver interfaces without these phases are timed as a whole.
+    """
+
+    for method, name, category in (("_presolve", "write_problem", "writer"),
+                                   ("_apply_solver", "run_solver", "solver"),
+                                   ("_postsolve", "read_results", "reader")):
+        if hasattr(optimizer, method):
+            setattr(optimizer, method, profiler.wrap(getattr(optimizer, method), name, category))
+    optimizer.solve = profiler.wrap(optimizer.solve, "solve", "solve")
+    return optimizer
+
+
+def print_summary(profiler, top=25, file=sys.stdout):
+    table = profiler.summary_table(top)
+    if len(table):
+        print(table.to_string(index=False, float_format=lambda x: "{:.4f}".format(x)), file=file)
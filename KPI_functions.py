@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Key performance indicators (KPIs) of solved energy hub models
+
+The KPIs are computed with NumPy group-by operations (bincount/maximum.at over
+factorised index codes) on the variable data frames returned by
+Output_functions.get_all_vars or Results_store.read_point. Time-step values are
+weighted by the Number_of_days of their typical day. Sparse frames (zero
+entries dropped) are supported.
+
+Every KPI is returned as a row of a tidy table with the columns
+point, l (location, arc or "All"), kpi and value:
+
+    * levelised_cost: Total_cost per kWh of end-user demand over the horizon ("All" only)
+    * demand: weighted end-user demand (location and year resolved if the Energy_demand input is)
+    * self_sufficiency: 1 - imported end-use energy / end-user demand (clipped to [0, 1]); only the imports
+      of the demand carriers (Energy_carriers_dem, e.g. grid electricity) count, fuel imports converted on
+      site (e.g. natural gas, biomass) do not
+    * pv_self_consumption: 1 - exported electricity / solar electricity generation
+    * storage_cycles:<stor_tech>: equivalent full cycles per year (discharged energy / installed capacity / years)
+    * peak_import:<eci>: maximum hourly import of energy carrier eci
+    * network_utilisation: average exchanged flow / peak flow of each arc (l is the arc)
+    * carbon: carbon emissions due to imports
+"""
+
+import numpy as np
+import pandas as pd
+
+KPI_COLUMNS = ["point", "l", "kpi", "value"]
+
+
+def _level(df, name):
+    return df.index.get_level_values(name)
+
+
+def _values(df):
+    return df["Value"].to_numpy(dtype=float)
+
+
+def _day_weights(inp, days):
+    # Number_of_days of each typical day, default 1 (as the Number_of_days param)
+    weights = inp.get("Number_of_days", {})
+    if not isinstance(weights, dict):
+        weights = {}
+    days = np.asarray(days)
+    uniq, inverse = np.unique(days, return_inverse=True)
+    lookup = np.array([float(weights.get(d, 1)) for d in uniq.tolist()])
+    return lookup[inverse]
+
+
+def _keys(*levels):
+    # Composite group-by key of several index levels
+    return pd.MultiIndex.from_arrays([np.asarray(level) for level in levels])
+
+
+def _group_sum(keys, values, uniques=None):
+    # Sum of values per key (NumPy bincount over factorised keys)
+    codes, found = pd.factorize(keys, sort=True)
+    sums = np.bincount(codes, weights=values, minlength=len(found))
+    res = pd.Series(sums, index=found)
+    if uniques is not None:
+        res = res.reindex(uniques, fill_value=0.0)
+    return res
+
+
+def _group_max(keys, values, uniques=None):
+    # Maximum of values per key (NumPy maximum.at over factorised keys)
+    codes, found = pd.factorize(keys, sort=True)
+    maxima = np.zeros(len(found))
+    np.maximum.at(maxima, codes, values)
+    res = pd.Series(maxima, index=found)
+    if uniques is not None:
+        res = res.reindex(uniques, fill_value=0.0)
+    return res
+
+
+def _demand_per_location(inp, locations):
+    # Weighted end-user demand per location over all calendar years
+    import Input_functions as inf
+
+    demand = inf.demand_array(inp)
+    weights = _day_weights(inp, demand.labels[demand.axis("d")])
+    totals = np.einsum("elydt,d->l", demand.values, weights)
+    return pd.Series(totals, index=demand.labels[demand.axis("l")]).reindex(locations, fill_value=0.0)
+
+
+def _degradation(inp, techs, stages, years):
+    # Total degradation coefficient of every (tech, stage, year) row, see Model_coefficients.degradation
+    import Model_coefficients as mc
+
+    tech_codes, tech_labels = pd.factorize(np.asarray(techs))
+    stage_codes, stage_labels = pd.factorize(np.asarray(stages))
+    year_codes, year_labels = pd.factorize(np.asarray(years))
+    deg = [inp.get("Yearly_degradation_coefficient", {}).get(c, 0.0) for c in tech_labels]
+    life = [inp["Lifetime_tech"][c] for c in tech_labels]
+    cube = mc.degradation(deg, life, stage_labels, year_labels)
+    return cube[tech_codes, stage_codes, year_codes]
+
+
+def compute_kpis(all_vars, inp, point=0):
+    """
+    Compute the KPIs of one objective point
+
+    Inputs to the function:
+    -----------------------
+        * all_vars: dictionary of variable data frames (Output_functions.get_all_vars or Results_store.read_point)
+        * inp: the input dictionary the model was built with (ehr_inp)
+        * point (default = 0): objective/Pareto point number used in the point column
+    """
+
+    locations = list(inp["Energy_system_location"])
+    years = list(inp["Calendar_years"])
+    rows = []
+
+    def add(l, kpi, value):
+        rows.append((point, l, kpi, float(value)))
+
+    # Imports, carbon and peaks
+    # -------------------------
+    imp = all_vars["P_import"]
+    imp_vals = _values(imp)
+    imp_w = imp_vals * _day_weights(inp, _level(imp, "d"))
+    # Imports of end-use carriers only: fuel imports (e.g. NatGas, Biomass) are converted on site
+    end_use = np.isin(np.asarray(_level(imp, "eci")), list(inp["Energy_carriers_dem"]))
+    imports = _group_sum(_level(imp, "l")[end_use], imp_w[end_use], locations)
+
+    carbon_factors = inp["Carbon_factors_import"]
+    eci, y = _level(imp, "eci"), _level(imp, "y")
+    inverse, pairs = pd.factorize(_keys(eci, y))
+    factors = np.array([float(carbon_factors.get(k, 0.0)) for k in pairs])
+    carbon = _group_sum(_level(imp, "l"), imp_w * factors[inverse], locations)
+    peak = _group_max(_keys(eci, _level(imp, "l")), imp_vals)
+
+    # Demand, self-sufficiency and levelised cost
+    # -------------------------------------------
+    demand = _demand_per_location(inp, locations)
+    for l in locations:
+        add(l, "demand", demand[l])
+        ratio = imports[l] / demand[l] if demand[l] > 0 else 0.0
+        add(l, "self_sufficiency", 1 - min(max(ratio, 0.0), 1.0))
+        add(l, "carbon", carbon[l])
+    for (carrier, l), value in peak.items():
+        add(l, "peak_import:" + carrier, value)
+
+    total_demand = float(demand.sum())
+    total_cost = float(_values(all_vars["Total_cost"]).sum()) if "Total_cost" in all_vars else np.nan
+    add("All", "demand", total_demand)
+    add("All", "carbon", carbon.sum())
+    add("All", "levelised_cost", total_cost / total_demand if total_demand > 0 else np.nan)
+
+    # PV self-consumption
+    # -------------------
+    conv = all_vars["P_conv"]
+    solar = [c for c in inp.get("Solar_tech", []) if any(
+        k[0] == c and k[1] == "Elec" for k in inp["Conv_factor"])]
+    mask = np.isin(np.asarray(_level(conv, "conv_tech")), solar)
+    sol = conv[mask]
+    if len(sol):
+        techs = np.asarray(_level(sol, "conv_tech"))
+        stages = np.asarray(_level(sol, "w"))
+        factor = np.array([inp["Conv_factor"].get((c, "Elec", w), 0.0) for c, w in zip(techs.tolist(), stages.tolist())])
+        gen = _values(sol) * factor * _degradation(inp, techs, stages, _level(sol, "y")) \
+            * _day_weights(inp, _level(sol, "d"))
+        generation = _group_sum(_level(sol, "l"), gen, locations)
+    else:
+        generation = pd.Series(0.0, index=locations)
+    exp = all_vars.get("P_export")
+    if exp is not None and len(exp):
+        elec = np.asarray(_level(exp, "ece")) == "Elec"
+        exports = _group_sum(_level(exp, "l")[elec],
+                             (_values(exp) * _day_weights(inp, _level(exp, "d")))[elec], locations)
+    else:
+        exports = pd.Series(0.0, index=locations)
+    for l in locations:
+        if generation[l] > 0:
+            add(l, "pv_self_consumption", 1 - min(exports[l] / generation[l], 1.0))
+
+    # Storage cycles
+    # --------------
+    qout, cap = all_vars["Qout"], all_vars["Storage_cap"]
+    discharged = _group_sum(
+        _keys(_level(qout, "l"), _level(qout, "stor_tech")),
+        _values(qout) * _day_weights(inp, _level(qout, "d")),
+    )
+    capacity = _group_sum(_keys(_level(cap, "l"), _level(cap, "stor_tech")), _values(cap))
+    for (l, stor), value in capacity.items():
+        if value > 0:
+            add(l, "storage_cycles:" + stor, discharged.get((l, stor), 0.0) / value / len(years))
+
+    # Network utilisation
+    # -------------------
+    exc = all_vars.get("P_exchange")
+    if exc is not None and len(exc):
+        arcs = _level(exc, "arc")
+        flows = _values(exc)
+        weights = _day_weights(inp, _level(exc, "d"))
+        energy = _group_sum(arcs, flows * weights)
+        peak_flow = _group_max(arcs, flows)
+        hours = float(np.sum(_day_weights(inp, list(inp["Days"])))) * len(inp["Time_steps"]) * len(years)
+        for arc in energy.index:
+            if peak_flow[arc] > 0:
+                add(arc, "network_utilisation", energy[arc] / (peak_flow[arc] * hours))
+
+    return pd.DataFrame(rows, columns=KPI_COLUMNS)
+
+
+def compute_kpis_batch(points, inp):
+    """
+    Compute the KPIs of many objective points/scenarios into a single tidy table
+
+    Inputs to the function:
+    -----------------------
+        * points: list of all_vars dictionaries (e.g. the all_vars list of a multi-objective run) or a dictionary {point: all_vars}
+        * inp: the input dictionary the models were built with, or a list of input dictionaries (one per point, in the order of points)
+    """
+
+    if not isinstance(points, dict):
+        points = dict(enumerate(points))
+    tables = []
+    for k, (point, all_vars) in enumerate(points.items()):
+        if all_vars is None:
+            continue
+        point_inp = inp[k] if isinstance(inp, (list, tuple)) else inp
+        tables.append(compute_kpis(all_vars, point_inp, point))
+    if not tables:
+        return pd.DataFrame(columns=KPI_COLUMNS)
+    return pd.concat(tables, ignore_index=True)
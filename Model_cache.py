@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Disk cache of built energy hub models as MPS files
+
+With the same structural inputs (everything but MUTABLE_PARAMS) and model
+options, create_model builds the same model and the solver interface writes
+the same problem file on every run. The cache stores, under a hash of the
+structural inputs and the model options (see Model_service.structural_hash):
+    * model.mps: the problem with symbolic names
+    * columns.parquet: the model variable (component and index) of every MPS column
+    * patches.parquet: every coefficient that depends on a mutable parameter, as
+      offset + sum(multiplier * parameter value) per (row, column)
+    * meta.json: model options, objective and index names (written last, marks a complete entry)
+A later run with the same structure reads the MPS file straight into the
+solver, patches the price and cost coefficients of its own inputs and solves,
+without building the Pyomo model or writing a problem file:
+
+    res = solve_cached(ehr_inp, {"invStage": 0, "optim_mode": 1}, "model_cache", solver="highs")
+    res["objective"], res["all_vars"]["Conv_cap"]
+
+Supported solvers: "highs" (highspy) and "gurobi" (gurobipy).
+"""
+
+import os
+import json
+import time
+import shutil
+
+import pandas as pd
+import pyomo.environ as pe
+
+MPS_NAME = "model.mps"
+COLUMNS_NAME = "columns.parquet"
+PATCHES_NAME = "patches.parquet"
+META_NAME = "meta.json"
+
+
+def _index_key(index):
+    # JSON text of a component index (None for scalar components)
+    return json.dumps(list(index) if isinstance(index, tuple) else index)
+
+
+def _index_value(text):
+    index = json.loads(text)
+    return tuple(index) if isinstance(index, list) else index
+
+
+def _coefficient_terms(coef, params):
+    # Coefficient depending on the mutable parameters params: offset + sum(multiplier * value), by finite
+    # differences of the (linear) parameter dependence
+    base = pe.value(coef)
+    terms = []
+    for param in params:
+        value = pe.value(param)
+        param.set_value(value + 1.0)
+        terms.append((param, pe.value(coef) - base))
+        param.set_value(value)
+    return base - sum(multiplier * pe.value(param) for param, multiplier in terms), terms
+
+
+def _patch_rows(m, smap):
+    # One row (row, column, param, index, multiplier, offset) per mutable parameter of every patched coefficient
+    from pyomo.core.expr.visitor import identify_mutable_parameters
+    from pyomo.repn.standard_repn import generate_standard_repn
+
+    row_names = dict()
+    for alias, obj in smap.aliases.items():
+        row_names.setdefault(id(obj), []).append(alias)
+    rows = []
+    objective = next(m.component_data_objects(pe.Objective, active=True))
+    datas = [(objective, [smap.getSymbol(objective)], objective.expr)]
+    for cdata in m.component_data_objects(pe.Constraint, active=True):
+        datas.append((cdata, row_names.get(id(cdata), []), cdata.body))
+    for data, names, expr in datas:
+        if next(identify_mutable_parameters(expr), None) is None:
+            continue
+        repn = generate_standard_repn(expr, compute_values=False, quadratic=False)
+        if list(identify_mutable_parameters(repn.constant)):
+            raise ValueError("The constant of " + data.name + " depends on a mutable parameter")
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            params = list(identify_mutable_parameters(coef))
+            if not params:
+                continue
+            offset, terms = _coefficient_terms(coef, params)
+            column = smap.getSymbol(var)
+            for name in names:
+                for param, multiplier in terms:
+                    rows.append([name, column, param.parent_component().local_name, _index_key(param.index()),
+                                 multiplier, offset])
+    return pd.DataFrame(rows, columns=["row", "column", "param", "index", "multiplier", "offset"])
+
+
+def store_model(mod, folder, model_options=None, objective="Cost_obj"):
+    """
+    Write a built model to the cache folder (MPS file, column and patch tables, metadata)
+
+    Inputs to the function:
+    -----------------------
+        * mod: EnergyHubRetrofit instance built with mutable_params=MUTABLE_PARAMS (create_model called)
+        * folder: cache entry folder (replaced if it exists)
+        * model_options (optional): dictionary of EnergyHubRetrofit arguments, stored with the entry
+        * objective (default = "Cost_obj"): objective written to the MPS file
+    """
+
+    import EnergyHubRetrofit_Paper as ehr
+    import Output_functions as of
+
+    if set(ehr.MUTABLE_PARAMS) - set(mod.mutable_params):
+        raise ValueError("The model must be built with mutable_params=MUTABLE_PARAMS to be cached")
+    m = mod.m
+    active = {o.local_name: o.active for o in m.component_objects(pe.Objective)}
+    for o in m.component_objects(pe.Objective):
+        o.activate() if o.local_name == objective else o.deactivate()
+    tmp = folder + ".tmp" + str(os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        _, smap_id = m.write(os.path.join(tmp, MPS_NAME), format="mps",
+                             io_options={"symbolic_solver_labels": True})
+        smap = m.solutions.symbol_map[smap_id]
+        patches = _patch_rows(m, smap)
+    finally:
+        for o in m.component_objects(pe.Objective):
+            o.activate() if active[o.local_name] else o.deactivate()
+
+    columns, index_names = [], dict()
+    for symbol, obj in smap.bySymbol.items():
+        if obj.ctype is not pe.Var:
+            continue
+        component = obj.parent_component()
+        columns.append([symbol, component.local_name, _index_key(obj.index())])
+        index_names.setdefault(component.local_name, of.get_index_names(component))
+    pd.DataFrame(columns, columns=["column", "component", "index"]).to_parquet(os.path.join(tmp, COLUMNS_NAME))
+    patches.to_parquet(os.path.join(tmp, PATCHES_NAME))
+    meta = {"model_options": model_options or {}, "objective": objective, "index_names": index_names,
+            "columns": len(columns), "patches": len(patches), "created": time.time()}
+    with open(os.path.join(tmp, META_NAME), "w") as file:
+        json.dump(meta, file, indent=4, default=str)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+    return meta
+
+
+def read_meta(folder):
+    """Metadata of a complete cache entry (None if the entry does not exist)"""
+
+    path = os.path.join(folder, META_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def patch_values(patches, inp):
+    """Data frame (row, column, value) of the patched coefficients for the mutable parameter values of inp"""
+
+    values = []
+    for param, index in zip(patches["param"], patches["index"]):
+        data = inp.get(param, {})
+        values.append(float(data.get(_index_value(index), 0.0)) if hasattr(data, "get") else float(data))
+    res = patches.assign(value=patches["multiplier"].to_numpy() * values)
+    res = res.groupby(["row", "column"], sort=False).agg(value=("value", "sum"), offset=("offset", "first"))
+    res["value"] += res.pop("offset")
+    return res.reset_index()
+
+
+class _HighsModel:
+    # Cached model loaded into highspy
+
+    def __init__(self, path, tee):
+        import highspy
+
+        self.h = highspy.Highs()
+        self.h.setOptionValue("output_flag", bool(tee))
+        self.h.readModel(path)
+
+    def set_coefficients(self, values, objective_row):
+        for row, column, value in values[["row", "column", "value"]].itertuples(index=False):
+            col = self.h.getColByName(column)[1]
+            if row == objective_row:
+                self.h.changeColCost(col, value)
+            else:
+                self.h.changeCoeff(self.h.getRowByName(row)[1], col, value)
+
+    def solve(self, mip_gap, time_limit, options):
+        self.h.setOptionValue("mip_rel_gap", mip_gap)
+        self.h.setOptionValue("time_limit", float(time_limit))
+        for key, value in options.items():
+            self.h.setOptionValue(key, value)
+        self.h.run()
+        status = self.h.modelStatusToString(self.h.getModelStatus())
+        return status, self.h.getInfo().objective_function_value
+
+    def values(self):
+        names = self.h.getLp().col_names_
+        return dict(zip(names, self.h.getSolution().col_value))
+
+
+class _GurobiModel:
+    # Cached model loaded into gurobipy
+
+    def __init__(self, path, tee):
+        import gurobipy as gp
+
+        self.model = gp.read(path)
+        self.model.Params.OutputFlag = int(bool(tee))
+
+    def set_coefficients(self, values, objective_row):
+        for row, column, value in values[["row", "column", "value"]].itertuples(index=False):
+            var = self.model.getVarByName(column)
+            if row == objective_row:
+                var.Obj = value
+            else:
+                self.model.chgCoeff(self.model.getConstrByName(row), var, value)
+
+    def solve(self, mip_gap, time_limit, options):
+        self.model.Params.MIPGap = mip_gap
+        self.model.Params.TimeLimit = time_limit
+        for key, value in options.items():
+            self.model.setParam(key, value)
+        self.model.optimize()
+        return str(self.model.Status), self.model.ObjVal if self.model.SolCount > 0 else None
+
+    def values(self):
+        return {var.VarName: var.X for var in self.model.getVars()}
+
+
+SOLVERS = {"highs": _HighsModel, "gurobi": _GurobiModel}
+
+
+def solve_cached(inp, model_options=None, cache_folder="model_cache", solver="highs", solver_options=None,
+                 mip_gap=0.001, time_limit=10 ** 8, objective="Cost_obj", tee=False):
+    """
+    Solve the model of inp from the MPS cache, building and storing it first if its structure is not cached
+
+    Inputs to the function:
+    -----------------------
+        * inp: input dictionary
+        * model_options (optional): dictionary of EnergyHubRetrofit arguments (invStage, optim_mode, ...);
+          mutable_params is always MUTABLE_PARAMS
+        * cache_folder (default = "model_cache"): folder of the cache entries
+        * solver (default = "highs"): "highs" or "gurobi"
+        * solver_options (optional), mip_gap (default = 0.001), time_limit (default = 10 ** 8): solver settings
+        * objective (default = "Cost_obj"): objective of the cached model
+        * tee (default = False): show the solver output
+
+    Returns a dictionary with the cache key, whether the entry was cached, the build, load and solve times,
+    the solver status, the objective value and all_vars (variable data frames in the layout of
+    Output_functions.get_all_vars)
+    """
+
+    import EnergyHubRetrofit_Paper as ehr
+    import Model_service as ms
+
+    model_options = dict({"invStage": 0, "optim_mode": 1}, **(model_options or {}))
+    model_options["mutable_params"] = ehr.MUTABLE_PARAMS
+    key = ms.structural_hash(inp, dict(model_options, objective=objective))
+    folder = os.path.join(cache_folder, key)
+    res = {"key": key, "cached": True, "build_time": 0.0}
+
+    meta = read_meta(folder)
+    if meta is None:
+        start = time.perf_counter()
+        mod = ehr.EnergyHubRetrofit(inp, **model_options)
+        mod.create_model()
+        meta = store_model(mod, folder, model_options, objective)
+        res.update(cached=False, build_time=time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model = SOLVERS[solver](os.path.join(folder, MPS_NAME), tee)
+    patches = pd.read_parquet(os.path.join(folder, PATCHES_NAME))
+    model.set_coefficients(patch_values(patches, inp), meta["objective"])
+    res["load_time"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    res["status"], res["objective"] = model.solve(mip_gap, time_limit, solver_options or {})
+    res["solve_time"] = time.perf_counter() - start
+    res["all_vars"] = solution_frames(model.values(), folder, meta)
+    return res
+
+
+def solution_frames(values, folder, meta=None):
+    """Variable data frames (layout of Output_functions.get_all_vars) of a dictionary MPS column -> value"""
+
+    meta = meta or read_meta(folder)
+    columns = pd.read_parquet(os.path.join(folder, COLUMNS_NAME))
+    columns["value"] = [values.get(column, 0.0) for column in columns["column"]]
+    res = dict()
+    for component, group in columns.groupby("component", sort=False):
+        keys = [_index_value(index) for index in group["index"]]
+        names = meta["index_names"].get(component)
+        if names is None:
+            index = pd.Index(keys)
+        elif len(names) == 1:
+            index = pd.Index(keys, name=names[0])
+        else:
+            index = pd.MultiIndex.from_tuples(keys, names=names)
+        res[component] = pd.DataFrame({"Value": group["value"].to_numpy()}, index=index)
+    return res
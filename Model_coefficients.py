@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed coefficients of the energy hub model
+
+The degradation, salvage, capital recovery and discount coefficients only
+depend on the input data. model_coefficients evaluates them once as NumPy
+arrays over (technology, stage, year) instead of one Python rule call per
+index, together with the products the constraint rules multiply in their
+innermost loops (conversion factor x degradation, storage efficiency x
+degradation). EnergyHubRetrofit initialises the parameters from these arrays
+and puts the products into the constraints as plain floats.
+
+The formulas are those of the model, including the operator precedence of the
+storage salvage value, the discharge rate used as yearly degradation of the
+storage efficiencies and the "+ 1" of the salvage discount factor.
+
+    coefficients = model_coefficients(ehr_inp)
+    coefficients["Total_degradation_coefficient"]["ASHP", 1, 3]
+"""
+
+import numpy as np
+
+
+def _pow(base, exponent):
+    # Element-wise power with the libm pow of Python floats: the SIMD loops of np.power can differ in the last
+    # bit, which would change the model coefficients
+    power = np.frompyfunc(pow, 2, 1)(np.asarray(base, dtype=float), np.asarray(exponent, dtype=float))
+    return np.asarray(power, dtype=float)
+
+
+def _vector(data, labels, default=0.0):
+    # Values of a dictionary label -> value in the order of labels
+    return np.array([data.get(label, default) for label in labels], dtype=float)
+
+
+def degradation(yearly, lifetime, stages, years):
+    """
+    Total degradation coefficient (1 - yearly) ** (y - w) of every technology (rows of yearly and lifetime),
+    stage w and year y within the lifetime of the stage, 1 otherwise
+    """
+
+    w = np.asarray(stages, dtype=float)[None, :, None]
+    y = np.asarray(years, dtype=float)[None, None, :]
+    lifetime = np.asarray(lifetime, dtype=float)[:, None, None]
+    active = (y >= w) & (y <= w + lifetime - 1)
+    return np.where(active, _pow(1 - np.asarray(yearly, dtype=float)[:, None, None], y - w), 1.0)
+
+
+def capital_recovery_factor(rate, lifetime):
+    """Capital recovery factor r (1 + r) ** n / ((1 + r) ** n - 1) of the lifetimes n"""
+
+    lifetime = np.asarray(lifetime, dtype=float)
+    return (rate * _pow(1 + rate, lifetime)) / (_pow(1 + rate, lifetime) - 1)
+
+
+def model_coefficients(inp):
+    """
+    Dictionary name -> LabeledArray (or float) of the precomputed coefficients
+
+    Inputs to the function:
+    -----------------------
+        * inp: EnergyHubRetrofit input dictionary
+
+    Returns the parameters Total_degradation_coefficient (c, w, y), Total_degradation_coefficient_chdc (s, w, y),
+    Salvage_conversion (c, w), Salvage_storage (s, w), CRF_tech (c), CRF_stor (s), CRF_network and CRF_retrofit,
+    the discount factors Investment_discount (w), Operating_discount (y) and Salvage_discount, and the
+    products Conversion_output (c, ec, w, y), Charging_coefficient (s, w, y) and Discharging_coefficient (s, w, y)
+    """
+
+    import Input_functions as inf
+
+    conv, stor = list(inp["Conversion_tech"]), list(inp["Storage_tech"])
+    carriers, stages, years = list(inp["Energy_carriers"]), list(inp["Investment_stages"]), list(inp["Calendar_years"])
+    rate = float(inp["Discount_rate"])
+    max_year = max(years)
+    w = np.asarray(stages, dtype=float)
+    res = dict()
+
+    # Degradation (A1, A2): the storage efficiencies degrade with the maximum discharge rate
+    lifetime_tech = _vector(inp["Lifetime_tech"], conv)
+    lifetime_stor = _vector(inp["Lifetime_stor"], stor)
+    deg = degradation(_vector(inp["Yearly_degradation_coefficient"], conv), lifetime_tech, stages, years)
+    deg_chdc = degradation(_vector(inp["Storage_max_discharge"], stor), lifetime_stor, stages, years)
+    res["Total_degradation_coefficient"] = inf.LabeledArray(deg, [conv, stages, years], ("c", "w", "y"))
+    res["Total_degradation_coefficient_chdc"] = inf.LabeledArray(deg_chdc, [stor, stages, years], ("s", "w", "y"))
+
+    # Salvage shares (A3, A4)
+    salvage_conv = 1 - _pow(1 + rate, max_year + 1 - w[None, :] - lifetime_tech[:, None]) \
+        / (1 - _pow(1 + rate, - lifetime_tech[:, None]))
+    salvage_stor = 1 - _pow(1 + rate, max_year + 1 - w[None, :] - lifetime_stor[:, None]) / 1 \
+        - _pow(1 + rate, - lifetime_stor[:, None])
+    res["Salvage_conversion"] = inf.LabeledArray(salvage_conv, [conv, stages], ("c", "w"))
+    res["Salvage_storage"] = inf.LabeledArray(salvage_stor, [stor, stages], ("s", "w"))
+
+    # Capital recovery factors
+    res["CRF_tech"] = inf.LabeledArray(capital_recovery_factor(rate, lifetime_tech), [conv], ("c",))
+    res["CRF_stor"] = inf.LabeledArray(capital_recovery_factor(rate, lifetime_stor), [stor], ("s",))
+    res["CRF_network"] = float(capital_recovery_factor(rate, inp["Network_lifetime"]))
+    retrofit = list(inp["Retrofit_scenarios"])
+    res["CRF_retrofit"] = inf.LabeledArray(
+        np.full(len(retrofit), capital_recovery_factor(rate, inp["Lifetime_retrofit"])), [retrofit], ("ret",))
+
+    # Discount factors of the investment (A7, A8), operating (A9-A11) and salvage (A12) costs
+    res["Investment_discount"] = inf.LabeledArray(1 / _pow(1 + rate, w - 1), [stages], ("w",))
+    res["Operating_discount"] = inf.LabeledArray(1 / _pow(1 + rate, years), [years], ("y",))
+    res["Salvage_discount"] = 1 / (1 + rate) ** max_year + 1
+
+    # Products of the innermost build loops
+    factor = np.zeros((len(conv), len(carriers), len(stages)))
+    positions = [{label: k for k, label in enumerate(labels)} for labels in (conv, carriers, stages)]
+    for (c, ec, stage), value in inp["Conv_factor"].items():
+        if c in positions[0] and ec in positions[1] and stage in positions[2]:
+            factor[positions[0][c], positions[1][ec], positions[2][stage]] = value
+    res["Conversion_output"] = inf.LabeledArray(
+        factor[:, :, :, None] * deg[:, None, :, :], [conv, carriers, stages, years], ("c", "ec", "w", "y"))
+    res["Charging_coefficient"] = inf.LabeledArray(
+        _vector(inp["Storage_charging_eff"], stor)[:, None, None] * deg_chdc, [stor, stages, years], ("s", "w", "y"))
+    res["Discharging_coefficient"] = inf.LabeledArray(
+        1 / (_vector(inp["Storage_discharging_eff"], stor)[:, None, None] * deg_chdc), [stor, stages, years],
+        ("s", "w", "y"))
+    return res
+
+
+def as_dicts(coefficients):
+    """Dictionaries label (tuple) -> value of the arrays of model_coefficients, for parameter initialisation and lookups"""
+
+    res = dict()
+    for name, value in coefficients.items():
+        if not hasattr(value, "to_dict"):
+            res[name] = value
+        elif len(value.axes) == 1:
+            res[name] = dict(zip(value.labels[0], value.values.tolist()))
+        else:
+            res[name] = value.to_dict()
+    return res
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Dead-component elimination for a built EnergyHubRetrofit model
+
+create_model declares components that no constraint or objective uses (y_on,
+y_retrofit, Retrofit_inv_costs, CRF_*, Network_lifetime, ...), rows that the
+variable domains already imply (exportRuleDef: P_export >= 0 on a nonnegative
+variable) and components declared twice. The presolve pass
+    * removes the variable components that appear in no active constraint or objective
+    * removes the parameters that no live component, rule or method refers to
+    * deactivates the constraint rows on a single variable that are implied by its bounds
+    * reports the components that create_model declares more than once
+so that neither the LP writer nor the solver sees them:
+
+    mod = ehr.EnergyHubRetrofit(ehr_inp, invStage=0, optim_mode=1, presolve=True)
+    mod.create_model()
+    mod.presolve_report
+"""
+
+import ast
+import functools
+import inspect
+import textwrap
+
+import pandas as pd
+import pyomo.environ as pe
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.repn.standard_repn import generate_standard_repn
+
+REPORT_COLUMNS = ["component", "kind", "entries", "action", "reason"]
+
+
+def _is_model(node):
+    # m or self.m
+    return (isinstance(node, ast.Name) and node.id == "m") or \
+        (isinstance(node, ast.Attribute) and node.attr == "m" and isinstance(node.value, ast.Name) and node.value.id == "self")
+
+
+def _references(node):
+    # Component names used as m.NAME / self.m.NAME and plain names (local rules and helpers) below node
+    names = set()
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.Attribute) and _is_model(sub.value):
+            names.add(sub.attr)
+        elif isinstance(sub, ast.Name):
+            names.add(sub.id)
+    return names
+
+
+def _as_list(node):
+    if node is None:
+        return []
+    return node if isinstance(node, list) else [node]
+
+
+def _declared_name(statement):
+    # NAME of a "self.m.NAME = ..." statement
+    if isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+        target = statement.targets[0]
+        if isinstance(target, ast.Attribute) and _is_model(target.value):
+            return target.attr
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def source_graph(cls):
+    """
+    Static dependency graph of the model declarations of cls.create_model
+
+    Returns (declarations, edges, roots): component name -> (source line, branches) of its declarations,
+    name -> names used by its declaration (or by the local function of that name), and the names used by
+    the other statements of create_model and by the other methods of cls. The branches of a declaration are
+    the (if statement, branch) pairs it is nested in.
+    """
+
+    lines, first_line = inspect.getsourcelines(cls.create_model)
+    tree = ast.parse(textwrap.dedent("".join(lines)))
+    declarations, edges, roots = dict(), dict(), set()
+
+    def visit(statements, branches=()):
+        for statement in statements:
+            name = _declared_name(statement)
+            if name is not None:
+                declarations.setdefault(name, []).append((first_line + statement.lineno - 1, branches))
+                edges.setdefault(name, set()).update(_references(statement.value))
+            elif isinstance(statement, ast.FunctionDef):
+                edges.setdefault(statement.name, set()).update(_references(statement))
+            elif isinstance(statement, (ast.If, ast.For, ast.While, ast.With, ast.Try)):
+                for field in ("test", "iter", "items"):
+                    for header in _as_list(getattr(statement, field, None)):
+                        roots.update(_references(header))
+                if isinstance(statement, ast.If):
+                    visit(statement.body, branches + ((id(statement), True),))
+                    visit(statement.orelse, branches + ((id(statement), False),))
+                    continue
+                visit(statement.body, branches)
+                visit(getattr(statement, "orelse", []), branches)
+                visit(getattr(statement, "finalbody", []), branches)
+                for handler in getattr(statement, "handlers", []):
+                    visit(handler.body, branches)
+            else:
+                roots.update(_references(statement))
+
+    visit(tree.body[0].body)
+    for name, member in inspect.getmembers(cls, inspect.isfunction):
+        if name != "create_model":
+            roots.update(_references(ast.parse(textwrap.dedent(inspect.getsource(member)))))
+    return declarations, edges, roots
+
+
+def _exclusive(first, second):
+    # True if two declarations are in different branches of the same if statement
+    return any(dict(first).get(node, side) != side for node, side in second)
+
+
+def duplicate_declarations(cls):
+    """
+    Dictionary component name -> source lines, for the components cls.create_model declares more than once
+    in the same model (declarations in different branches of an if statement are alternatives)
+    """
+
+    res = dict()
+    for name, declared in source_graph(cls)[0].items():
+        lines = sorted({line for i, (line, branches) in enumerate(declared)
+                        for _, other in declared[:i] + declared[i + 1:] if not _exclusive(branches, other)})
+        if lines:
+            res[name] = lines
+    return res
+
+
+def live_names(m, cls):
+    """Names reachable from the active constraints, the objectives and the code outside the model declarations"""
+
+    _, edges, roots = source_graph(cls)
+    stack = list(roots)
+    stack += [c.local_name for c in m.component_objects(pe.Constraint, active=True)]
+    stack += [o.local_name for o in m.component_objects(pe.Objective)]
+    live = set()
+    while stack:
+        name = stack.pop()
+        if name in live:
+            continue
+        live.add(name)
+        stack.extend(edges.get(name, ()))
+    return live
+
+
+def referenced_variables(m):
+    """Ids of the variables appearing in an active constraint or in an objective"""
+
+    referenced = set()
+    for cdata in m.component_data_objects(pe.Constraint, active=True):
+        referenced.update(id(v) for v in identify_variables(cdata.body, include_fixed=True))
+    for odata in m.component_data_objects(pe.Objective):
+        referenced.update(id(v) for v in identify_variables(odata.expr, include_fixed=True))
+    return referenced
+
+
+def _implied(cdata, tol):
+    # True if the row only involves one variable and is implied by its bounds (or involves none and holds)
+    body = cdata.body
+    if body.is_expression_type() and body.nargs() > 2:
+        return False
+    repn = generate_standard_repn(body, compute_values=True, quadratic=False)
+    if not repn.is_linear() or len(repn.linear_vars) > 1:
+        return False
+    constant = pe.value(repn.constant)
+    if repn.linear_vars:
+        coef, var = repn.linear_coefs[0], repn.linear_vars[0]
+        bounds = [var.lb, var.ub] if coef > 0 else [var.ub, var.lb]
+        low = None if bounds[0] is None else coef * bounds[0] + constant
+        high = None if bounds[1] is None else coef * bounds[1] + constant
+    else:
+        low = high = constant
+    lower, upper = pe.value(cdata.lower), pe.value(cdata.upper)
+    return (lower is None or (low is not None and low >= lower - tol)) \
+        and (upper is None or (high is not None and high <= upper + tol))
+
+
+def redundant_rows(m, tol=1e-9):
+    """Dictionary constraint name -> active rows on a single variable that its bounds already imply"""
+
+    res = dict()
+    for c in m.component_objects(pe.Constraint, active=True):
+        rows = [cdata for cdata in c.values() if cdata.active and _implied(cdata, tol)]
+        if rows:
+            res[c.local_name] = rows
+    return res
+
+
+def presolve(mod, tol=1e-9, verbose=True):
+    """
+    Removes the dead variables and parameters and deactivates the redundant rows of mod.m
+
+    Inputs to the function:
+    -----------------------
+        * mod: EnergyHubRetrofit instance (create_model called)
+        * tol (default = 1e-9): tolerance of the bound comparison of the redundant rows
+        * verbose (default = True): print a one line summary
+
+    Returns a data frame with one row per pruned or reported component (component, kind, entries, action, reason)
+    """
+
+    m, cls = mod.m, type(mod)
+    report = []
+
+    for name, cdatas in redundant_rows(m, tol).items():
+        component = getattr(m, name)
+        if len(cdatas) == len(component):
+            component.deactivate()
+        else:
+            for cdata in cdatas:
+                cdata.deactivate()
+        report.append([name, "Constraint", len(cdatas), "deactivated", "implied by the variable bounds"])
+
+    _, _, roots = source_graph(cls)
+    referenced = referenced_variables(m)
+    for var in list(m.component_objects(pe.Var)):
+        if var.local_name in roots or any(id(v) in referenced for v in var.values()):
+            continue
+        report.append([var.local_name, "Var", len(var), "removed", "in no active constraint or objective"])
+        m.del_component(var)
+
+    live = live_names(m, cls)
+    for param in list(m.component_objects(pe.Param)):
+        if param.local_name in live:
+            continue
+        report.append([param.local_name, "Param", len(param), "removed", "used by no live component"])
+        m.del_component(param)
+
+    for name, lines in duplicate_declarations(cls).items():
+        report.append([name, "Declaration", len(lines), "reported",
+                       "declared on lines " + ", ".join(str(line) for line in lines) + " of create_model"])
+
+    report = pd.DataFrame(report, columns=REPORT_COLUMNS)
+    if verbose:
+        print("Presolve: " + ", ".join(
+            "{} {} {}".format(group["entries"].sum(), kind, action)
+            for (kind, action), group in report.groupby(["kind", "action"], sort=False)
+        ) if len(report) else "Presolve: nothing to prune")
+    return report
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP service that keeps built energy hub models in memory
+
+Answering "what if gas is 10% cheaper" from scratch pays for loading the
+inputs, create_model and the solve. The service loads the base input
+dictionaries once and keeps the built EnergyHubRetrofit models of the recent
+requests in memory, keyed by a structural hash: the hash of the inputs without
+the price and cost parameters of EnergyHubRetrofit_Paper.MUTABLE_PARAMS. Those
+are built as mutable parameters, so a request that only changes prices and
+costs reuses the built model, updates the parameters and re-solves it, warm
+started from its last solution. Requests that change other inputs build (and
+cache) a new model. The least recently used models are evicted when there are
+more than max_models or the process uses more than max_memory_mb.
+
+Requests (POST /solve, JSON):
+
+    {
+        "base": "default",                      # name of the base input dictionary
+        "overrides": {"Discount_rate": 0.03},   # other inputs (structural change, new model)
+        "updates": [                            # price/cost changes (same model)
+            {"param": "Import_prices", "scale": 0.9, "match": ["NatGas"]},
+            {"param": "Import_prices", "set": [[["Elec", 1], 0.21]]}
+        ],
+        "kpis": true
+    }
+
+The response holds the objective values, the termination condition, the timings,
+whether the model was reused and the KPIs (see KPI_functions.compute_kpis).
+GET /models lists the cached models, GET /health checks the service, POST /evict
+drops a cached model ({"hash": ...}) or all of them ({}). Cost minimization only.
+
+Command line example (the file defines ehr_inp or a dictionary bases of input dictionaries):
+    python Model_service.py my_inputs.py --port 8765 --solver gurobi --max-models 4
+"""
+
+import gc
+import sys
+import json
+import time
+import argparse
+import threading
+import collections
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def current_rss_mb():
+    """Current resident set size of this process in MB (None if it cannot be determined)"""
+
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    try:
+        import os
+
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _key(index):
+    # JSON lists as parameter indices: ["NatGas", 1] -> ("NatGas", 1)
+    return tuple(index) if isinstance(index, list) else index
+
+
+def apply_updates(inp, updates):
+    """
+    Input dictionary with the price/cost updates of a request applied
+
+    Inputs to the function:
+    -----------------------
+        * inp: input dictionary (left unchanged)
+        * updates: list of updates {"param": name, "scale": factor, "match": [first index values]} (match optional)
+          or {"param": name, "set": [[index, value], ...]}
+    """
+
+    import EnergyHubRetrofit_Paper as ehr
+
+    inp = dict(inp)
+    for update in updates or []:
+        name = update["param"]
+        if name not in ehr.MUTABLE_PARAMS:
+            raise ValueError("Parameter " + str(name) + " cannot be updated, choose from " + str(ehr.MUTABLE_PARAMS))
+        values = dict(inp[name])
+        if "scale" in update:
+            match = update.get("match")
+            for k, v in values.items():
+                if match is None or (k[0] if isinstance(k, tuple) else k) in match:
+                    values[k] = v * update["scale"]
+        for index, value in update.get("set", []):
+            values[_key(index)] = value
+        inp[name] = values
+    return inp
+
+
+def structural_hash(inp, model_options=None):
+    """Hash of the inputs that change the structure of the model (all but MUTABLE_PARAMS)"""
+
+    import EnergyHubRetrofit_Paper as ehr
+    import Scenario_runner as sr
+
+    return sr.input_hash({k: v for k, v in inp.items() if k not in ehr.MUTABLE_PARAMS}, model_options)
+
+
+class _Entry:
+    """A cached model: built on first use, solved under its own lock"""
+
+    def __init__(self, base):
+        self.base = base
+        self.lock = threading.Lock()
+        self.mod = None
+        self.build_time = None
+        self.solved = False
+        self.hits = 0
+        self.last_used = time.time()
+
+
+class ModelService:
+    """Cache of built models and the solve logic of the HTTP service"""
+
+    def __init__(self, bases, solver="gurobi", solver_options=None, mip_gap=0.001, time_limit=10 ** 8,
+                 max_models=4, max_memory_mb=None):
+        """
+        Inputs to the function:
+        -----------------------
+            * bases: dictionary name -> base input dictionary (ehr_inp)
+            * solver (default = "gurobi"), solver_options (optional), mip_gap, time_limit: see EnergyHubRetrofit.solve
+            * max_models (default = 4): largest number of built models kept in memory
+            * max_memory_mb (optional): evict least recently used models while the process uses more memory (the last used model is kept)
+        """
+
+        self.bases = bases
+        self.solver = solver
+        self.solver_options = solver_options or {}
+        self.mip_gap = mip_gap
+        self.time_limit = time_limit
+        self.max_models = max_models
+        self.max_memory_mb = max_memory_mb
+        self.models = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _optimizer(self):
+        import pyomo.environ as pe
+        import EnergyHubRetrofit_Paper as ehr
+
+        optimizer = pe.SolverFactory(self.solver)
+        if self.solver in ehr.SOLVER_OPTION_NAMES:
+            gap_option, time_option = ehr.SOLVER_OPTION_NAMES[self.solver]
+            optimizer.options[gap_option] = self.mip_gap
+            optimizer.options[time_option] = self.time_limit
+        for key, value in self.solver_options.items():
+            optimizer.options[key] = value
+        return optimizer
+
+    def _entry(self, base, structure):
+        with self._lock:
+            entry = self.models.get(structure)
+            if entry is None:
+                entry = self.models[structure] = _Entry(base)
+            self.models.move_to_end(structure)
+            entry.last_used = time.time()
+            entry.hits += 1
+            return entry
+
+    def evict(self, structure=None):
+        """Drop a cached model (all models if structure is None), returns the number of dropped models"""
+
+        with self._lock:
+            keys = list(self.models) if structure is None else [k for k in self.models if k == structure]
+            for k in keys:
+                del self.models[k]
+        gc.collect()
+        return len(keys)
+
+    def _evict_lru(self):
+        # Keep the most recently used model whatever its size
+        with self._lock:
+            while len(self.models) > max(self.max_models, 1):
+                self.models.popitem(last=False)
+            if self.max_memory_mb is not None:
+                while len(self.models) > 1 and (current_rss_mb() or 0) > self.max_memory_mb:
+                    self.models.popitem(last=False)
+                    gc.collect()
+
+    def solve(self, request):
+        """Solve one request (see the module documentation), returns the response dictionary"""
+
+        import pyomo.environ as pe
+        import EnergyHubRetrofit_Paper as ehr
+        import Scenario_runner as sr
+
+        base = request.get("base", "default")
+        if base not in self.bases:
+            raise ValueError("Unknown base " + str(base) + ", available: " + ", ".join(self.bases))
+        inp = sr.apply_overrides(self.bases[base], request.get("overrides"))
+        inp = apply_updates(inp, request.get("updates"))
+        model_options = {"invStage": 0, "optim_mode": 1}
+        structure = structural_hash(inp, model_options)
+        entry = self._entry(base, structure)
+
+        response = {"hash": structure, "reused": True, "build_time": 0.0}
+        with entry.lock:
+            if entry.mod is None:
+                start = time.perf_counter()
+                entry.mod = ehr.EnergyHubRetrofit(inp, mutable_params=ehr.MUTABLE_PARAMS, **model_options)
+                entry.mod.create_model()
+                entry.mod.m.Carbon_obj.deactivate()
+                entry.build_time = time.perf_counter() - start
+                response.update(reused=False, build_time=entry.build_time)
+            else:
+                # Reset every mutable parameter to the request values, whatever the previous request changed
+                m = entry.mod.m
+                entry.mod.update_params({
+                    name: {k: inp[name].get(k, 0) for k in getattr(m, name).index_set()} for name in ehr.MUTABLE_PARAMS
+                })
+            response.update(self._solve_entry(entry, pe))
+            if request.get("kpis", True) and response["termination_condition"] in ("optimal", "maxTimeLimit"):
+                import KPI_functions as kpi
+                import Output_functions as of
+
+                table = kpi.compute_kpis(of.get_all_vars(entry.mod.m, expressions=entry.mod.reported_expressions),
+                                         entry.mod.inp)
+                response["kpis"] = json.loads(table.to_json(orient="records"))
+        self._evict_lru()
+        return response
+
+    def _solve_entry(self, entry, pe):
+        optimizer = self._optimizer()
+        kwargs = dict()
+        if entry.solved and hasattr(optimizer, "warm_start_capable") and optimizer.warm_start_capable():
+            # The variables still hold the solution of the previous request
+            kwargs["warmstart"] = True
+        start = time.perf_counter()
+        results = optimizer.solve(entry.mod.m, load_solutions=False, **kwargs)
+        res = {"solve_time": time.perf_counter() - start,
+               "termination_condition": str(results.solver.termination_condition),
+               "warm_start": bool(kwargs)}
+        if len(results.solution) > 0:
+            entry.mod.m.solutions.load_from(results)
+            entry.solved = True
+            res["Total_cost"] = pe.value(entry.mod.m.Total_cost)
+            res["Total_carbon"] = pe.value(entry.mod.m.Total_carbon)
+        return res
+
+    def status(self):
+        """Cached models, least recently used first"""
+
+        with self._lock:
+            return {
+                "models": [
+                    {"hash": k, "base": e.base, "built": e.mod is not None, "build_time": e.build_time,
+                     "hits": e.hits, "last_used": e.last_used}
+                    for k, e in self.models.items()
+                ],
+                "rss_mb": current_rss_mb(),
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def _send(self, code, payload):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _payload(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/models":
+            self._send(200, self.server.service.status())
+        else:
+            self._send(404, {"error": "Unknown path " + self.path})
+
+    def do_POST(self):
+        try:
+            payload = self._payload()
+            if self.path == "/solve":
+                self._send(200, self.server.service.solve(payload))
+            elif self.path == "/evict":
+                self._send(200, {"evicted": self.server.service.evict(payload.get("hash"))})
+            else:
+                self._send(404, {"error": "Unknown path " + self.path})
+        except (ValueError, KeyError, TypeError) as err:
+            self._send(400, {"error": repr(err)})
+        except Exception as err:
+            self._send(500, {"error": repr(err)})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_server(service, host="127.0.0.1", port=8765, background=False, verbose=True):
+    """
+    Serve a ModelService over HTTP (port 0: any free port, see server.server_address)
+
+    With background=True the server runs in a daemon thread and is returned at once (stop it with server.shutdown()).
+    """
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def post(url, payload=None, timeout=None):
+    """Send a JSON request to the service (e.g. post("http://127.0.0.1:8765/solve", request)), returns the response"""
+
+    data = json.dumps(payload or {}, default=str).encode()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return json.loads(res.read())
+    except urllib.error.HTTPError as err:
+        raise RuntimeError(json.loads(err.read()).get("error", str(err))) from None
+
+
+def load_bases(filename):
+    """Base input dictionaries of a Python file: its bases dictionary, or its ehr_inp as the "default" base"""
+
+    import runpy
+
+    namespace = runpy.run_path(filename)
+    if "bases" in namespace:
+        return namespace["bases"]
+    if "ehr_inp" in namespace:
+        return {"default": namespace["ehr_inp"]}
+    raise ValueError("The input file " + str(filename) + " must define ehr_inp or bases")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve EnergyHubRetrofit models over HTTP on this host")
+    parser.add_argument("inputs", help="Python file defining ehr_inp or bases (name -> input dictionary)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--solver", default="gurobi", help="pyomo solver name")
+    parser.add_argument("--threads", type=int, default=None, help="solver threads per solve")
+    parser.add_argument("--mip-gap", type=float, default=0.001)
+    parser.add_argument("--time-limit", type=float, default=10 ** 8)
+    parser.add_argument("--max-models", type=int, default=4, help="built models kept in memory")
+    parser.add_argument("--max-memory", type=float, default=None, help="memory limit in MB for the cached models")
+    args = parser.parse_args(argv)
+
+    import Scenario_runner as sr
+
+    options = dict()
+    if args.threads is not None and args.solver in sr.THREAD_OPTIONS:
+        options[sr.THREAD_OPTIONS[args.solver]] = args.threads
+    service = ModelService(load_bases(args.inputs), args.solver, options, args.mip_gap, args.time_limit,
+                           args.max_models, args.max_memory)
+    server = start_server(service, args.host, args.port)
+    print("Model service listening on http://{}:{}".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
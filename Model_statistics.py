@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Per-component statistics of a built EnergyHubRetrofit model
+
+For every active constraint family (Load_balance, Storage_balance, Pipe_diameter,
+Capacity_constraint, ...) the census reports
+    * rows: constraints built
+    * index_size, skipped, skip_ratio: size of the index set and the share of indices skipped by the rule
+    * nonzeros: linear coefficients plus quadratic terms
+    * columns: distinct variables referenced by the family
+    * quadratic_terms: number of bilinear/quadratic terms
+    * coef_min, coef_max, coef_ratio: range of the absolute non-zero coefficients (numerical conditioning)
+    * rhs_min, rhs_max: range of the absolute non-zero right-hand sides
+and for every variable component the number of columns, integer/binary columns,
+fixed columns and columns that appear in no active constraint.
+
+    stats = model_statistics(mod.m)
+    stats["constraints"].sort_values("nonzeros", ascending=False)
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+from pyomo.repn.standard_repn import generate_standard_repn
+
+CONSTRAINT_COLUMNS = ["component", "rows", "index_size", "skipped", "skip_ratio", "nonzeros", "columns",
+                      "quadratic_terms", "coef_min", "coef_max", "coef_ratio", "rhs_min", "rhs_max"]
+VARIABLE_COLUMNS = ["component", "columns", "integer", "fixed", "unreferenced"]
+
+
+def _abs_range(values):
+    values = np.abs(np.asarray(values, dtype=float))
+    values = values[values > 0]
+    if len(values) == 0:
+        return np.nan, np.nan
+    return float(values.min()), float(values.max())
+
+
+def constraint_statistics(model, referenced=None):
+    """
+    Statistics per active constraint component (one row per component)
+
+    If a set referenced is given, the ids of all variables appearing in the constraints are added to it.
+    """
+
+    rows = []
+    for c in model.component_objects(pe.Constraint, active=True, descend_into=True):
+        coefs, rhs, variables = [], [], set()
+        nonzeros, quadratic, built = 0, 0, 0
+        for cdata in c.values():
+            if not cdata.active:
+                continue
+            built += 1
+            repn = generate_standard_repn(cdata.body, compute_values=True, quadratic=True)
+            nonzeros += len(repn.linear_vars) + len(repn.quadratic_vars)
+            quadratic += len(repn.quadratic_vars)
+            coefs.extend(repn.linear_coefs)
+            coefs.extend(repn.quadratic_coefs)
+            variables.update(id(v) for v in repn.linear_vars)
+            variables.update(id(v) for pair in repn.quadratic_vars for v in pair)
+            constant = pe.value(repn.constant)
+            for bound in (cdata.lower, cdata.upper):
+                if bound is not None:
+                    rhs.append(pe.value(bound) - constant)
+        index_size = len(c.index_set()) if c.is_indexed() else 1
+        coef_min, coef_max = _abs_range(coefs)
+        rhs_min, rhs_max = _abs_range(rhs)
+        rows.append([
+            c.name, built, index_size, index_size - built,
+            (index_size - built) / index_size if index_size else 0.0,
+            nonzeros, len(variables), quadratic, coef_min, coef_max,
+            coef_max / coef_min if coef_min and coef_min > 0 else np.nan, rhs_min, rhs_max,
+        ])
+        if referenced is not None:
+            referenced.update(variables)
+    return pd.DataFrame(rows, columns=CONSTRAINT_COLUMNS)
+
+
+def variable_statistics(model, referenced=None):
+    """Statistics per variable component (one row per component)"""
+
+    rows = []
+    for v in model.component_objects(pe.Var, active=True, descend_into=True):
+        columns = integer = fixed = unreferenced = 0
+        for vdata in v.values():
+            columns += 1
+            integer += vdata.is_integer() or vdata.is_binary()
+            fixed += vdata.fixed
+            if referenced is not None and id(vdata) not in referenced:
+                unreferenced += 1
+        rows.append([v.name, columns, integer, fixed, unreferenced if referenced is not None else np.nan])
+    return pd.DataFrame(rows, columns=VARIABLE_COLUMNS)
+
+
+def model_statistics(model):
+    """
+    Constraint and variable census of a model
+
+    Returns a dictionary with the data frames "constraints" and "variables" and the dictionary "totals"
+    (rows, columns, nonzeros, quadratic terms, integer columns and overall coefficient range).
+    """
+
+    referenced = set()
+    cons = constraint_statistics(model, referenced)
+    # Objective terms count as references as well
+    for obj in model.component_data_objects(pe.Objective, active=True):
+        repn = generate_standard_repn(obj.expr, compute_values=True, quadratic=True)
+        referenced.update(id(v) for v in repn.linear_vars)
+        referenced.update(id(v) for pair in repn.quadratic_vars for v in pair)
+    variables = variable_statistics(model, referenced)
+
+    totals = {
+        "rows": int(cons["rows"].sum()),
+        "skipped": int(cons["skipped"].sum()),
+        "columns": int(variables["columns"].sum()),
+        "referenced_columns": int(variables["columns"].sum() - variables["unreferenced"].sum()),
+        "integer_columns": int(variables["integer"].sum()),
+        "nonzeros": int(cons["nonzeros"].sum()),
+        "quadratic_terms": int(cons["quadratic_terms"].sum()),
+        "coef_min": float(cons["coef_min"].min()),
+        "coef_max": float(cons["coef_max"].max()),
+    }
+    return {"constraints": cons, "variables": variables, "totals": totals}
+
+
+def write_statistics(stats, filename):
+    """Write the result of model_statistics to a JSON file"""
+
+    with open(filename, "w") as file:
+        json.dump({
+            "totals": stats["totals"],
+            "constraints": json.loads(stats["constraints"].to_json(orient="records")),
+            "variables": json.loads(stats["variables"].to_json(orient="records")),
+        }, file, indent=4)
+
+
+def read_statistics(filename):
+    with open(filename) as file:
+        data = json.load(file)
+    return {
+        "totals": data["totals"],
+        "constraints": pd.DataFrame(data["constraints"], columns=CONSTRAINT_COLUMNS),
+        "variables": pd.DataFrame(data["variables"], columns=VARIABLE_COLUMNS),
+    }
+
+
+def compare_statistics(old, new):
+    """
+    Compare two model_statistics results (e.g. before and after a formulation change)
+
+    Returns a data frame with the rows and nonzeros of every constraint family in both models and their difference.
+    """
+
+    keep = ["component", "rows", "nonzeros", "columns"]
+    merged = old["constraints"][keep].merge(
+        new["constraints"][keep], on="component", how="outer", suffixes=("_old", "_new")
+    ).fillna(0)
+    for col in ("rows", "nonzeros", "columns"):
+        merged[col + "_diff"] = merged[col + "_new"] - merged[col + "_old"]
+    return merged.sort_values("nonzeros_diff")
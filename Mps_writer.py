@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel, chunked MPS writer for large energy hub models
+
+The Pyomo problem writers walk every constraint in one process, which for
+year-scale instances takes about as long as the solve. write_mps splits the
+active constraint components into chunks of rows (slices of the large
+components) and hands them to worker processes. Each worker builds the linear
+representation of its rows and writes sorted fragment files (row names,
+right-hand sides, ranges and (column, row, coefficient) entries). The main
+process then merges the fragments into one free-format MPS file in a streaming
+pass: the ROWS, RHS and RANGES fragments are concatenated and the column-major
+COLUMNS section is a k-way merge of the sorted entry fragments. The memory of
+a worker is bounded by its chunk, the merge only holds one line per fragment.
+
+The workers inherit the built model through fork, so several processes are
+only used where fork is available (Linux, macOS); elsewhere the chunks are
+written in this process. Rows and columns are named r<k> and x<k>, the
+returned symbol map gives the model component of every name:
+
+    mod.create_model()
+    symbol_map = write_mps(mod.m, "model.mps", n_workers=8)
+    res = solve_mps(mod, solver="highs", n_workers=8)
+"""
+
+import os
+import time
+import heapq
+import shutil
+import tempfile
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pyomo.environ as pe
+from pyomo.repn.standard_repn import generate_standard_repn
+
+# Model and column numbering of the current write, inherited by the forked workers
+_MODEL = None
+_COLUMNS = None
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def _chunks(m, chunk_rows):
+    # (component name, first row, last row + 1, number of the first row) of every chunk of the active constraints
+    res, offset = [], 0
+    for c in m.component_objects(pe.Constraint, active=True, descend_into=True):
+        n = len(c)
+        for start in range(0, n, chunk_rows):
+            res.append((c.name, start, min(start + chunk_rows, n), offset + start))
+        offset += n
+    return res
+
+
+def _write_chunk(task, folder):
+    # Fragment files of one chunk of rows: names (.rows), right-hand sides (.rhs), ranges (.ranges) and the
+    # entries "column row coefficient" sorted by column and row (.entries)
+    name, start, stop, offset = task
+    component = _MODEL.find_component(name)
+    stem = os.path.join(folder, "{:012d}".format(offset))
+    entries = []
+    n_rows = 0
+    with open(stem + ".rows", "w") as rows, open(stem + ".rhs", "w") as rhs, open(stem + ".ranges", "w") as ranges:
+        for k, cdata in enumerate(itertools.islice(component.values(), start, stop), offset):
+            if not cdata.active:
+                continue
+            repn = generate_standard_repn(cdata.body, quadratic=False)
+            if not repn.is_linear():
+                raise ValueError("Nonlinear row " + cdata.name + " cannot be written to MPS")
+            terms = [(_COLUMNS[id(v)], coef) for v, coef in zip(repn.linear_vars, repn.linear_coefs) if coef != 0]
+            if not terms:
+                continue
+            constant = pe.value(repn.constant)
+            lower, upper = pe.value(cdata.lower), pe.value(cdata.upper)
+            row = "r" + str(k)
+            if cdata.equality or (lower is not None and upper is not None and lower == upper):
+                rows.write(" E  " + row + "\n")
+                bound = upper
+            elif lower is not None and upper is not None:
+                rows.write(" G  " + row + "\n")
+                bound = lower
+                ranges.write("    RNG  " + row + "  " + _number(upper - lower) + "\n")
+            elif lower is not None:
+                rows.write(" G  " + row + "\n")
+                bound = lower
+            else:
+                rows.write(" L  " + row + "\n")
+                bound = upper
+            if bound - constant != 0:
+                rhs.write("    RHS  " + row + "  " + _number(bound - constant) + "\n")
+            entries.extend((column, k, coef) for column, coef in terms)
+            n_rows += 1
+    entries.sort()
+    with open(stem + ".entries", "w") as file:
+        file.writelines("{} {} {}\n".format(column, k, _number(coef)) for column, k, coef in entries)
+    return stem, n_rows, len(entries)
+
+
+def _write_objective(objective, folder):
+    # Entry fragment of the objective (row -1) and the right-hand side of the objective constant
+    repn = generate_standard_repn(objective.expr, quadratic=False)
+    if not repn.is_linear():
+        raise ValueError("Nonlinear objective " + objective.name + " cannot be written to MPS")
+    entries = sorted((_COLUMNS[id(v)], coef) for v, coef in zip(repn.linear_vars, repn.linear_coefs) if coef != 0)
+    stem = os.path.join(folder, "objective")
+    with open(stem + ".entries", "w") as file:
+        file.writelines("{} -1 {}\n".format(column, _number(coef)) for column, coef in entries)
+    return stem, pe.value(repn.constant)
+
+
+def _entry_key(line):
+    column, row, _ = line.split(" ", 2)
+    return int(column), int(row)
+
+
+def _bound_lines(name, var):
+    lb, ub = var.lb, var.ub
+    if lb is not None and ub is not None and lb == ub:
+        return [" FX BND  " + name + "  " + _number(lb)]
+    lines = []
+    if lb is None and ub is None:
+        return [" FR BND  " + name]
+    if lb is None:
+        lines.append(" MI BND  " + name)
+    elif lb != 0:
+        lines.append(" LO BND  " + name + "  " + _number(lb))
+    if ub is not None:
+        lines.append(" UP BND  " + name + "  " + _number(ub))
+    elif var.is_integer():
+        lines.append(" PL BND  " + name)
+    return lines
+
+
+def write_mps(m, filename, n_workers=None, chunk_rows=20000, verbose=False):
+    """
+    Writes the active constraints and the active objective of m to a free-format MPS file with worker processes
+
+    Inputs to the function:
+    -----------------------
+        * m: built pyomo model (one active objective, linear rows)
+        * filename: path of the MPS file
+        * n_workers (optional): number of worker processes (default: number of cores), 0 to write in this process
+        * chunk_rows (default = 20000): largest number of rows of one chunk
+        * verbose (default = False): print the numbers of rows, columns and nonzeros and the write time
+
+    Returns the symbol map: dictionary with "rows" (row name -> ConstraintData, objective row "obj") and
+    "columns" (column name -> VarData)
+    """
+
+    global _MODEL, _COLUMNS
+
+    start = time.perf_counter()
+    objectives = list(m.component_data_objects(pe.Objective, active=True))
+    if len(objectives) != 1:
+        raise ValueError("The model must have exactly one active objective, found " + str(len(objectives)))
+    objective = objectives[0]
+    variables = list(m.component_data_objects(pe.Var, descend_into=True))
+    chunks = _chunks(m, chunk_rows)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        n_workers = 0
+
+    folder = tempfile.mkdtemp(prefix=".mps_", dir=os.path.dirname(os.path.abspath(filename)))
+    _MODEL, _COLUMNS = m, {id(v): k for k, v in enumerate(variables)}
+    try:
+        if n_workers == 0 or len(chunks) <= 1:
+            fragments = [_write_chunk(task, folder) for task in chunks]
+        else:
+            ctx = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(chunks)), mp_context=ctx) as pool:
+                fragments = list(pool.map(_write_chunk, chunks, itertools.repeat(folder)))
+        objective_stem, constant = _write_objective(objective, folder)
+        used = bytearray(len(variables))
+
+        with open(filename, "w") as out:
+            out.write("NAME          " + (m.name or "model").replace(" ", "_") + "\n")
+            if objective.sense == pe.maximize:
+                out.write("OBJSENSE\n    MAX\n")
+            out.write("ROWS\n N  obj\n")
+            for stem, _, _ in fragments:
+                with open(stem + ".rows") as file:
+                    shutil.copyfileobj(file, out)
+
+            out.write("COLUMNS\n")
+            files = [open(stem + ".entries") for stem in [objective_stem] + [f[0] for f in fragments]]
+            try:
+                integer_block = False
+                for line in heapq.merge(*files, key=_entry_key):
+                    column, row, coef = line.split(" ", 2)
+                    k = int(column)
+                    if not used[k]:
+                        used[k] = 1
+                        if variables[k].is_integer() != integer_block:
+                            integer_block = not integer_block
+                            out.write("    MARKER  'MARKER'  '" + ("INTORG" if integer_block else "INTEND") + "'\n")
+                    out.write("    x" + column + "  " + ("obj" if row == "-1" else "r" + row) + "  " + coef)
+                if integer_block:
+                    out.write("    MARKER  'MARKER'  'INTEND'\n")
+            finally:
+                for file in files:
+                    file.close()
+
+            out.write("RHS\n")
+            if constant:
+                out.write("    RHS  obj  " + _number(-constant) + "\n")
+            for stem, _, _ in fragments:
+                with open(stem + ".rhs") as file:
+                    shutil.copyfileobj(file, out)
+            if any(os.path.getsize(stem + ".ranges") for stem, _, _ in fragments):
+                out.write("RANGES\n")
+                for stem, _, _ in fragments:
+                    with open(stem + ".ranges") as file:
+                        shutil.copyfileobj(file, out)
+            out.write("BOUNDS\n")
+            for k, var in enumerate(variables):
+                if used[k]:
+                    lines = _bound_lines("x" + str(k), var)
+                    if lines:
+                        out.write("\n".join(lines) + "\n")
+            out.write("ENDATA\n")
+    finally:
+        _MODEL, _COLUMNS = None, None
+        shutil.rmtree(folder, ignore_errors=True)
+
+    rows = {"obj": objective}
+    for name, first, last, offset in chunks:
+        component = m.find_component(name)
+        rows.update(("r" + str(k), cdata)
+                    for k, cdata in enumerate(itertools.islice(component.values(), first, last), offset))
+    columns = {"x" + str(k): v for k, v in enumerate(variables) if used[k]}
+    if verbose:
+        print("MPS file {}: {} rows, {} columns, {} nonzeros written in {:.2f} s".format(
+            filename, sum(f[1] for f in fragments), len(columns), sum(f[2] for f in fragments),
+            time.perf_counter() - start))
+    return {"rows": rows, "columns": columns}
+
+
+def solve_mps(mod, solver="highs", filename="model.mps", n_workers=None, chunk_rows=20000, mip_gap=0.001,
+              time_limit=10 ** 8, solver_options=None, tee=False, keepfile=False):
+    """
+    Solves the cost minimization problem of mod through a parallel written MPS file and loads the solution into mod.m
+
+    Inputs to the function:
+    -----------------------
+        * mod: EnergyHubRetrofit instance (create_model called)
+        * solver (default = "highs"): "highs" (highspy) or "gurobi" (gurobipy)
+        * filename (default = "model.mps"): path of the MPS file
+        * n_workers, chunk_rows: see write_mps
+        * mip_gap (default = 0.001), time_limit (default = 10 ** 8), solver_options (optional): solver settings
+        * tee (default = False): show the solver output
+        * keepfile (default = False): keep the MPS file after the solve
+
+    Returns a dictionary with the write and solve times, the solver status and the objective value. The variable
+    values are loaded into mod.m, so that Output_functions.get_all_vars(mod.m) reports the solution.
+    """
+
+    import Model_cache as mc
+
+    mod.m.Carbon_obj.deactivate()
+    mod.m.Cost_obj.activate()
+    start = time.perf_counter()
+    symbol_map = write_mps(mod.m, filename, n_workers, chunk_rows)
+    res = {"write_time": time.perf_counter() - start}
+    try:
+        start = time.perf_counter()
+        model = mc.SOLVERS[solver](filename, tee)
+        res["status"], res["objective"] = model.solve(mip_gap, time_limit, solver_options or {})
+        res["solve_time"] = time.perf_counter() - start
+        for name, value in model.values().items():
+            if name in symbol_map["columns"]:
+                symbol_map["columns"][name].set_value(value, skip_validation=True)
+    finally:
+        if not keepfile and os.path.exists(filename):
+            os.remove(filename)
+    return res
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Candidate network topologies for the energy hub model
+
+By default the model connects every ordered pair of locations (combineLocations
+built from all permutations), so the network variables and the balances grow
+with the square of the number of locations. This module builds a sparse graph
+of candidate connections instead and turns it into the network inputs of
+EnergyHubRetrofit:
+    * combineLocations: one arc per direction of every candidate edge
+    * Network_arcs: dictionary arc -> (l_from, l_to)
+    * Distance_area: dictionary arc -> edge length
+
+With Network_arcs in the input, P_exchange, y_net, dm, LC and the network
+constraints only exist on the candidate arcs and the load balance of a location
+only contains its incident arcs.
+
+    edges = knn_edges(ehr_inp["Location_coordinates"], k=3)
+    ehr_inp.update(network_inputs(edges))
+"""
+
+import numpy as np
+
+
+def _coordinates(coordinates):
+    locations = list(coordinates)
+    points = np.array([coordinates[l] for l in locations], dtype=float).reshape(len(locations), -1)
+    return locations, points
+
+
+def _distances(points, i, j):
+    return np.sqrt(np.sum((points[i] - points[j]) ** 2, axis=-1))
+
+
+def _edges(locations, points, pairs, max_distance=None):
+    # Unique undirected edges (l1, l2, distance) of the location index pairs
+    pairs = np.asarray(sorted({(min(i, j), max(i, j)) for i, j in pairs if i != j}), dtype=int).reshape(-1, 2)
+    dist = _distances(points, pairs[:, 0], pairs[:, 1])
+    if max_distance is not None:
+        keep = dist <= max_distance
+        pairs, dist = pairs[keep], dist[keep]
+    return [(locations[i], locations[j], float(d)) for (i, j), d in zip(pairs.tolist(), dist)]
+
+
+def complete_edges(coordinates, max_distance=None):
+    """All pairs of locations (optionally only those closer than max_distance)"""
+
+    locations, points = _coordinates(coordinates)
+    n = len(locations)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    return _edges(locations, points, pairs, max_distance)
+
+
+def knn_edges(coordinates, k=3, max_distance=None):
+    """
+    Symmetric k-nearest-neighbour graph
+
+    Inputs to the function:
+    -----------------------
+        * coordinates: dictionary location -> (x, y) coordinates
+        * k (default = 3): every location is connected to its k nearest locations
+        * max_distance (optional): edges longer than max_distance are dropped
+    """
+
+    locations, points = _coordinates(coordinates)
+    n = len(locations)
+    k = min(k, n - 1)
+    if k <= 0:
+        return []
+    pairs = []
+    # Row blocks keep the distance matrix small for many locations
+    block = max(1, 2 ** 22 // max(n, 1))
+    for start in range(0, n, block):
+        rows = np.arange(start, min(start + block, n))
+        dist = np.sqrt(np.sum((points[rows, None, :] - points[None, :, :]) ** 2, axis=-1))
+        dist[np.arange(len(rows)), rows] = np.inf
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        pairs.extend((i, j) for i, row in zip(rows.tolist(), nearest.tolist()) for j in row)
+    return _edges(locations, points, pairs, max_distance)
+
+
+def delaunay_edges(coordinates, max_distance=None):
+    """Edges of the Delaunay triangulation of the (2D) location coordinates (requires scipy)"""
+
+    try:
+        from scipy.spatial import Delaunay
+    except ImportError as err:
+        raise ImportError("The Delaunay topology requires scipy (pip install scipy)") from err
+
+    locations, points = _coordinates(coordinates)
+    if len(locations) < 4:
+        return complete_edges(coordinates, max_distance)
+    triangulation = Delaunay(points)
+    pairs = [(s[a], s[b]) for s in triangulation.simplices.tolist() for a in range(3) for b in range(a + 1, 3)]
+    return _edges(locations, points, pairs, max_distance)
+
+
+def arc_name(l_from, l_to):
+    return l_from + "_" + l_to
+
+
+def network_inputs(edges):
+    """
+    Network inputs of EnergyHubRetrofit for an edge list
+
+    Inputs to the function:
+    -----------------------
+        * edges: list of undirected candidate edges (l1, l2, distance)
+
+    Returns a dictionary with the combineLocations, Network_arcs and Distance_area inputs (an arc in each direction of every edge).
+    """
+
+    inp = {"combineLocations": [], "Network_arcs": dict(), "Distance_area": dict()}
+    for l1, l2, distance in edges:
+        for a, b in ((l1, l2), (l2, l1)):
+            arc = arc_name(a, b)
+            inp["combineLocations"].append(arc)
+            inp["Network_arcs"][arc] = (a, b)
+            inp["Distance_area"][arc] = distance
+    return inp
+
+
+def apply_topology(inp, method="knn", k=3, max_distance=None, coordinates=None):
+    """
+    Copy of the input dictionary with its network replaced by a candidate topology
+
+    Inputs to the function:
+    -----------------------
+        * inp: the input dictionary (ehr_inp)
+        * method (default = "knn"): "complete", "knn" or "delaunay"
+        * k (default = 3): number of neighbours of the "knn" method
+        * max_distance (optional): edges longer than max_distance are dropped
+        * coordinates (optional): dictionary location -> (x, y), defaults to inp["Location_coordinates"]
+    """
+
+    if coordinates is None:
+        coordinates = inp["Location_coordinates"]
+    coordinates = {l: coordinates[l] for l in inp["Energy_system_location"]}
+    if method == "complete":
+        edges = complete_edges(coordinates, max_distance)
+    elif method == "knn":
+        edges = knn_edges(coordinates, k, max_distance)
+    elif method == "delaunay":
+        edges = delaunay_edges(coordinates, max_distance)
+    else:
+        raise ValueError("Unknown topology method " + str(method) + ", use 'complete', 'knn' or 'delaunay'")
+    res = dict(inp)
+    res.update(network_inputs(edges))
+    return res
+
+
+def incident_arcs(network_arcs, locations):
+    """
+    Incoming and outgoing arcs of every location: two dictionaries location -> list of arcs
+
+    Arc ends outside of locations (e.g. the neighbours of a single-location subproblem) are ignored.
+    """
+
+    incoming = {l: [] for l in locations}
+    outgoing = {l: [] for l in locations}
+    for arc, (l_from, l_to) in network_arcs.items():
+        if l_from in outgoing:
+            outgoing[l_from].append(arc)
+        if l_to in incoming:
+            incoming[l_to].append(arc)
+    return incoming, outgoing
+
+
+def reverse_arcs(network_arcs):
+    """Dictionary arc -> arc in the opposite direction"""
+
+    lookup = {tuple(nodes): arc for arc, nodes in network_arcs.items()}
+    try:
+        return {arc: lookup[(l_to, l_from)] for arc, (l_from, l_to) in network_arcs.items()}
+    except KeyError as err:
+        raise ValueError("Network_arcs must contain both directions of every connection, missing " + str(err))
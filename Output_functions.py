@@ -1,27 +1,232 @@
+import numpy as np
 import pandas as pd
 # from pyomo.opt import SolverResults
 # import pickle as pkl
 import pyomo.environ as pe
 
-def get_all_vars(model_instance):
+# Short index names of the model sets (as given in the set docs), used to
+# label the index columns of the variable data frames
+SET_INDEX_NAMES = {
+    "Calendar_years": "y",
+    "Days": "d",
+    "Time_steps": "t",
+    "Investment_stages": "w",
+    "Energy_system_location": "l",
+    "Energy_carriers": "ec",
+    "Energy_carriers_imp": "eci",
+    "Energy_carriers_exp": "ece",
+    "Energy_carriers_exc": "ecx",
+    "Energy_carriers_dem": "ecd",
+    "Conversion_tech": "conv_tech",
+    "Solar_tech": "sol",
+    "Dispatchable_tech": "disp",
+    "Storage_tech": "stor_tech",
+    "Retrofit_scenarios": "ret",
+    "CombLocations": "arc",
+}
+
+# Index sets of the model variables (see EnergyHubRetrofit.create_model), used to
+# label the index columns of result files read without the model (Results_reader)
+VAR_INDEX_SETS = {
+    "P_conv": ["Conversion_tech", "Energy_system_location", "Investment_stages", "Calendar_years", "Days", "Time_steps"],
+    "P_import": ["Energy_carriers_imp", "Energy_system_location", "Calendar_years", "Days", "Time_steps"],
+    "P_export": ["Energy_carriers_exp", "Energy_system_location", "Calendar_years", "Days", "Time_steps"],
+    "P_exchange": ["Energy_carriers_exc", "CombLocations", "Calendar_years", "Days", "Time_steps"],
+    "Qin": ["Storage_tech", "Energy_system_location", "Investment_stages", "Calendar_years", "Days", "Time_steps"],
+    "Qout": ["Storage_tech", "Energy_system_location", "Investment_stages", "Calendar_years", "Days", "Time_steps"],
+    "SoC": ["Storage_tech", "Energy_system_location", "Investment_stages", "Calendar_years", "Days", "Time_steps"],
+    "Conv_cap": ["Conversion_tech", "Energy_system_location", "Investment_stages"],
+    "Storage_cap": ["Storage_tech", "Energy_system_location", "Investment_stages"],
+    "y_conv": ["Conversion_tech", "Energy_system_location", "Investment_stages"],
+    "y_stor": ["Storage_tech", "Energy_system_location", "Investment_stages"],
+    "dm": ["CombLocations"],
+    "LC": ["CombLocations"],
+    "y_net": ["Energy_carriers_exc", "CombLocations", "Investment_stages"],
+    "y_LC": ["Energy_carriers_exc", "CombLocations", "Investment_stages"],
+    "Arc_cap": ["Energy_carriers_exc", "CombLocations"],
+    "y_retrofit": ["Retrofit_scenarios"],
+    "y_on": ["Dispatchable_tech", "Days", "Time_steps"],
+    "invTech": ["Energy_system_location", "Investment_stages"],
+    "invNet": ["Energy_system_location", "Investment_stages"],
+    "Import_cost": ["Energy_system_location", "Calendar_years"],
+    "Maintenance_cost": ["Energy_system_location", "Calendar_years"],
+    "Export_profit": ["Energy_system_location", "Calendar_years"],
+    "Individual_salvage_value": ["Energy_system_location"],
+}
+
+def var_index_names(name):
+    # Short index names of model variable name (None if unknown)
+    sets = VAR_INDEX_SETS.get(name)
+    if sets is None:
+        return None
+    return [SET_INDEX_NAMES.get(s, s) for s in sets]
+
+def get_index_names(component):
+    # Names of the index columns of an indexed model component
+    if not component.is_indexed():
+        return None
+    names = []
+    for s in component.index_set().subsets():
+        name = SET_INDEX_NAMES.get(s.name, s.name)
+        if s.dimen == 1:
+            names.append(name)
+        else:
+            names.extend(name + "_" + str(k) for k in range(s.dimen))
+    return names
+
+def _is_nonzero(value, tol):
+    return value is not None and abs(value) > tol
+
+def get_all_vars(model_instance, tol=None, expressions=()):
     # List of all variable names in model_instance
+    # If tol is given, only entries with an absolute value above tol are kept (sparse output)
+    # The values of the expression components named in expressions are added like variables
     var_list = [
         i.name for i in list(model_instance.component_objects(pe.Var, active=True))
-    ]
+    ] + list(expressions)
 
     res = dict()
 
     for i in range(len(var_list)):
         v = getattr(model_instance, var_list[i])
-        d = v.extract_values()
-        res[var_list[i]] = pd.DataFrame(d, index=["Value"]).T
+        if v.ctype is pe.Expression:
+            d = {k: pe.value(e, exception=False) for k, e in v.items()}
+        else:
+            d = v.extract_values()
+        if tol is not None:
+            d = {k: val for k, val in d.items() if _is_nonzero(val, tol)}
+        names = get_index_names(v)
+        if names is None:
+            index = pd.Index(list(d.keys()))
+        elif len(names) == 1:
+            index = pd.Index(list(d.keys()), name=names[0])
+        else:
+            index = pd.MultiIndex.from_tuples(list(d.keys()), names=names)
+        res[var_list[i]] = pd.DataFrame({"Value": list(d.values())}, index=index)
 
     return res
 
-def write_all_vars_to_excel(all_vars, filename):
+def drop_small_values(all_vars, tol):
+    # Remove the entries with an absolute value below or equal to tol from all variable data frames
+    return {
+        key: df[df["Value"].abs() > tol] for key, df in all_vars.items()
+    }
+
+def write_all_vars_to_excel(all_vars, filename, tol=None):
+    if tol is not None:
+        all_vars = drop_small_values(all_vars, tol)
     writer = pd.ExcelWriter(filename + ".xlsx", engine="openpyxl")
     for key in all_vars:
         all_vars[key].to_excel(
             writer, sheet_name=key[0 : min(len(key), 31)], merge_cells=False
         )
-    writer.close()
\ No newline at end of file
+    writer.close()
+
+def sparsify_results(results, tol=0.0):
+    # Remove the variables with an absolute value below or equal to tol from a
+    # SolverResults object (after self.m.solutions.store_to(results)), so that
+    # results.write() only stores the non-zero entries
+    for soln in results.solution:
+        small = [k for k, v in soln.variable.items() if not _is_nonzero(v.get("Value"), tol)]
+        for k in small:
+            del soln.variable[k]
+    return results
+
+
+class SparseVar:
+    """
+    Sparse (COO) representation of the values of an indexed variable
+
+    Only the entries with an absolute value above the tolerance are stored, as
+    integer codes into the members of each index set (levels) plus the values.
+    The dense form over the full set product is rebuilt on demand.
+    """
+
+    def __init__(self, name, names, levels, codes, values):
+        self.name = name
+        self.names = names
+        self.levels = levels
+        self.codes = codes
+        self.values = values
+
+    @property
+    def shape(self):
+        return tuple(len(level) for level in self.levels)
+
+    @property
+    def nnz(self):
+        return len(self.values)
+
+    @property
+    def density(self):
+        size = int(np.prod(self.shape)) if self.levels else 1
+        return self.nnz / size if size else 0.0
+
+    def __repr__(self):
+        return "SparseVar({}, shape={}, nnz={})".format(self.name, self.shape, self.nnz)
+
+    @classmethod
+    def from_var(cls, v, tol=0.0):
+        """Build the sparse representation from a pyomo variable component"""
+
+        if not v.is_indexed():
+            value = v.value
+            values = np.array([value] if _is_nonzero(value, tol) else [], dtype=float)
+            return cls(v.name, [], [], np.zeros((len(values), 0), dtype=np.int64), values)
+
+        subsets = list(v.index_set().subsets())
+        dimens = [s.dimen for s in subsets]
+        names = [SET_INDEX_NAMES.get(s.name, s.name) for s in subsets]
+        levels = [list(s) for s in subsets]
+        positions = [{m: k for k, m in enumerate(level)} for level in levels]
+
+        keys, values = [], []
+        for key, value in v.extract_values().items():
+            if _is_nonzero(value, tol):
+                keys.append(key if isinstance(key, tuple) else (key,))
+                values.append(value)
+
+        codes = np.empty((len(keys), len(subsets)), dtype=np.int64)
+        for row, key in enumerate(keys):
+            pos = 0
+            for col, dimen in enumerate(dimens):
+                member = key[pos] if dimen == 1 else key[pos : pos + dimen]
+                codes[row, col] = positions[col][member]
+                pos += dimen
+        return cls(v.name, names, levels, codes, np.array(values, dtype=float))
+
+    def to_dense(self):
+        """Dense NumPy array over the full product of the index sets (zeros for skipped entries)"""
+
+        dense = np.zeros(self.shape)
+        if self.levels:
+            dense[tuple(self.codes.T)] = self.values
+        elif self.nnz:
+            dense[()] = self.values[0]
+        return dense
+
+    def to_frame(self, dense=False):
+        """Data frame in the layout of get_all_vars, with only the stored entries unless dense=True"""
+
+        if not self.levels:
+            return pd.DataFrame({"Value": self.to_dense().reshape(1)}, index=[None])
+        if dense:
+            index = pd.MultiIndex.from_product(self.levels, names=self.names)
+            values = self.to_dense().reshape(-1)
+        else:
+            index = pd.MultiIndex.from_arrays(
+                [np.asarray(level, dtype=object)[self.codes[:, k]] for k, level in enumerate(self.levels)],
+                names=self.names,
+            )
+            values = self.values
+        if len(self.levels) == 1:
+            index = index.get_level_values(0)
+        return pd.DataFrame({"Value": values}, index=index)
+
+
+def get_all_vars_sparse(model_instance, tol=0.0):
+    # Sparse (COO) counterpart of get_all_vars: dictionary of SparseVar objects
+    return {
+        v.name: SparseVar.from_var(v, tol)
+        for v in model_instance.component_objects(pe.Var, active=True)
+    }
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Fast loader for the solver results JSON files written by solve()
+(e.g. cost_min_solver_results0.json)
+
+The bracketed variable keys ("Conv_cap[Bio_Boiler,LocB,1]") are parsed once
+into typed index columns, one data frame per variable, and the parsed form is
+cached next to the JSON file so that later loads skip the parsing altogether.
+The file is read in one pass, streamed with ijson when it is installed, otherwise
+with the standard json module.
+
+    results = load_results("cost_min_solver_results0.json")
+    results.var("P_import").sel(l="LocA", y=3)
+
+Note: zero-valued variables are not written to the JSON files, so they are
+not part of the loaded results either.
+"""
+
+import os
+import re
+import json
+import pickle as pkl
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+import Output_functions as of
+
+# Index names of the model variables (short set names, see Output_functions.VAR_INDEX_SETS)
+VAR_INDEX_NAMES = {name: of.var_index_names(name) for name in of.VAR_INDEX_SETS}
+
+CACHE_SUFFIX = ".parsed.p"
+CACHE_VERSION = 2
+
+_key_pattern = re.compile(r"^([^\[]+)(?:\[(.*)\])?$")
+# Non-standard NaN and Infinity literals written by the JSON results writer (rejected by ijson)
+_non_finite = re.compile(rb"([:\[,\s])(?:-?Infinity|NaN)(?=[\s,\]}])")
+_token_end = re.compile(rb"[-A-Za-z]*$")
+
+
+class _FiniteJSON:
+    # Binary file wrapper that reads the non-finite literals as null
+
+    def __init__(self, file):
+        self.file = file
+        self.rest = b""
+
+    def read(self, size=-1):
+        data = self.rest
+        while True:
+            chunk = self.file.read(size)
+            data = _non_finite.sub(rb"\1null", data + chunk)
+            if not chunk:
+                self.rest = b""
+                return data
+            # A literal cut at the chunk end is completed by the next read (with the byte before it)
+            cut = _token_end.search(data).start() - 1
+            if cut > 0:
+                data, self.rest = data[:cut], data[cut:]
+                return data
+
+
+def _typed_column(values):
+    # Integer column if every entry is an integer literal, else string column
+    try:
+        return np.array([int(v) for v in values], dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array([float(v) for v in values], dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=object)
+
+
+def _stream(filename, header):
+    # Stream (key, value) pairs of all solution variables; the Problem, Solver and Objective
+    # sections are collected into header on the way (one pass over the file). NaN and Infinity
+    # entries are read as None
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is None:
+        with open(filename) as file:
+            data = json.load(file, parse_constant=lambda constant: None)
+        header["Problem"] = data.get("Problem", [])
+        header["Solver"] = data.get("Solver", [])
+        for soln in data.get("Solution", []):
+            for key, entry in soln.get("Objective", {}).items():
+                header["Objective"][key] = float(entry["Value"])
+            for key, entry in soln.get("Variable", {}).items():
+                yield key, float(entry["Value"])
+        return
+
+    builder, section, key = None, None, None
+    with open(filename, "rb") as file:
+        for prefix, event, value in ijson.parse(_FiniteJSON(file), use_float=True):
+            if builder is not None:
+                # Problem and Solver entries (small) are built in full
+                if prefix == section and event in ("end_map", "end_array"):
+                    builder.event(event, value)
+                    header[section[:-5]].append(builder.value)
+                    builder = None
+                else:
+                    builder.event(event, value)
+            elif prefix in ("Problem.item", "Solver.item") and event in ("start_map", "start_array"):
+                builder, section = ijson.ObjectBuilder(), prefix
+                builder.event(event, value)
+            elif event == "map_key" and prefix in ("Solution.item.Variable", "Solution.item.Objective"):
+                key = value
+            elif event == "number" and key is not None and prefix.endswith("." + key + ".Value"):
+                if prefix.startswith("Solution.item.Variable."):
+                    yield key, float(value)
+                elif prefix.startswith("Solution.item.Objective."):
+                    header["Objective"][key] = float(value)
+
+
+def parse_results(filename):
+    """Parse a solver results JSON file into a dictionary of variable data frames and the file header"""
+
+    header = {"Problem": [], "Solver": [], "Objective": {}}
+    keys = defaultdict(list)
+    values = defaultdict(list)
+    for key, value in _stream(filename, header):
+        match = _key_pattern.match(key)
+        name, index = match.group(1), match.group(2)
+        keys[name].append(index)
+        values[name].append(value)
+
+    frames = dict()
+    for name in keys:
+        if keys[name][0] is None:
+            frames[name] = pd.DataFrame({"Value": values[name]})
+            continue
+        split = [k.split(",") for k in keys[name]]
+        ndim = len(split[0])
+        names = VAR_INDEX_NAMES.get(name)
+        if names is None or len(names) != ndim:
+            names = ["i" + str(k) for k in range(ndim)]
+        frame = {n: _typed_column([s[k] for s in split]) for k, n in enumerate(names)}
+        frame["Value"] = np.array(values[name], dtype=np.float64)
+        frames[name] = pd.DataFrame(frame)
+
+    return frames, header
+
+
+class VarResult:
+    """Values of a single variable with one typed column per index"""
+
+    def __init__(self, name, frame):
+        self.name = name
+        self.frame = frame
+        self.dims = [c for c in frame.columns if c != "Value"]
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __repr__(self):
+        return "VarResult({}, dims={}, entries={})".format(self.name, self.dims, len(self))
+
+    def sel(self, **indices):
+        """
+        Select entries by index value, e.g. sel(l="LocA", y=3) or sel(y=[1, 2])
+        """
+
+        mask = np.ones(len(self.frame), dtype=bool)
+        for dim, value in indices.items():
+            if dim not in self.dims:
+                raise KeyError("{} has no index '{}' (indices: {})".format(self.name, dim, self.dims))
+            column = self.frame[dim].to_numpy()
+            if isinstance(value, (list, tuple, set, np.ndarray)):
+                mask &= np.isin(column, list(value))
+            else:
+                mask &= column == value
+        return VarResult(self.name, self.frame[mask].reset_index(drop=True))
+
+    def to_frame(self):
+        """Data frame with the index columns as (multi-)index and a Value column"""
+
+        if not self.dims:
+            return self.frame.copy()
+        return self.frame.set_index(self.dims)
+
+    def to_series(self):
+        return self.to_frame()["Value"]
+
+    def sum(self):
+        return float(self.frame["Value"].sum())
+
+
+class SolverResultsFile:
+    """Parsed solver results JSON file (see load_results)"""
+
+    def __init__(self, filename, frames, header):
+        self.filename = filename
+        self.frames = frames
+        self.problem = header["Problem"]
+        self.solver = header["Solver"]
+        self.objective = header["Objective"]
+        self._vars = dict()
+
+    @property
+    def variables(self):
+        return sorted(self.frames)
+
+    def var(self, name):
+        """Values of variable name as a VarResult object"""
+
+        if name not in self._vars:
+            if name not in self.frames:
+                raise KeyError("Variable {} has no (non-zero) values in {}".format(name, self.filename))
+            self._vars[name] = VarResult(name, self.frames[name])
+        return self._vars[name]
+
+
+def load_results(filename, use_cache=True):
+    """
+    Load a solver results JSON file
+
+    Inputs to the function:
+    -----------------------
+        * filename: path to the JSON file written by results.write(..., format="json")
+        * use_cache (default = True): read/write the parsed form from/to filename + ".parsed.p". The cache is rebuilt whenever the JSON file changes.
+    """
+
+    stat = os.stat(filename)
+    signature = (CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+    cache_file = filename + CACHE_SUFFIX
+
+    if use_cache and os.path.exists(cache_file):
+        with open(cache_file, "rb") as file:
+            cached = pkl.load(file)
+        if cached["signature"] == signature:
+            return SolverResultsFile(filename, cached["frames"], cached["header"])
+
+    frames, header = parse_results(filename)
+
+    if use_cache:
+        with open(cache_file + ".tmp", "wb") as file:
+            pkl.dump({"signature": signature, "frames": frames, "header": header}, file)
+        os.replace(cache_file + ".tmp", cache_file)
+
+    return SolverResultsFile(filename, frames, header)
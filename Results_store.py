@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Partitioned Parquet results store for the energy hub model
+
+Every model variable is stored as its own Parquet dataset under
+<store_folder>/<variable name>/, hive-partitioned by objective point and, where
+the variable is indexed by them, by location (l) and calendar year (y).
+A small JSON manifest (manifest.json) holds the objective values and the
+solver statistics of every stored point. The convergence timeline parsed from
+the solver log of a point (see Solver_log_parser) is stored under
+<store_folder>/solver_log/ and summarised in the manifest.
+
+Requires the optional pyarrow package.
+"""
+
+import os
+import json
+import shutil
+
+
+PARTITION_COLUMNS = ["point", "l", "y"]
+MANIFEST_NAME = "manifest.json"
+CONVERGENCE_NAME = "solver_log"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError as err:
+        raise ImportError(
+            "The Parquet results store requires pyarrow (pip install pyarrow)"
+        ) from err
+    return pyarrow
+
+
+def _to_long_frame(df, point):
+    # Flatten the (multi-)index of a variable data frame into columns
+    if df.index.nlevels == 1 and df.index.name is None:
+        frame = df.reset_index(drop=True)
+    else:
+        frame = df.reset_index()
+    frame.insert(0, "point", point)
+    return frame
+
+
+def solver_stats(results):
+    """Collect the solver status, timings and bounds of a pyomo SolverResults object"""
+
+    stats = dict()
+    solver = results.solver
+    stats["status"] = str(solver.status)
+    stats["termination_condition"] = str(solver.termination_condition)
+    for key in ("time", "wall_time"):
+        value = getattr(solver, key, None)
+        try:
+            stats[key] = float(value)
+        except (TypeError, ValueError):
+            stats[key] = None
+    problem = results.problem
+    for key in ("lower_bound", "upper_bound", "number_of_constraints",
+                "number_of_variables", "number_of_nonzeros"):
+        value = getattr(problem, key, None)
+        try:
+            stats[key] = float(value)
+        except (TypeError, ValueError):
+            stats[key] = None
+    return stats
+
+
+def read_manifest(store_folder):
+    """Read the manifest of a results store (empty manifest if none exists)"""
+
+    path = os.path.join(store_folder, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"points": {}, "variables": [], "index_names": {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(store_folder, manifest):
+    """Atomically replace the manifest of a results store"""
+
+    os.makedirs(store_folder, exist_ok=True)
+    path = os.path.join(store_folder, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=4, sort_keys=True, default=str)
+    os.replace(path + ".tmp", path)
+
+
+def write_run_info(store_folder, info):
+    """
+    Update the run section of the manifest (run settings and completed phases)
+
+    List entries (e.g. "phases") are extended instead of replaced.
+    """
+
+    manifest = read_manifest(store_folder)
+    run = manifest.setdefault("run", {})
+    for key, value in info.items():
+        if isinstance(value, list) and isinstance(run.get(key), list):
+            run[key] = run[key] + [v for v in value if v not in run[key]]
+        else:
+            run[key] = value
+    write_manifest(store_folder, manifest)
+
+
+def completed_points(store_folder):
+    """Objective points that are already stored (used to resume interrupted runs)"""
+
+    return sorted(int(p) for p in read_manifest(store_folder)["points"])
+
+
+def write_point(all_vars, store_folder, point, objectives=None, stats=None, tol=None):
+    """
+    Write the variable values of one objective point to the results store
+
+    Inputs to the function:
+    -----------------------
+        * all_vars: dictionary of variable data frames, as returned by Output_functions.get_all_vars
+        * store_folder: root folder of the results store
+        * point: objective/Pareto point number the values belong to
+        * objectives (optional): dictionary of objective values for the point
+        * stats (optional): dictionary of solver statistics for the point (see solver_stats)
+        * tol (optional): if given, only the entries with an absolute value above tol are stored (sparse output)
+
+    Earlier values of the point are replaced. Variables without stored entries (all values below tol) are listed
+    in the manifest but have no files for the point; read_point returns them as empty data frames.
+    """
+
+    pa = _require_pyarrow()
+    manifest = read_manifest(store_folder)
+
+    if tol is not None:
+        import Output_functions as of
+        all_vars = of.drop_small_values(all_vars, tol)
+
+    for name, df in all_vars.items():
+        frame = _to_long_frame(df, point)
+        manifest["index_names"][name] = [c for c in frame.columns if c not in ("point", "Value")]
+        # Remove the earlier values of the point, also when no entry is written now
+        folder = os.path.join(store_folder, name)
+        shutil.rmtree(os.path.join(folder, "point=" + str(point)), ignore_errors=True)
+        if frame.empty:
+            if os.path.isdir(folder) and not os.listdir(folder):
+                os.rmdir(folder)
+            continue
+        partitions = [c for c in PARTITION_COLUMNS if c in frame.columns]
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pa.dataset.write_dataset(
+            table,
+            folder,
+            format="parquet",
+            partitioning=partitions,
+            partitioning_flavor="hive",
+            basename_template="part-{i}.parquet",
+            existing_data_behavior="delete_matching",
+        )
+
+    manifest["points"][str(point)] = {
+        "objectives": objectives or {},
+        "solver": stats or {},
+    }
+    manifest["variables"] = sorted(set(manifest["variables"]) | set(all_vars))
+    write_manifest(store_folder, manifest)
+
+
+def write_convergence(store_folder, point, timeline, summary=None):
+    """
+    Attach the convergence timeline of one objective point to the results store
+
+    Inputs to the function:
+    -----------------------
+        * store_folder: root folder of the results store
+        * point: objective/Pareto point number (must already be written with write_point)
+        * timeline: data frame returned by Solver_log_parser.parse_log
+        * summary (optional): dictionary returned by Solver_log_parser.summarise
+    """
+
+    pa = _require_pyarrow()
+    manifest = read_manifest(store_folder)
+
+    frame = timeline.copy()
+    frame.insert(0, "point", point)
+    pa.dataset.write_dataset(
+        pa.Table.from_pandas(frame, preserve_index=False),
+        os.path.join(store_folder, CONVERGENCE_NAME),
+        format="parquet",
+        partitioning=["point"],
+        partitioning_flavor="hive",
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+    manifest["points"].setdefault(str(point), {})["convergence"] = summary or {}
+    write_manifest(store_folder, manifest)
+
+
+def read_convergence(store_folder, point=None):
+    """Read the stored convergence timeline of one objective point (all points if point is None)"""
+
+    filters = None if point is None else [("point", "=", point)]
+    df = read_variable(store_folder, CONVERGENCE_NAME, filters=filters)
+    return df.drop(columns="point") if point is not None else df
+
+
+def read_variable(store_folder, name, columns=None, filters=None):
+    """
+    Read (a slice of) a stored variable
+
+    Inputs to the function:
+    -----------------------
+        * store_folder: root folder of the results store
+        * name: variable name, e.g. "P_import"
+        * columns (optional): list of columns to read, e.g. ["point", "l", "Value"]
+        * filters (optional): pyarrow filter expression or list of (column, op, value) tuples, e.g. [("point", "=", 0), ("l", "=", "LocA")]. Partition columns are pruned before any file is opened.
+    """
+
+    pa = _require_pyarrow()
+
+    dataset = pa.dataset.dataset(
+        os.path.join(store_folder, name), format="parquet", partitioning="hive"
+    )
+    if isinstance(filters, list):
+        import pyarrow.parquet as pq
+        filters = pq.filters_to_expression(filters)
+    return dataset.to_table(columns=columns, filter=filters).to_pandas()
+
+
+def read_point(store_folder, point):
+    """
+    Read all stored variables of one objective point as a dictionary of data frames (empty if no entry is stored)
+
+    A KeyError is raised if the point was never written to the store.
+    """
+
+    import pandas as pd
+
+    manifest = read_manifest(store_folder)
+    if str(point) not in manifest["points"]:
+        raise KeyError("Point " + str(point) + " is not stored in " + store_folder
+                       + " (stored points: " + str(sorted(int(p) for p in manifest["points"])) + ")")
+    res = dict()
+    for name in manifest["variables"]:
+        index = manifest["index_names"][name]
+        if os.path.isdir(os.path.join(store_folder, name)):
+            df = read_variable(store_folder, name, filters=[("point", "=", point)]).drop(columns="point")
+        else:
+            df = pd.DataFrame(columns=index + ["Value"])
+        res[name] = df.set_index(index)[["Value"]] if index else df
+    return res
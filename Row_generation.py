@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy row generation for the peak-driven constraints of the energy hub model
+
+Capacity_constraint (capacity >= output of every hour), Pipe_diameter (pipe
+diameter >= every hourly flow) and Arc_capacity (arc capacity >= every hourly
+flow) are only binding in a few peak hours. With lazy_rows=True,
+EnergyHubRetrofit builds their rows for a seed set of peak hours of the demand
+and the solar radiation only. solve_lazy then solves the model, checks the
+missing rows on the solution with NumPy and adds the violated ones, until no
+row is violated. The final solution is feasible (and optimal) for the full
+model:
+
+    mod = ehr.EnergyHubRetrofit(ehr_inp, invStage=0, optim_mode=1, lazy_rows=True)
+    mod.create_model()
+    history = mod.solve_lazy(solver="gurobi")
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+
+
+def seed_hours(inp, n_peaks=2):
+    """
+    Seed hours (y, d, t) of the lazy constraints: the n_peaks largest demand hours of every demand
+    carrier, location and year and the n_peaks largest solar radiation hours of every location and year
+    """
+
+    import Input_functions as inf
+
+    demand = inf.demand_array(inp)
+    years, days, steps = demand.labels[2], demand.labels[3], demand.labels[4]
+    hours = set()
+
+    def add_peaks(values):
+        # values: (..., y, d, t) -> the n_peaks largest (d, t) of every leading index and year
+        flat = np.asarray(values, dtype=float).reshape(-1, len(years), len(days) * len(steps))
+        n = min(n_peaks, flat.shape[2])
+        if n <= 0:
+            return
+        peaks = np.argpartition(-flat, n - 1, axis=2)[:, :, :n]
+        for y_pos, positions in zip(np.tile(np.arange(len(years)), flat.shape[0]), peaks.reshape(-1, n)):
+            for p in positions.tolist():
+                hours.add((years[y_pos], days[p // len(steps)], steps[p % len(steps)]))
+
+    add_peaks(demand.values)
+    if inp.get("P_solar"):
+        solar = inf.LabeledArray.from_dict(
+            inp["P_solar"], ("l", "y", "d", "t"),
+            {"l": list(inp["Energy_system_location"]), "y": years, "d": days, "t": steps},
+        )
+        add_peaks(solar.values)
+    return hours
+
+
+def _var_array(var, sets):
+    # Values of an indexed variable as an array over the given sets (None and not constructed entries -> 0)
+    import itertools
+
+    shape = tuple(len(s) for s in sets)
+    if len(var) == int(np.prod(shape)):
+        return np.fromiter((v.value or 0.0 for v in var.values()), dtype=float, count=len(var)).reshape(shape)
+    values = var.extract_values()
+    return np.fromiter((values.get(k) or 0.0 for k in itertools.product(*sets)), dtype=float,
+                       count=int(np.prod(shape))).reshape(shape)
+
+
+def _param_array(param, sets):
+    import itertools
+
+    shape = tuple(len(s) for s in sets)
+    return np.array([pe.value(param[k]) for k in itertools.product(*sets)], dtype=float).reshape(shape)
+
+
+def _capacity_violations(m, tol, vintages=None):
+    conv = list(m.Conversion_tech)
+    disp = [conv.index(c) for c in m.Dispatchable_tech]
+    carriers, locations, stages = list(m.Energy_carriers), list(m.Energy_system_location), list(m.Investment_stages)
+    years, days, steps = list(m.Calendar_years), list(m.Days), list(m.Time_steps)
+    P = _var_array(m.P_conv, [conv, locations, stages, years, days, steps])[disp]
+    cap = _var_array(m.Conv_cap, [conv, locations, stages])[disp]
+    # Vintage groups (EnergyHubRetrofit.conv_vintages): disp, first stage of the group, stage of the group
+    groups = np.zeros((len(disp), len(stages), len(stages)))
+    for i, c in enumerate(m.Dispatchable_tech):
+        tech_groups = vintages[c] if vintages else {w: [w] for w in stages}
+        for w, members in tech_groups.items():
+            groups[i, stages.index(w), [stages.index(v) for v in members]] = 1.0
+    cap = np.einsum("iwv,ilv->ilw", groups, cap)
+    factor = _param_array(m.Conv_factor, [list(m.Dispatchable_tech), carriers, stages])
+    degradation = _param_array(m.Total_degradation_coefficient, [list(m.Dispatchable_tech), stages, years])
+    # disp, ec, l, w, y, d, t
+    lhs = (P[:, None] * factor[:, :, None, :, None, None, None]
+           * degradation[:, None, None, :, :, None, None])
+    rhs = cap[:, None, :, :, None, None, None]
+    built = (factor > 0) & (groups.sum(axis=2) > 0)[:, None, :]
+    violated = (lhs - rhs > tol * np.maximum(1.0, np.abs(rhs))) & built[:, :, None, :, None, None, None]
+    sets = [list(m.Dispatchable_tech), carriers, locations, stages, years, days, steps]
+    return [tuple(s[i] for s, i in zip(sets, index)) for index in zip(*np.nonzero(violated))]
+
+
+def _pipe_violations(m, tol, vintages=None):
+    # Alpha * P_exchange + Beta * sum_w y_net <= dm, per (ecx, arc, y, d, t)
+    carriers, arcs = list(m.Energy_carriers_exc), list(m.CombLocations)
+    years, days, steps = list(m.Calendar_years), list(m.Days), list(m.Time_steps)
+    P = _var_array(m.P_exchange, [carriers, arcs, years, days, steps])
+    built = _var_array(m.y_net, [carriers, arcs, list(m.Investment_stages)]).sum(axis=2)
+    dm = _var_array(m.dm, [arcs])
+    lhs = pe.value(m.Alpha) * P + pe.value(m.Beta) * built[:, :, None, None, None]
+    rhs = dm[None, :, None, None, None]
+    violated = lhs - rhs > tol * np.maximum(1.0, np.abs(rhs))
+    sets = [carriers, arcs, years, days, steps]
+    return [tuple(s[i] for s, i in zip(sets, index)) for index in zip(*np.nonzero(violated))]
+
+
+def _arc_violations(m, tol, vintages=None):
+    # P_exchange <= Arc_cap, per (ecx, arc, y, d, t)
+    carriers, arcs = list(m.Energy_carriers_exc), list(m.CombLocations)
+    years, days, steps = list(m.Calendar_years), list(m.Days), list(m.Time_steps)
+    P = _var_array(m.P_exchange, [carriers, arcs, years, days, steps])
+    rhs = _var_array(m.Arc_cap, [carriers, arcs])[:, :, None, None, None]
+    violated = P - rhs > tol * np.maximum(1.0, np.abs(rhs))
+    sets = [carriers, arcs, years, days, steps]
+    return [tuple(s[i] for s, i in zip(sets, index)) for index in zip(*np.nonzero(violated))]
+
+
+VIOLATIONS = {
+    "Capacity_constraint": _capacity_violations,
+    "Pipe_diameter": _pipe_violations,
+    "Arc_capacity": _arc_violations,
+}
+
+
+def violated_rows(m, names, tol=1e-6, vintages=None):
+    """
+    Dictionary constraint name -> indices of its rows that are violated by the current solution and not built yet
+    (vintages: EnergyHubRetrofit.conv_vintages of a model built with vintage_aggregation)
+    """
+
+    res = dict()
+    for name in names:
+        component = getattr(m, name)
+        res[name] = [index for index in VIOLATIONS[name](m, tol, vintages) if index not in component]
+    return res
+
+
+def add_rows(m, rules, rows):
+    """Build the given rows of the lazy constraints (rules: EnergyHubRetrofit.lazy_rules), returns the number of added rows"""
+
+    added = 0
+    for name, indices in rows.items():
+        component = getattr(m, name)
+        for index in indices:
+            expr = rules[name](m, *index)
+            if expr is pe.Constraint.Skip:
+                continue
+            component[index] = expr
+            added += 1
+    return added
+
+
+def solve_lazy(mod, solver="gurobi", solver_options=None, max_rounds=50, tol=1e-6, tee=False, verbose=True):
+    """
+    Solve a model built with lazy_rows=True by re-solving with the violated rows added until none is violated
+
+    Inputs to the function:
+    -----------------------
+        * mod: EnergyHubRetrofit instance created with lazy_rows=True (create_model called)
+        * solver (default = "gurobi"), solver_options (optional): pyomo solver name and options
+        * max_rounds (default = 50): largest number of solves
+        * tol (default = 1e-6): relative violation tolerance
+
+    Returns a data frame with the objective, the number of lazy rows, the added rows, the times and the converged
+    flag (no violated row left) of every round. The solution of the last round stays loaded in the model; if rows
+    are still added in round max_rounds, it may violate rows of the full model and a warning is printed.
+    """
+
+    if not mod.lazy_rows:
+        raise ValueError("The model was not created with lazy_rows=True")
+    m = mod.m
+    names = list(mod.lazy_rules)
+    optimizer = pe.SolverFactory(solver)
+    for key, value in (solver_options or {}).items():
+        optimizer.options[key] = value
+    objective = next(m.component_data_objects(pe.Objective, active=True))
+
+    history = []
+    for it in range(1, max_rounds + 1):
+        start = time.perf_counter()
+        results = optimizer.solve(m, tee=tee)
+        solve_time = time.perf_counter() - start
+        condition = results.solver.termination_condition
+        if condition not in (pe.TerminationCondition.optimal, pe.TerminationCondition.maxTimeLimit):
+            raise RuntimeError("Lazy row generation round " + str(it) + " not solved: " + str(condition))
+        start = time.perf_counter()
+        rows = violated_rows(m, names, tol, mod.conv_vintages)
+        added = add_rows(m, mod.lazy_rules, rows)
+        history.append({
+            "round": it,
+            "objective": pe.value(objective),
+            "lazy_rows": sum(len(getattr(m, name)) for name in names),
+            "added_rows": added,
+            "solve_time": solve_time,
+            "check_time": time.perf_counter() - start,
+            "converged": added == 0,
+        })
+        if verbose:
+            print("Lazy rows round {round}: objective {objective:.2f}, {lazy_rows} rows, {added_rows} added".format(
+                **history[-1]))
+        if added == 0:
+            break
+    if not history[-1]["converged"]:
+        print("Warning: lazy row generation stopped after max_rounds = " + str(max_rounds) + " rounds with "
+              + str(history[-1]["added_rows"]) + " rows added in the last round, the solution may violate "
+              "rows of the full model")
+    return pd.DataFrame(history)
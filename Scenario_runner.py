@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Batch runner for scenario variants of the energy hub model
+
+A scenario is a set of overrides of a base input dictionary (ehr_inp), e.g. a
+different discount rate, price trajectories or technology costs:
+
+    scenarios = {
+        "low_discount": {"Discount_rate": 0.03},
+        "high_gas": {"Import_prices": year_series({"NatGas": [0.10] * 20}, years)},
+    }
+    summary = run_scenarios(ehr_inp, scenarios, n_workers=4, threads=2)
+
+Overrides replace the input entry, except for dictionaries, which are merged
+into the dictionary of the base input (only the given keys change). The
+scenarios are solved in a process pool, every job with at most `threads`
+solver threads. The results of every scenario are cached under
+<cache_folder>/<input hash>/ (a Parquet results store, see Results_store),
+where the input hash is a content hash of the effective inputs, the model
+options and the solver settings. Scenarios with the same hash are solved once,
+also across runs.
+
+Command line example (the scenario file defines ehr_inp and scenarios):
+    python Scenario_runner.py my_scenarios.py --workers 4 --threads 2 --out summary.csv
+"""
+
+import os
+import sys
+import json
+import time
+import copy
+import hashlib
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SUMMARY_NAME = "scenario.json"
+INPUTS_NAME = "inputs.pkl"
+# Solver option limiting the number of threads
+THREAD_OPTIONS = {
+    "gurobi": "Threads",
+    "cplex": "threads",
+    "cbc": "threads",
+    "highs": "threads",
+    "appsi_highs": "threads",
+}
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+
+def year_series(trajectories, years):
+    """
+    Yearly input dictionary {(key, year): value} from one list of values per key
+
+    Inputs to the function:
+    -----------------------
+        * trajectories: dictionary key (e.g. energy carrier or technology) -> list of yearly values, e.g. {"Elec": elec_}
+        * years: calendar years (a flat list or grouped per investment stage), matched to the values in order
+    """
+
+    years = sum(years, []) if years and isinstance(years[0], list) else list(years)
+    return {(key, y): v for key, values in trajectories.items() for y, v in zip(years, values)}
+
+
+def scale_values(values, factor, keys=None):
+    """Copy of an input dictionary with its values (or only the entries whose first key is in keys) multiplied by factor"""
+
+    def selected(k):
+        return keys is None or (k[0] if isinstance(k, tuple) else k) in keys
+
+    return {k: v * factor if selected(k) else v for k, v in values.items()}
+
+
+def apply_overrides(base, overrides):
+    """
+    Effective input dictionary of a scenario
+
+    Inputs to the function:
+    -----------------------
+        * base: the base input dictionary (ehr_inp), left unchanged
+        * overrides: dictionary input name -> value; dictionaries are merged into the base entry, other values replace it
+    """
+
+    inp = copy.copy(base)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merged = dict(base[key])
+            merged.update(value)
+            inp[key] = merged
+        else:
+            inp[key] = value
+    return inp
+
+
+def _update_hash(h, obj):
+    # Canonical encoding: dictionaries are hashed in key order, numbers as floats (1 == 1.0 == np.float64(1))
+    import Input_functions as inf
+
+    if isinstance(obj, dict):
+        h.update(b"{")
+        for key in sorted(obj, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, obj[key])
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"(" if isinstance(obj, tuple) else b"[")
+        for item in obj:
+            _update_hash(h, item)
+        h.update(b")")
+    elif isinstance(obj, inf.LabeledArray):
+        h.update(b"LabeledArray")
+        _update_hash(h, list(obj.axes))
+        _update_hash(h, obj.labels)
+        h.update(np.ascontiguousarray(obj.values, dtype=float).tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(b"ndarray" + str(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj, dtype=float).tobytes())
+    elif isinstance(obj, (bool, np.bool_)) or obj is None:
+        h.update(repr(obj if obj is None else bool(obj)).encode())
+    elif isinstance(obj, (int, float, np.integer, np.floating)):
+        h.update(b"n" + repr(float(obj)).encode())
+    else:
+        h.update(b"s" + str(obj).encode())
+    h.update(b";")
+
+
+def input_hash(inp, model_options=None, solver_settings=None):
+    """
+    Content hash of a scenario: effective inputs, model options and solver settings (hex string)
+
+    Inputs to the function:
+    -----------------------
+        * inp: effective input dictionary of the scenario
+        * model_options (optional): dictionary of EnergyHubRetrofit arguments (invStage, optim_mode, ...)
+        * solver_settings (optional): dictionary of solver settings that change the result (solver name, gap, options)
+    """
+
+    h = hashlib.sha256()
+    _update_hash(h, {"inputs": inp, "model": model_options or {}, "solver": solver_settings or {}})
+    return h.hexdigest()
+
+
+def _limit_threads(threads):
+    # Worker process initializer: limit the threads of the numerical libraries
+    if threads is not None:
+        for name in THREAD_VARIABLES:
+            os.environ[name] = str(threads)
+
+
+def _point_rows(manifest):
+    rows = []
+    for point, data in sorted(manifest.get("points", {}).items(), key=lambda item: int(item[0])):
+        row = {"point": int(point)}
+        row.update(data.get("objectives", {}))
+        solver = data.get("solver", {})
+        row["termination_condition"] = solver.get("termination_condition")
+        row["solver_time"] = solver.get("wall_time") or solver.get("time")
+        rows.append(row)
+    return rows
+
+
+def run_scenario(name, inp, job_hash, cache_folder, model_options=None, solver="gurobi", solver_options=None,
+                 mip_gap=0.001, time_limit=10 ** 8, threads=None):
+    """
+    Build and solve one scenario and store its results under cache_folder/job_hash
+
+    The solver output is written to run.log in the scenario folder. Returns the summary dictionary of the
+    scenario (also written to scenario.json once the run succeeded).
+    """
+
+    import pickle as pkl
+    import EnergyHubRetrofit_Paper as ehr
+    import Results_store as rs
+
+    folder = os.path.join(cache_folder, job_hash)
+    os.makedirs(folder, exist_ok=True)
+    options = dict(solver_options or {})
+    if threads is not None and solver in THREAD_OPTIONS:
+        options.setdefault(THREAD_OPTIONS[solver], threads)
+    model_options = dict({"invStage": 0, "optim_mode": 1}, **(model_options or {}))
+
+    summary = {"scenario": name, "hash": job_hash, "folder": folder, "cached": False, "error": None}
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(folder, "run.log"), "w") as log, contextlib.redirect_stdout(log):
+            mod = ehr.EnergyHubRetrofit(inp, **model_options)
+            mod.create_model()
+            summary["build_time"] = time.perf_counter() - start
+            mod.solve(mip_gap=mip_gap, time_limit=time_limit, results_folder=folder + os.sep,
+                      output_format="parquet", solver=solver, solver_options=options,
+                      log_file=os.path.join(folder, "solver.log"))
+    except Exception as err:
+        summary["error"] = repr(err)
+        summary["run_time"] = time.perf_counter() - start
+        return summary
+    summary["run_time"] = time.perf_counter() - start
+    summary["points"] = _point_rows(rs.read_manifest(os.path.join(folder, "results_store")))
+
+    with open(os.path.join(folder, INPUTS_NAME), "wb") as file:
+        pkl.dump(inp, file)
+    path = os.path.join(folder, SUMMARY_NAME)
+    with open(path + ".tmp", "w") as file:
+        json.dump(summary, file, indent=4, default=str)
+    os.replace(path + ".tmp", path)
+    return summary
+
+
+def cached_summary(cache_folder, job_hash):
+    """Summary of a cached scenario run (None if the scenario is not in the cache)"""
+
+    path = os.path.join(cache_folder, job_hash, SUMMARY_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        summary = json.load(file)
+    summary["cached"] = True
+    return summary
+
+
+def _summary_frame(summaries):
+    rows = []
+    for summary in summaries:
+        base = {k: v for k, v in summary.items() if k != "points"}
+        for point in summary.get("points") or [{}]:
+            rows.append(dict(base, **point))
+    return pd.DataFrame(rows)
+
+
+def run_scenarios(base, scenarios, cache_folder="scenario_cache", model_options=None, solver="gurobi",
+                  solver_options=None, mip_gap=0.001, time_limit=10 ** 8, n_workers=None, threads=1):
+    """
+    Solve a batch of scenarios in a process pool, reusing cached results
+
+    Inputs to the function:
+    -----------------------
+        * base: the base input dictionary (ehr_inp)
+        * scenarios: dictionary scenario name -> overrides (see apply_overrides)
+        * cache_folder (default = "scenario_cache"): folder holding the results of every scenario hash
+        * model_options (optional): dictionary of EnergyHubRetrofit arguments (default: invStage=0, optim_mode=1)
+        * solver (default = "gurobi"), solver_options (optional), mip_gap, time_limit: see EnergyHubRetrofit.solve
+        * n_workers (optional): number of worker processes (default: number of cores // threads), 0 to run in this process
+        * threads (default = 1): solver threads per job (None: solver default)
+
+    Returns a data frame with one row per scenario and objective point (objective values,
+    termination condition, timings, cache folder, whether it was cached and the error of failed runs).
+    """
+
+    model_options = dict({"invStage": 0, "optim_mode": 1}, **(model_options or {}))
+    settings = {"solver": solver, "mip_gap": mip_gap, "time_limit": time_limit,
+                "options": {k: v for k, v in (solver_options or {}).items() if k != THREAD_OPTIONS.get(solver)}}
+    jobs, summaries, pending = dict(), dict(), dict()
+    for name, overrides in scenarios.items():
+        inp = apply_overrides(base, overrides)
+        job_hash = input_hash(inp, model_options, settings)
+        jobs[name] = job_hash
+        if job_hash in summaries or job_hash in pending:
+            continue
+        cached = cached_summary(cache_folder, job_hash)
+        if cached is not None:
+            summaries[job_hash] = cached
+        else:
+            pending[job_hash] = (name, inp)
+    print("{} scenarios, {} distinct, {} cached, {} to solve".format(
+        len(jobs), len(set(jobs.values())), len(summaries), len(pending)))
+
+    args = dict(model_options=model_options, solver=solver, solver_options=solver_options,
+                mip_gap=mip_gap, time_limit=time_limit, threads=threads)
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // max(1, threads or 1))
+    if n_workers == 0 or len(pending) <= 1:
+        _limit_threads(threads)
+        for job_hash, (name, inp) in pending.items():
+            summaries[job_hash] = run_scenario(name, inp, job_hash, cache_folder, **args)
+            print("Scenario", name, "finished", summaries[job_hash]["error"] or "")
+    elif pending:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(pending)), mp_context=ctx,
+                                 initializer=_limit_threads, initargs=(threads,)) as pool:
+            futures = {pool.submit(run_scenario, name, inp, job_hash, cache_folder, **args): job_hash
+                       for job_hash, (name, inp) in pending.items()}
+            for future, job_hash in futures.items():
+                summaries[job_hash] = future.result()
+                print("Scenario", pending[job_hash][0], "finished", summaries[job_hash]["error"] or "")
+
+    # Scenarios sharing a hash share the results of the first one
+    return _summary_frame([dict(summaries[job_hash], scenario=name) for name, job_hash in jobs.items()])
+
+
+def scenario_kpis(summary):
+    """KPIs of every solved scenario of a run_scenarios summary (see KPI_functions.compute_kpis), with a scenario column"""
+
+    import pickle as pkl
+    import KPI_functions as kpi
+    import Results_store as rs
+
+    tables = []
+    for row in summary.dropna(subset=["point"]).itertuples():
+        if isinstance(row.error, str):
+            continue
+        with open(os.path.join(row.folder, INPUTS_NAME), "rb") as file:
+            inp = pkl.load(file)
+        all_vars = rs.read_point(os.path.join(row.folder, "results_store"), int(row.point))
+        table = kpi.compute_kpis(all_vars, inp, int(row.point))
+        table.insert(0, "scenario", row.scenario)
+        tables.append(table)
+    if not tables:
+        return pd.DataFrame(columns=["scenario"] + list(kpi.KPI_COLUMNS))
+    return pd.concat(tables, ignore_index=True)
+
+
+def load_scenarios(filename):
+    """Read the base inputs (ehr_inp) and the scenarios (scenarios) defined by a Python scenario file"""
+
+    import runpy
+
+    namespace = runpy.run_path(filename)
+    if "ehr_inp" not in namespace or "scenarios" not in namespace:
+        raise ValueError("The scenario file " + str(filename) + " must define ehr_inp and scenarios")
+    return namespace["ehr_inp"], namespace["scenarios"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve scenario variants of the EnergyHubRetrofit model")
+    parser.add_argument("scenarios", help="Python file defining ehr_inp (base inputs) and scenarios (name -> overrides)")
+    parser.add_argument("--base", default=None, help="pickle file with the base inputs, replaces ehr_inp of the scenario file")
+    parser.add_argument("--cache", default="scenario_cache", help="results cache folder")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (0: run in this process)")
+    parser.add_argument("--threads", type=int, default=1, help="solver threads per job")
+    parser.add_argument("--solver", default="gurobi", help="pyomo solver name")
+    parser.add_argument("--mip-gap", type=float, default=0.001)
+    parser.add_argument("--time-limit", type=float, default=10 ** 8)
+    parser.add_argument("--optim-mode", type=int, default=1, help="1: cost, 2: carbon, 3: multi-objective")
+    parser.add_argument("--pareto-points", type=int, default=5, help="Pareto points of optim mode 3")
+    parser.add_argument("--out", default="scenario_summary.csv", help="summary CSV file")
+    parser.add_argument("--kpis", default=None, help="CSV file for the KPIs of all scenarios")
+    args = parser.parse_args(argv)
+
+    base, scenarios = load_scenarios(args.scenarios)
+    if args.base is not None:
+        import pickle as pkl
+
+        with open(args.base, "rb") as file:
+            base = pkl.load(file)
+    model_options = {"invStage": 0, "optim_mode": args.optim_mode}
+    if args.optim_mode == 3:
+        model_options["num_of_pareto_points"] = args.pareto_points
+    summary = run_scenarios(base, scenarios, args.cache, model_options, args.solver, None,
+                            args.mip_gap, args.time_limit, args.workers, args.threads)
+    summary.to_csv(args.out, index=False)
+    print("Scenario summary saved to", args.out)
+    if args.kpis is not None:
+        scenario_kpis(summary).to_csv(args.kpis, index=False)
+        print("Scenario KPIs saved to", args.kpis)
+    return 1 if summary["error"].notna().any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Convergence timelines from MILP solver logs
+
+Parses the branch-and-bound progress of Gurobi, HiGHS and CBC logs (e.g. the
+gur.log file written by EnergyHubRetrofit.solve) into a timeline data frame
+with the columns
+    * time: solver wall time in seconds
+    * nodes: explored nodes
+    * incumbent: objective value of the best solution found so far
+    * bound: best bound
+    * gap: relative gap |incumbent - bound| / |incumbent|
+    * cuts: cuts added so far (if the solver reports them per line)
+    * event: "node" for progress lines, "incumbent" for new solutions, "final" for the end-of-solve summary
+
+and summarises it (time to first incumbent, time to reach a set of gaps, final
+gap). Timelines of different runs (e.g. before and after a formulation change)
+are compared with compare_timelines:
+
+    timeline = parse_log("gur.log")
+    summary = summarise(timeline)
+    compare_timelines({"old": old_timeline, "new": timeline})
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+TIMELINE_COLUMNS = ["time", "nodes", "incumbent", "bound", "gap", "cuts", "event"]
+GAPS = (0.1, 0.05, 0.01, 0.001)
+
+# Gurobi: "H   12    5                    5000.0000 1234.5678  75.3%  12.3    5s"
+GUROBI_SESSION = re.compile(r"^Gurobi Optimizer version", re.M)
+GUROBI_NODE = re.compile(r"^\s*([H*]?)\s*(\d+)\+?\s+(\d+)\+?\s+(.*\S)\s+(\d+)s\s*$")
+GUROBI_CUTS = re.compile(r"^\s+([A-Za-z][\w\- ]*):\s+(\d+)\s*$")
+GUROBI_EXPLORED = re.compile(r"^Explored (\d+) nodes .* in ([\d.]+) seconds")
+GUROBI_FINAL = re.compile(r"^Best objective\s+(\S+),\s+best bound\s+(\S+),\s+gap\s+(\S+)%")
+# HiGHS: " T      10       2         5  50.00%   1300   2000   35.00%   12   8   3   200   1.2s"
+# The log_file option of HiGHS has no "Running HiGHS" header, the model line starts a solve there
+HIGHS_SESSION = re.compile(r"^(Running HiGHS|(MIP|LP)\s+has \d+ rows)", re.M)
+HIGHS_NODE = re.compile(
+    r"^\s*([A-Za-z]?)\s+(\d+)\s+(\d+)\s+(\d+)\s+[\d.]+%\s+(\S+)\s+(\S+)\s+(\S+)\s+(\d+)\s+\d+\s+\d+\s+\d+\s+([\d.]+)s\s*$"
+)
+# CBC
+CBC_SESSION = re.compile(r"^Welcome to the CBC MILP Solver", re.M)
+CBC_NODE = re.compile(
+    r"^Cbc0010I After (\d+) nodes, \d+ on tree, (\S+) best solution, best possible (\S+) \(([\d.]+) seconds\)"
+)
+CBC_SOLUTION = re.compile(
+    r"^Cbc00(?:04|12)I Integer solution of (\S+) found .*?(\d+) nodes \(([\d.]+) seconds\)"
+)
+CBC_ROOT_CUTS = re.compile(r"^Cbc0013I At root node, (\d+) cuts changed objective from \S+ to (\S+)")
+CBC_FINISHED = re.compile(r"^Cbc0001I Search completed - best objective (\S+), took \d+ iterations and (\d+) nodes \(([\d.]+) seconds\)")
+
+
+def _number(text):
+    # Solver number token ("-", "inf", "1.2e+03", "75.3%") as float, NaN if missing
+    text = text.strip().rstrip("%")
+    if text in ("-", "", "cutoff", "infeasible"):
+        return np.nan
+    try:
+        value = float(text)
+    except ValueError:
+        return np.nan
+    # CBC reports missing solutions as 1e+50
+    return np.nan if abs(value) >= 1e50 else value
+
+
+def _gap(incumbent, bound):
+    if np.isnan(incumbent) or np.isnan(bound):
+        return np.nan
+    if incumbent == 0:
+        return 0.0 if bound == 0 else np.inf
+    return abs(incumbent - bound) / abs(incumbent)
+
+
+def detect_solver(text):
+    """Name of the solver ("gurobi", "highs" or "cbc") that wrote a log, None if unknown"""
+
+    if GUROBI_SESSION.search(text):
+        return "gurobi"
+    if HIGHS_SESSION.search(text) or "HiGHS" in text:
+        return "highs"
+    if CBC_SESSION.search(text) or "Cbc0" in text:
+        return "cbc"
+    return None
+
+
+def _last_session(text, pattern):
+    # Solver logs opened in append mode hold several solves, keep the last one
+    starts = [m.start() for m in pattern.finditer(text)]
+    return text[starts[-1]:] if starts else text
+
+
+def _parse_gurobi(lines):
+    rows, cuts = [], 0
+    in_cuts = False
+    explored = None
+    for line in lines:
+        if line.startswith("Cutting planes:"):
+            in_cuts, cuts = True, 0
+            continue
+        if in_cuts:
+            match = GUROBI_CUTS.match(line)
+            if match:
+                cuts += int(match.group(2))
+                continue
+            in_cuts = False
+        match = GUROBI_EXPLORED.match(line)
+        if match:
+            explored = (float(match.group(2)), int(match.group(1)))
+            continue
+        match = GUROBI_FINAL.match(line)
+        if match and (rows or explored):
+            incumbent, bound = _number(match.group(1)), _number(match.group(2))
+            time, nodes = explored or (rows[-1][0], rows[-1][1])
+            rows.append([time, nodes, incumbent, bound, _gap(incumbent, bound), np.nan, "final"])
+            continue
+        match = GUROBI_NODE.match(line)
+        if match is None:
+            continue
+        tokens = match.group(4).split()
+        if len(tokens) < 4:
+            continue
+        incumbent, bound = _number(tokens[-4]), _number(tokens[-3])
+        event = "incumbent" if match.group(1) else "node"
+        rows.append([float(match.group(5)), int(match.group(2)), incumbent, bound,
+                     _gap(incumbent, bound), np.nan, event])
+    timeline = pd.DataFrame(rows, columns=TIMELINE_COLUMNS)
+    if len(timeline):
+        # Gurobi reports the cuts in a summary block only
+        timeline.loc[timeline.index[-1], "cuts"] = cuts
+    return timeline
+
+
+def _parse_highs(lines):
+    rows = []
+    for line in lines:
+        match = HIGHS_NODE.match(line)
+        if match is None:
+            continue
+        bound, incumbent = _number(match.group(5)), _number(match.group(6))
+        rows.append([float(match.group(9)), int(match.group(2)), incumbent, bound, _gap(incumbent, bound),
+                     float(match.group(8)), "incumbent" if match.group(1) else "node"])
+    return pd.DataFrame(rows, columns=TIMELINE_COLUMNS)
+
+
+def _parse_cbc(lines):
+    rows = []
+    bound, incumbent, cuts = np.nan, np.nan, np.nan
+    for line in lines:
+        match = CBC_ROOT_CUTS.match(line)
+        if match:
+            cuts, bound = float(match.group(1)), _number(match.group(2))
+            continue
+        match = CBC_SOLUTION.match(line)
+        if match:
+            value = _number(match.group(1))
+            incumbent = value if np.isnan(incumbent) else min(incumbent, value)
+            rows.append([float(match.group(3)), int(match.group(2)), incumbent, bound,
+                         _gap(incumbent, bound), cuts, "incumbent"])
+            continue
+        match = CBC_NODE.match(line)
+        if match:
+            incumbent, bound = _number(match.group(2)), _number(match.group(3))
+            rows.append([float(match.group(4)), int(match.group(1)), incumbent, bound,
+                         _gap(incumbent, bound), cuts, "node"])
+            continue
+        match = CBC_FINISHED.match(line)
+        if match:
+            # The search tree is exhausted, the incumbent is optimal
+            incumbent = _number(match.group(1))
+            bound = incumbent
+            rows.append([float(match.group(3)), int(match.group(2)), incumbent, bound,
+                         _gap(incumbent, bound), cuts, "final"])
+    return pd.DataFrame(rows, columns=TIMELINE_COLUMNS)
+
+
+PARSERS = {
+    "gurobi": (GUROBI_SESSION, _parse_gurobi),
+    "highs": (HIGHS_SESSION, _parse_highs),
+    "cbc": (CBC_SESSION, _parse_cbc),
+}
+
+
+def parse_log(log, solver=None, last_session=True):
+    """
+    Parse a solver log into a convergence timeline (pandas DataFrame, see TIMELINE_COLUMNS)
+
+    Inputs to the function:
+    -----------------------
+        * log: path of the log file or the log text
+        * solver (optional): "gurobi", "highs" or "cbc", detected from the log if omitted
+        * last_session (default = True): only parse the last solve if the log holds several
+    """
+
+    if "\n" not in log and os.path.exists(log):
+        with open(log, errors="replace") as file:
+            log = file.read()
+    solver = solver or detect_solver(log)
+    if solver not in PARSERS:
+        raise ValueError("Unknown solver log format, pass solver as one of " + ", ".join(PARSERS))
+    session, parser = PARSERS[solver]
+    if last_session:
+        log = _last_session(log, session)
+    return parser(log.splitlines())
+
+
+def time_to_gap(timeline, gap):
+    """First time at which the relative gap is below or equal to gap (NaN if it is never reached)"""
+
+    reached = timeline["time"][timeline["gap"] <= gap]
+    return float(reached.iloc[0]) if len(reached) else np.nan
+
+
+def summarise(timeline, gaps=GAPS):
+    """Summary of a timeline: final values, time to the first incumbent and time to reach each gap"""
+
+    summary = {
+        "time": float(timeline["time"].max()) if len(timeline) else np.nan,
+        "nodes": int(timeline["nodes"].max()) if len(timeline) else 0,
+        "incumbent": np.nan, "bound": np.nan, "gap": np.nan,
+        "cuts": float(timeline["cuts"].max()) if timeline["cuts"].notna().any() else np.nan,
+        "time_to_first_incumbent": np.nan,
+    }
+    if len(timeline):
+        last = timeline.iloc[-1]
+        summary.update(incumbent=float(last["incumbent"]), bound=float(last["bound"]), gap=float(last["gap"]))
+        found = timeline["time"][timeline["incumbent"].notna()]
+        if len(found):
+            summary["time_to_first_incumbent"] = float(found.iloc[0])
+    for gap in gaps:
+        summary["time_to_gap_" + str(gap)] = time_to_gap(timeline, gap)
+    # NaN is not valid JSON, the summary is stored in the results manifest
+    return {k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in summary.items()}
+
+
+def compare_timelines(timelines, gaps=GAPS):
+    """
+    Compare the convergence of several runs
+
+    Inputs to the function:
+    -----------------------
+        * timelines: dictionary {run name: timeline} (e.g. the same model before and after a formulation change)
+        * gaps: gaps for which the time to reach them is reported
+
+    Returns a data frame with one row per run (final time, nodes, gap and the time to reach every gap).
+    """
+
+    return pd.DataFrame({name: summarise(timeline, gaps) for name, timeline in timelines.items()}).T
+
+
+def plot_timelines(timelines, ax=None):
+    """Plot incumbent and bound over time of several runs (requires matplotlib)"""
+
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        _, ax = plt.subplots()
+    for name, timeline in timelines.items():
+        line, = ax.step(timeline["time"], timeline["incumbent"], where="post", label=str(name) + " incumbent")
+        ax.step(timeline["time"], timeline["bound"], where="post", linestyle="--",
+                color=line.get_color(), label=str(name) + " bound")
+    ax.set_xlabel("Time [s]")
+    ax.set_ylabel("Objective")
+    ax.legend()
+    return ax
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial aggregation of buildings into representative energy hubs
+
+For district studies with many buildings, the buildings (the locations of the
+input dictionary) are clustered by their coordinates and the shape of their
+load profiles, and every cluster is modelled as a single hub:
+
+    assignment = cluster_locations(ehr_inp, n_clusters=8)
+    hub_inp = aggregate_inputs(ehr_inp, assignment)
+    mod = ehr.EnergyHubRetrofit(hub_inp, invStage=0, optim_mode=1)
+    ...
+    building_design = disaggregate_design(all_vars, ehr_inp, assignment)
+
+aggregate_inputs sums the demand, floor area and roof area of the buildings of
+a hub, uses the roof area weighted mean of their solar radiation and builds the
+network between the hub centroids (see Network_topology). Networks inside a hub
+are not modelled. disaggregate_design splits the installed capacities of a hub
+between its buildings in proportion to their peak demand (their roof area for
+solar technologies).
+"""
+
+import numpy as np
+import pandas as pd
+
+HUB_PREFIX = "Hub"
+
+
+def _standardise(block):
+    # Scale a feature block to a total variance of 1
+    block = block - block.mean(axis=0)
+    total = np.sqrt(np.sum(block.var(axis=0)))
+    return block / total if total > 0 else block
+
+
+def _load_shapes(inp):
+    # Demand profile of every location normalised by its mean, per energy carrier: (locations, carriers * days * steps)
+    import Input_functions as inf
+
+    demand = inf.demand_array(inp)
+    values = np.asarray(demand.values).sum(axis=demand.axis("y"))  # ecd, l, d, t
+    values = np.moveaxis(values, 1, 0).reshape(values.shape[1], values.shape[0], -1)
+    mean = values.mean(axis=2, keepdims=True)
+    shapes = np.divide(values, mean, out=np.zeros_like(values), where=mean > 0)
+    return shapes.reshape(shapes.shape[0], -1)
+
+
+def features(inp, shape_weight=1.0, coordinates=None):
+    """
+    Clustering features of every location: standardised coordinates and (weighted) load shapes
+
+    Inputs to the function:
+    -----------------------
+        * inp: the input dictionary (ehr_inp)
+        * shape_weight (default = 1.0): weight of the load shapes relative to the coordinates (0: distance only)
+        * coordinates (optional): dictionary location -> (x, y), defaults to inp["Location_coordinates"]
+    """
+
+    if coordinates is None:
+        coordinates = inp["Location_coordinates"]
+    locations = list(inp["Energy_system_location"])
+    blocks = [_standardise(np.array([coordinates[l] for l in locations], dtype=float))]
+    if shape_weight > 0:
+        blocks.append(shape_weight * _standardise(_load_shapes(inp)))
+    return np.hstack(blocks)
+
+
+def _kmeans_pp(X, k, rng):
+    centres = [X[rng.integers(len(X))]]
+    for _ in range(1, k):
+        dist = np.min(((X[:, None, :] - np.array(centres)[None, :, :]) ** 2).sum(axis=2), axis=1)
+        total = dist.sum()
+        centres.append(X[rng.choice(len(X), p=dist / total)] if total > 0 else X[rng.integers(len(X))])
+    return np.array(centres)
+
+
+def kmeans(X, k, seed=0, n_init=5, max_iter=100):
+    """K-means clustering of the rows of X (k-means++ initialisation, best of n_init runs), returns the labels"""
+
+    rng = np.random.default_rng(seed)
+    best_labels, best_inertia = None, np.inf
+    for _ in range(n_init):
+        centres = _kmeans_pp(X, k, rng)
+        labels = None
+        for _ in range(max_iter):
+            dist = ((X[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2)
+            new_labels = dist.argmin(axis=1)
+            counts = np.bincount(new_labels, minlength=k)
+            # Empty clusters take the point farthest from its centre
+            for c in np.flatnonzero(counts == 0):
+                far = dist[np.arange(len(X)), new_labels].argmax()
+                new_labels[far] = c
+                dist[far, :] = 0
+                counts = np.bincount(new_labels, minlength=k)
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            centres = np.zeros_like(centres)
+            np.add.at(centres, labels, X)
+            centres /= counts[:, None]
+        inertia = ((X - centres[labels]) ** 2).sum()
+        if inertia < best_inertia:
+            best_labels, best_inertia = labels, inertia
+    return best_labels
+
+
+def cluster_locations(inp, n_clusters, shape_weight=1.0, coordinates=None, seed=0):
+    """
+    Assign every location (building) of an input dictionary to a hub
+
+    Inputs to the function:
+    -----------------------
+        * inp: the input dictionary (ehr_inp)
+        * n_clusters: number of hubs
+        * shape_weight, coordinates: see features
+        * seed (default = 0): seed of the k-means initialisation
+
+    Returns a dictionary location -> hub name (Hub1, Hub2, ..., numbered in the order of their first location).
+    """
+
+    locations = list(inp["Energy_system_location"])
+    if n_clusters >= len(locations):
+        labels = np.arange(len(locations))
+    else:
+        labels = kmeans(features(inp, shape_weight, coordinates), n_clusters, seed)
+    _, first = np.unique(labels, return_index=True)
+    order = {labels[i]: k for k, i in enumerate(sorted(first))}
+    return {l: HUB_PREFIX + str(order[c] + 1) for l, c in zip(locations, labels)}
+
+
+def _hubs(assignment, locations):
+    hubs = list(dict.fromkeys(assignment[l] for l in locations))
+    codes = np.array([hubs.index(assignment[l]) for l in locations])
+    return hubs, codes
+
+
+def _per_location(value, locations):
+    return {l: value[l] for l in locations} if isinstance(value, dict) else {l: value for l in locations}
+
+
+def aggregate_inputs(inp, assignment, topology="complete", n_neighbours=3, coordinates=None):
+    """
+    Input dictionary with one location per hub
+
+    Inputs to the function:
+    -----------------------
+        * inp: the input dictionary of the buildings (ehr_inp)
+        * assignment: dictionary location -> hub (see cluster_locations)
+        * topology (default = "complete"): candidate network between the hubs, "complete", "knn" or "delaunay"
+        * n_neighbours (default = 3): number of neighbours of the "knn" topology
+        * coordinates (optional): dictionary location -> (x, y), defaults to inp["Location_coordinates"]
+    """
+
+    import Input_functions as inf
+    import Network_topology as nt
+
+    locations = list(inp["Energy_system_location"])
+    hubs, codes = _hubs(assignment, locations)
+    if coordinates is None:
+        coordinates = inp["Location_coordinates"]
+    res = dict(inp)
+    res["Energy_system_location"] = hubs
+
+    # Demand
+    demand = inf.demand_array(inp)
+    axis = demand.axis("l")
+    values = np.zeros(demand.values.shape[:axis] + (len(hubs),) + demand.values.shape[axis + 1:])
+    np.add.at(np.moveaxis(values, axis, 0), codes, np.moveaxis(np.asarray(demand.values), axis, 0))
+    labels = list(demand.labels)
+    labels[axis] = hubs
+    res["Energy_demand"] = inf.LabeledArray(values, labels, demand.axes)
+
+    # Areas
+    floor = _per_location(inp["Floor_area"], locations)
+    roof = _per_location(inp["Roof_area"], locations)
+    floor_area = np.bincount(codes, weights=[floor[l] for l in locations], minlength=len(hubs))
+    roof_weights = np.array([roof[l] for l in locations], dtype=float)
+    roof_area = np.bincount(codes, weights=roof_weights, minlength=len(hubs))
+    res["Floor_area"] = dict(zip(hubs, floor_area.tolist()))
+    res["Roof_area"] = dict(zip(hubs, roof_area.tolist()))
+
+    # Solar radiation per m2: roof area weighted mean
+    solar = inf.LabeledArray.from_dict(
+        inp["P_solar"], ("l", "y", "d", "t"),
+        {"l": locations, "y": list(inp["Calendar_years"]), "d": list(inp["Days"]), "t": list(inp["Time_steps"])},
+    )
+    weights = np.where(roof_area[codes] > 0, roof_weights / np.where(roof_area[codes] > 0, roof_area[codes], 1), 0)
+    radiation = np.zeros((len(hubs),) + solar.values.shape[1:])
+    np.add.at(radiation, codes, solar.values * weights[:, None, None, None])
+    # Hubs without roof area keep the plain mean of their buildings
+    no_roof = roof_area <= 0
+    if no_roof.any():
+        counts = np.bincount(codes, minlength=len(hubs))
+        plain = np.zeros_like(radiation)
+        np.add.at(plain, codes, solar.values)
+        radiation[no_roof] = plain[no_roof] / counts[no_roof, None, None, None]
+    res["P_solar"] = inf.LabeledArray(radiation, [hubs] + solar.labels[1:], solar.axes).to_dict()
+
+    # Hub centroids (floor area weighted) and the network between them
+    points = np.array([coordinates[l] for l in locations], dtype=float)
+    weighted = np.zeros((len(hubs), points.shape[1]))
+    np.add.at(weighted, codes, points * np.array([floor[l] for l in locations])[:, None])
+    centroids = weighted / np.where(floor_area > 0, floor_area, 1)[:, None]
+    res["Location_coordinates"] = {h: tuple(c) for h, c in zip(hubs, centroids.tolist())}
+    for key in ("combineLocations", "Network_arcs", "Distance_area"):
+        res.pop(key, None)
+    res = nt.apply_topology(res, topology, k=n_neighbours)
+    return res
+
+
+def disaggregate_design(all_vars, inp, assignment, variables=("Conv_cap", "Storage_cap")):
+    """
+    Split the installed capacities of the hubs between their buildings
+
+    Capacities of solar technologies are split in proportion to the roof area of the buildings,
+    all other capacities in proportion to their peak demand (sum over the demand carriers).
+
+    Inputs to the function:
+    -----------------------
+        * all_vars: variable data frames of the hub model (Output_functions.get_all_vars or Results_store.read_point)
+        * inp: the input dictionary of the buildings (ehr_inp)
+        * assignment: dictionary location -> hub (see cluster_locations)
+        * variables (default = ("Conv_cap", "Storage_cap")): capacity variables indexed by location l
+
+    Returns a dictionary of data frames with the same index levels, with the buildings as locations.
+    """
+
+    import Input_functions as inf
+
+    locations = list(inp["Energy_system_location"])
+    demand = inf.demand_array(inp)
+    values = np.moveaxis(np.asarray(demand.values), demand.axis("l"), 0)
+    peak = values.reshape(len(locations), len(demand.labels[0]), -1).sum(axis=1).max(axis=1)
+    roof = _per_location(inp["Roof_area"], locations)
+    building = pd.DataFrame({
+        "l_hub": [assignment[l] for l in locations],
+        "peak": peak,
+        "roof": [float(roof[l]) for l in locations],
+    }, index=pd.Index(locations, name="building"))
+    for key in ("peak", "roof"):
+        total = building.groupby("l_hub")[key].transform("sum")
+        counts = building.groupby("l_hub")[key].transform("size")
+        building[key + "_share"] = np.where(total > 0, building[key] / total.where(total > 0, 1), 1 / counts)
+
+    solar = set(inp.get("Solar_tech", []))
+    res = dict()
+    for name in variables:
+        df = all_vars[name]
+        names = list(df.index.names)
+        frame = df.reset_index().rename(columns={"l": "l_hub"})
+        frame = frame.merge(building.reset_index(), on="l_hub")
+        tech = names[0]
+        share = np.where(frame[tech].isin(solar), frame["roof_share"], frame["peak_share"])
+        frame["Value"] = frame["Value"] * share
+        frame = frame.drop(columns=["l_hub", "peak", "roof", "peak_share", "roof_share"]).rename(
+            columns={"building": "l"})
+        res[name] = frame.set_index(names)[["Value"]]
+    return res